@@ -20,6 +20,7 @@ class Detector:
   def __init__(self, opts):
     self.event_handler = None
     self.opts = opts
+    self.load_opts()
     # state
     self.last_update_time = 0
     self.respite_begin_time = 0
@@ -30,25 +31,77 @@ class Detector:
     self.max_level = 0
     self.state = self.STATE_IDLE
     self.active = False
+    # band mix: list of (band index, weight) or None for rms level
+    self.band_names = []
+    self.mix = None
+
+  def load_opts(self):
+    """take a snapshot of the options. call again if an option changed"""
+    get = self.opts.get_value
+    self.update = get('update') * 100 # in ms
+    self.trace = get('trace')
+    self.alevel = get('alevel')
+    self.slevel = get('slevel')
+    self.attack = get('attack') * 1000 # in ms
+    self.sustain = get('sustain') * 1000 # in ms
+    self.respite = get('respite') * 1000 # in ms
 
   def set_event_handler(self, ev):
     self.event_handler = ev
 
+  def set_bands(self, names):
+    """set the names of the band levels passed to handle_rms()"""
+    self.band_names = names
+    self.mix = None
+
+  def set_mix(self, txt):
+    """set band mix 'name:weight,...' used instead of the rms level.
+       an empty mix uses the rms level. return False if mix is invalid
+    """
+    self.mix = None
+    if txt == "":
+      return True
+    mix = []
+    try:
+      for entry in txt.split(","):
+        if ":" in entry:
+          name, weight = entry.split(":")
+          weight = float(weight)
+        else:
+          name, weight = entry, 1.0
+        mix.append((self.band_names.index(name.strip()), weight))
+    except ValueError:
+      return False
+    self.mix = mix
+    return True
+
+  def get_mix_level(self, level, bands):
+    """return the level to detect on: rms level or mix of bands"""
+    if self.mix is None or bands is None:
+      return level
+    mix_level = 0
+    for idx, weight in self.mix:
+      mix_level += bands[idx] * weight
+    if mix_level < 0:
+      return 0
+    return int(mix_level + 0.5)
+
   def get_state_name(self):
     return self.state_names[self.state]
 
   def is_active(self):
     return self.active
 
-  def handle_rms(self, level):
+  def handle_rms(self, level, bands=None, t=None):
     """check incoming audio buffer and derive loudness state
        pass the state changes to the passed event handler
        the event_handler is called with .begin(), .end(), .update()
+       bands are the band levels used by the band mix
+       t is the time stamp of the level (default: now)
     """
-    t = time.time()
-
-    # options
-    update = self.opts.get_value('update') * 100 # in ms
+    if t is None:
+      t = time.time()
+    level = self.get_mix_level(level, bands)
 
     # determine max current RMS level
     if level > self.cur_level:
@@ -58,7 +111,7 @@ class Detector:
 
     # process levels?
     delta = (t - self.last_update_time) * 1000
-    if delta >= update:
+    if delta >= self.update:
       res = self.process_levels(t, self.max_level, self.cur_level)
       self.last_update_time = t
       # reset current level for next block
@@ -68,11 +121,8 @@ class Detector:
       return (None, None)
 
   def process_levels(self, t, max_level, cur_level):
-    # trace flag
-    trace = self.opts.get_value('trace')
-
     # show level?
-    show_level = trace or self.state != self.STATE_IDLE
+    show_level = self.trace or self.state != self.STATE_IDLE
     if show_level and self.event_handler is not None:
       if self.attack_begin_time is not None:
         duration = t - self.attack_begin_time
@@ -86,27 +136,22 @@ class Detector:
   def state_update(self, t, peak):
     """determine new state of detector"""
 
-    # get parameters
-    alevel = self.opts.get_value('alevel')
-    slevel = self.opts.get_value('slevel')
-
     old_state = self.state
     old_active = self.active
 
     # ----- IDLE -----
     if self.state == self.STATE_IDLE:
       # start attack?
-      if peak >= alevel:
+      if peak >= self.alevel:
         self.attack_begin_time = t
         self.state = self.STATE_ATTACK
 
     # ----- ATTACK -----
     elif self.state == self.STATE_ATTACK:
       # long enough?
-      if peak >= alevel:
-        attack = self.opts.get_value('attack') * 1000 # in ms
+      if peak >= self.alevel:
         delta = (t - self.attack_begin_time) * 1000
-        if delta >= attack:
+        if delta >= self.attack:
           self.state = self.STATE_ACTIVE
           self.active = True
       else:
@@ -116,17 +161,16 @@ class Detector:
     # ----- ACTIVE -----
     elif self.state == self.STATE_ACTIVE:
       # sustain
-      if peak < slevel:
+      if peak < self.slevel:
         self.sustain_begin_time = t
         self.state = self.STATE_SUSTAIN
 
     # ----- SUSTAIN -----
     elif self.state == self.STATE_SUSTAIN:
       # long enough?
-      if peak < slevel:
-        sustain = self.opts.get_value('sustain') * 1000 # in ms
+      if peak < self.slevel:
         delta = (t - self.sustain_begin_time) * 1000
-        if delta >= sustain:
+        if delta >= self.sustain:
           self.state = self.STATE_RESPITE
           self.active = False
           self.respite_begin_time = t
@@ -137,9 +181,8 @@ class Detector:
     # ----- RESPITE -----
     elif self.state == self.STATE_RESPITE:
       # long enough?
-      respite = self.opts.get_value('respite') * 1000 # in ms
       delta = (t - self.respite_begin_time) * 1000
-      if delta >= respite:
+      if delta >= self.respite:
         # return to idle
         self.state = self.STATE_IDLE
         # reset max level
@@ -10,23 +10,23 @@ from __future__ import print_function
 import time
 import threading
 import socket
-try:
-  import queue
-except ImportError:
-  import Queue as queue
 
 from bot import Bot, BotCmd, BotOptField, BotMod
 from bot.event import *
+from bot.wakeup import BotWakeup
 
 import detector
 import recorder
 import simulator
+import ring
 
 
 class DetectorEventHandler:
   def __init__(self, send_event, botopts):
     self.send_event = send_event
     self.botopts = botopts
+    # append send time to level events for load tests
+    self.stamp = False
 
   def state(self, state):
     # write audio_state
@@ -37,7 +37,10 @@ class DetectorEventHandler:
     self.send_event(["active", active])
 
   def level(self, max_level, cur_level, duration):
-    self.send_event(["level", max_level, cur_level, duration])
+    args = ["level", max_level, cur_level, duration]
+    if self.stamp:
+      args.append("%.3f" % time.time())
+    self.send_event(args)
 
 
 class AudioMod(BotMod):
@@ -48,7 +51,9 @@ class AudioMod(BotMod):
       BotCmd("query_state",callee=self.cmd_query_state),
       BotCmd("query_active",callee=self.cmd_query_active),
       BotCmd("query_location",callee=self.cmd_query_location),
-      BotCmd("query_listen_url",callee=self.cmd_query_listen_url)
+      BotCmd("query_listen_url",callee=self.cmd_query_listen_url),
+      BotCmd("query_bands",callee=self.cmd_query_bands),
+      BotCmd("query_history",arg_types=(int,),callee=self.cmd_query_history)
     ]
     listen_url = 'http://%H:8000/pifon'
     location_name = '%h'
@@ -57,17 +62,22 @@ class AudioMod(BotMod):
       BotOptField('trace', bool, False, desc='enable level tracing'),
       BotOptField('listen_url', str, listen_url, desc='url of audio stream'),
       BotOptField('location', str, location_name, desc='location of audio source'),
-      BotOptField('alevel', int, 1, val_range=[1,100], desc='audio level to reach in attack phase [1-100]'),
-      BotOptField('slevel', int, 1, val_range=[1,100], desc='audio level to stay below in sustain phase [1-100]'),
+      BotOptField('alevel', float, 1.0, val_range=[1,100], desc='audio level to reach in attack phase [1-100]'),
+      BotOptField('slevel', float, 1.0, val_range=[1,100], desc='audio level to stay below in sustain phase [1-100]'),
       BotOptField('attack', int, 3, val_range=[1,10], desc='period [1s] of loudness required to start playback'),
       BotOptField('sustain', int, 10, val_range=[0,60], desc='period [1s] of silence required to stop playback'),
       BotOptField('respite', int, 10, val_range=[0,60], desc='delay [1s] after playback to wait for next'),
-      BotOptField('update', int, 5, val_range=[1,60], desc='update interval of current peak level [100ms]')
+      BotOptField('update', int, 5, val_range=[1,60], desc='update interval of current peak level [100ms]'),
+      BotOptField('mix', str, '', desc='detect on band mix name:weight,... instead of rms level'),
+      BotOptField('preroll', int, 0, val_range=[0,60], desc='period [1s] of level history sent when activity begins')
     ]
     self.events = [
       ConnectEvent(self.on_connected),
       DisconnectEvent(self.on_disconnected),
-      TickEvent(self.on_tick)
+      StopEvent(self.on_stop),
+      TickEvent(self.on_tick),
+      WakeupEvent(self.on_wakeup),
+      UpdateFieldEvent(self.on_update_field)
     ]
     self._setup_tags()
 
@@ -76,16 +86,43 @@ class AudioMod(BotMod):
     self._get_vumeter_cfg(cfg)
 
     self.ev = DetectorEventHandler(self.send_event, self.botopts)
+    self.ev.stamp = self.stamp
     self.d = detector.Detector(self.botopts)
-    self.rec = recorder.Recorder(self.sample_rate, self.interval, self.channels,
-                                 self.rec, self.dev, self.tool, self.zero_range, self.sox_filter)
+    if self.rec == 'sim':
+      self.rec = recorder.SimRecorder(self.interval)
+    elif self.engine == 'numpy' and recorder.numpy is not None:
+      self.rec = recorder.NumpyRecorder(self.sample_rate, self.interval, self.channels,
+                                        self.rec, self.dev, self.zero_range, self.sox_filter,
+                                        bands=self.bands, fft_size=self.fft_size)
+    else:
+      if self.engine == 'numpy':
+        self.log("no numpy: using vumeter tool")
+      if self.bands:
+        self.log("bands need numpy engine: ignored")
+      self.rec = recorder.Recorder(self.sample_rate, self.interval, self.channels,
+                                   self.rec, self.dev, self.tool, self.zero_range, self.sox_filter)
     self.sim = simulator.Simulator()
 
+    # band levels
+    self.band_names = getattr(self.rec, 'band_names', [])
+    self.d.set_bands(self.band_names)
+    self._set_mix(self.botopts.get_value('mix'))
+    self._load_opts()
+
     self.log("init audio: cmd=", self.rec.cmd)
     self.log("options=",self.botopts.get_values())
 
     # setup threading
-    self.queue = queue.Queue()
+    size = max(self.history * 1000 // self.interval, 16) + 1
+    self.ring = ring.LevelRing(size, len(self.band_names))
+    # ticks without new level and overruns seen so far
+    self.num_underruns = 0
+    self.num_overruns = 0
+    # event mode: the audio thread wakes the bot instead of a tick
+    if self.wakeup:
+      self.waker = BotWakeup()
+    else:
+      self.waker = None
     self.thread = threading.Thread(target=self.thread_run, name="audiorec")
     self.do_run = True
     self.thread.start()
@@ -100,7 +137,13 @@ class AudioMod(BotMod):
       'debug' : False,
       'zero_range' : 0,
       'sox_filter' : 'highpass 500',
-      'tool' : 'tools/vumeter'
+      'tool' : 'tools/vumeter',
+      'engine' : 'tool',
+      'bands' : '',
+      'fft_size' : 1024,
+      'history' : 60,
+      'wakeup' : True,
+      'stamp' : False
     }
     vu_cfg = cfg.get_section("vumeter", def_cfg)
     self.log("vumeter=",vu_cfg)
@@ -113,6 +156,21 @@ class AudioMod(BotMod):
     self.zero_range = vu_cfg['zero_range']
     self.sox_filter = vu_cfg['sox_filter']
     self.tool = vu_cfg['tool']
+    # rms calculation: 'tool' (vumeter script) or 'numpy' (in process)
+    self.engine = vu_cfg['engine']
+    # frequency bands 'name:lo-hi,...' [Hz] (numpy engine only)
+    try:
+      self.bands = recorder.parse_bands(vu_cfg['bands'])
+    except ValueError:
+      self.log("invalid bands:", vu_cfg['bands'])
+      self.bands = []
+    self.fft_size = vu_cfg['fft_size']
+    # seconds of levels kept for query_history
+    self.history = vu_cfg['history']
+    # wake bot on new levels (True) or poll them every interval (False)
+    self.wakeup = vu_cfg['wakeup']
+    # load tests only: level events carry their send time
+    self.stamp = vu_cfg['stamp']
     self.tick_interval = self.interval / 1000.0
 
   # ----- commands -----
@@ -126,6 +184,14 @@ class AudioMod(BotMod):
   def cmd_query_active(self, sender):
     self.send_event(["active", self.d.is_active()], to=[sender])
 
+  def get_snapshot(self):
+    location = self._replace_tags(self.botopts.get_value('location'))
+    listen_url = self._replace_tags(self.botopts.get_value('listen_url'))
+    return [('state', self.d.get_state_name()),
+            ('active', self.d.is_active()),
+            ('listen_url', listen_url),
+            ('location', location)]
+
   def cmd_query_location(self, sender):
     location = self.botopts.get_value('location')
     location = self._replace_tags(location)
@@ -136,6 +202,35 @@ class AudioMod(BotMod):
     listen_url = self._replace_tags(listen_url)
     self.send_event(["listen_url", listen_url], to=[sender])
 
+  def cmd_query_bands(self, sender):
+    # newest level of the ring: the bot may not have processed it yet
+    args = ["bands"]
+    last = self.ring.get_last()
+    if last is not None and last[2] is not None:
+      for name, level in zip(self.band_names, last[2]):
+        args += [name, level]
+    self.send_event(args, to=[sender])
+
+  def cmd_query_history(self, sender, args):
+    self.send_event(self._get_history(args[0]), to=[sender])
+
+  def _get_history(self, seconds):
+    """return history event of levels in the last seconds:
+       history <interval [ms]> <age of last level [ms]> <level,...>
+    """
+    ts = time.time()
+    entries = self.ring.get_history(ts - seconds)
+    if len(entries) > 0:
+      age = int((ts - entries[-1][0]) * 1000)
+    else:
+      age = 0
+    levels = ",".join([str(e[1]) for e in entries])
+    return ["history", self.interval, age, levels]
+
+  def _set_mix(self, mix):
+    if not self.d.set_mix(mix):
+      self.log("invalid band mix:", mix, "bands:", self.band_names)
+
   def _setup_tags(self):
     host = socket.gethostname()
     pos = host.find('.')
@@ -163,8 +258,15 @@ class AudioMod(BotMod):
   # ----- tick -----
 
   def get_tick_interval(self):
+    if self.waker is not None:
+      return 0
     return self.tick_interval
 
+  def get_wakeup_fd(self):
+    if self.waker is not None:
+      return self.waker.fileno()
+    return None
+
   def on_connected(self):
     self.log("CONNECT")
     self.d.set_event_handler(self.ev)
@@ -176,6 +278,30 @@ class AudioMod(BotMod):
     self.log("DISCONNECT")
     self.d.set_event_handler(None)
 
+  def on_stop(self):
+    # end audio thread before its wakeup pipe is closed
+    self.do_run = False
+    self.rec.stop()
+    self.thread.join(2 * self.interval / 1000.0 + 1)
+    if self.waker is not None:
+      if self.thread.is_alive():
+        self.log("audio thread still running: keep wakeup")
+      else:
+        self.waker.close()
+        self.waker = None
+
+  def on_update_field(self, field):
+    if field.name == 'mix':
+      self._set_mix(field.value)
+    else:
+      self._load_opts()
+
+  def _load_opts(self):
+    """snapshot options used per level: the audio thread reads only these"""
+    self.sim_on = self.botopts.get_value('sim')
+    self.trace = self.botopts.get_value('trace')
+    self.d.load_opts()
+
   def thread_run(self):
     """audio record thread"""
     self.log("starting audio thread")
@@ -186,6 +312,8 @@ class AudioMod(BotMod):
     tick = int(self.tick_interval * 1000) # convert to ms
     max_rec_delta = 0
     min_rec_delta = 10 * self.interval
+    num_jitter = 0
+    num_slow = 0
     first = True
 
     # main loop
@@ -199,14 +327,21 @@ class AudioMod(BotMod):
       # report alive
       alive_delta = ts - last_alive_ts
       if alive_delta > 10:
-        self.log("alive! rec_delta=", [min_rec_delta, max_rec_delta])
+        self.log("alive! rec_delta=", [min_rec_delta, max_rec_delta],
+                 "jitter=", num_jitter, "slow=", num_slow,
+                 "overruns=", self.ring.num_overruns,
+                 "underruns=", self.num_underruns)
         max_rec_delta = 0
         min_rec_delta = 10 * self.interval
+        num_jitter = 0
+        num_slow = 0
         last_alive_ts = ts
 
       # check delta
       if delta > 2 * tick:
-        self.log("slow tick is=",delta,"want=",tick)
+        num_slow += 1
+        if self.debug:
+          self.log("slow tick is=",delta,"want=",tick)
 
       # process audio data
       begin = time.time()
@@ -217,6 +352,7 @@ class AudioMod(BotMod):
         return
       level = rms[1]
       rec_delta = rms[0]
+      bands = rms[2:] or None
       if rec_delta > max_rec_delta:
         max_rec_delta = rec_delta
       if rec_delta < min_rec_delta:
@@ -225,46 +361,77 @@ class AudioMod(BotMod):
       # check recording delta
       jitter = abs(rec_delta - self.interval)
       jit_prc = int(jitter * 100 / self.interval)
-      if jit_prc > 10 or self.debug:
+      if jit_prc > 10:
+        num_jitter += 1
+      if self.debug:
         self.log("jitter=", jitter, jit_prc)
 
       # replace with sim data
-      if self.botopts.get_value('sim'):
+      if self.sim_on:
         level = self.sim.read_rms()
+        bands = None
         tag = "sim"
       else:
         tag = 'rec'
 
       # print values
-      trace = self.botopts.get_value('trace')
-      if self.debug or level > 0 or trace:
-        self.log(tag, level, "delta", delta, "rec_delta", rec_delta, "of", self.interval, "rec_d", rec_d)
+      if self.debug or self.trace:
+        self.log(tag, level, "delta", delta, "rec_delta", rec_delta, "of", self.interval, "rec_d", rec_d,
+                 "bands", bands)
 
-      # finally put result into queue
+      # finally put result into ring
       if first:
         first = False
       else:
-        self.queue.put(level)
+        self.ring.put(end, level, bands)
+        if self.waker is not None and self._need_wakeup(level, bands):
+          self.waker.wake()
+
+  def _need_wakeup(self, level, bands):
+    """called by audio thread: must the detector see the new level now?"""
+    d = self.d
+    if d.state != d.STATE_IDLE or self.trace:
+      return True
+    # idle: only a level reaching the attack level changes something.
+    # the others are handled later in order but before the ring is full
+    if d.get_mix_level(level, bands) >= d.alevel:
+      return True
+    return len(self.ring) >= self.ring.size // 2
 
   def on_tick(self, ts, delta):
     """tick handler of bot"""
-    # check queue size
-    size = self.queue.qsize()
-    if size == 0:
-      self.log("queue empty!")
-      return
-    elif size > 1:
-      self.log("queue size:", size)
-      # drain queue
-      for i in range(size-1):
-        self.queue.get()
-
-    # get next element
-    level = self.queue.get()
-
-    # process rms value
-    up_state, up_active = self.d.handle_rms(level)
-    if up_state is not None:
-      self.log("state", up_state, self.d.state_names[up_state])
-    if up_active is not None:
-      self.log("active", up_active)
+    self._process_levels()
+
+  def on_wakeup(self, ts):
+    """the audio thread has new levels"""
+    self.waker.clear()
+    self._process_levels()
+
+  def _process_levels(self):
+    # process all new levels in order
+    num = 0
+    while True:
+      entry = self.ring.get()
+      if entry is None:
+        break
+      num += 1
+      level_ts, level, bands = entry
+
+      # process rms value
+      up_state, up_active = self.d.handle_rms(level, bands, level_ts)
+      if up_state is not None:
+        self.log("state", up_state, self.d.state_names[up_state])
+      if up_active is not None:
+        self.log("active", up_active)
+        if up_active:
+          self._send_preroll()
+    if num == 0:
+      self.num_underruns += 1
+    if self.ring.num_overruns != self.num_overruns:
+      self.log("levels lost:", self.ring.num_overruns - self.num_overruns)
+      self.num_overruns = self.ring.num_overruns
+
+  def _send_preroll(self):
+    preroll = self.botopts.get_value('preroll')
+    if preroll > 0:
+      self.send_event(self._get_history(preroll))
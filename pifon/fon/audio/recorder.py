@@ -2,6 +2,30 @@ from __future__ import print_function
 import subprocess
 import os
 import sys
+import time
+import math
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+def parse_bands(txt):
+  """parse 'name:lo-hi,...' with frequencies in Hz to [(name, lo, hi)]"""
+  bands = []
+  if txt in ("", "none"):
+    return bands
+  for entry in txt.split(","):
+    name, rng = entry.strip().split(":")
+    lo, hi = rng.split("-")
+    lo = float(lo)
+    hi = float(hi)
+    if name == "" or lo < 0 or hi <= lo:
+      raise ValueError("Invalid band '%s'!" % entry)
+    bands.append((name, lo, hi))
+  return bands
+
 
 class Recorder:
   def __init__(self, rate=48000, interval=250, channels=1, recorder="rec",
@@ -37,6 +61,209 @@ class Recorder:
     self.p.terminate()
 
 
+class NumpyRecorder:
+  """compute the rms levels of the vumeter tool in process
+
+     reads raw S16 PCM from the given source (a file descriptor or file
+     object) or from a started recorder (rec or arecord) and does the
+     work of tools/rms.c with numpy. Levels are the same as with rms.c.
+     read_rms() returns [rec_delta, level] like Recorder.
+
+     if bands [(name, lo, hi)] are given, the spectrum of each block is
+     calculated, too, and read_rms() appends the level of each band
+     scaled like the rms level.
+  """
+  def __init__(self, rate=48000, interval=250, channels=1, recorder="rec",
+               device="mixin", zero_range=0, sox_filter="highpass 500",
+               source=None, scale=100, wait_above=2, bands=None,
+               fft_size=1024):
+    if numpy is None:
+      raise ValueError("numpy engine needs the numpy module!")
+    if rate == 0 or channels == 0:
+      rate, channels = self._detect_hw_params(rate, channels, device)
+    self.interval = interval
+    self.channels = channels
+    self.zero_range = zero_range
+    self.scale = scale
+    self.wait_above = wait_above
+    # rms.c reads block_size samples per interval
+    self.block_size = rate * interval // 1000
+    self.byte_size = self.block_size * 2 * channels
+    max_val = 32768 - zero_range
+    self.norm = float(max_val * max_val)
+    self.band_names = []
+    if bands:
+      self._setup_bands(rate, bands, fft_size)
+    self.p = None
+    if source is None:
+      self.cmd, env = self._get_record_cmd(rate, channels, recorder,
+                                           device, sox_filter)
+      self.p = subprocess.Popen(self.cmd, shell=False, env=env,
+                                stdout=subprocess.PIPE, stderr=sys.stderr)
+      self.fd = self.p.stdout.fileno()
+    else:
+      self.cmd = ["numpy", str(source)]
+      # keep file object open
+      self.source = source
+      if hasattr(source, "fileno"):
+        self.fd = source.fileno()
+      else:
+        self.fd = source
+    self.last_ts = time.time()
+    # stats of last block
+    self.min = 0
+    self.max = 0
+    self.num_zero = 0
+
+  def _detect_hw_params(self, rate, channels, device):
+    """auto detect rate and channels given as 0 like tools/vumeter"""
+    if not sys.platform.startswith("linux"):
+      return rate or 44100, channels or 2
+    cmd = ["arecord", "--dump-hw-params", "-D", device]
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    out = p.communicate()[0].decode("utf-8", "replace")
+    for line in out.splitlines():
+      if line.startswith("RATE:") and rate == 0:
+        rate = int(line[5:].strip())
+      elif line.startswith("CHANNELS:") and channels == 0:
+        channels = int(line[9:].strip())
+    if rate == 0 or channels == 0:
+      raise ValueError("Can't detect rate/channels of device '%s'!" % device)
+    return rate, channels
+
+  def _setup_bands(self, rate, bands, fft_size):
+    """prepare window and the matrix summing fft bins to band powers"""
+    # the fft frames must fit into the block of the first channel
+    while fft_size > self.block_size:
+      fft_size //= 2
+    self.fft_size = fft_size
+    self.num_frames = self.block_size // fft_size
+    self.window = numpy.hanning(fft_size)
+    freqs = numpy.fft.rfftfreq(fft_size, 1.0 / rate)
+    # one sided power spectrum: all bins but DC and Nyquist count twice.
+    # normalize so the sum over all bins is the mean square of the samples
+    weight = numpy.full(len(freqs), 2.0)
+    weight[0] = 1.0
+    if fft_size % 2 == 0:
+      weight[-1] = 1.0
+    weight /= fft_size * numpy.dot(self.window, self.window)
+    self.band_matrix = numpy.zeros((len(bands), len(freqs)))
+    for i, (name, lo, hi) in enumerate(bands):
+      mask = (freqs >= lo) & (freqs < hi)
+      self.band_matrix[i, mask] = weight[mask]
+      self.band_names.append(name)
+    self.band_norm = 32768.0 * 32768.0
+
+  def _get_record_cmd(self, rate, channels, recorder, device, sox_filter):
+    """return the raw record command of tools/vumeter and its env"""
+    env = None
+    if recorder == "arecord":
+      cmd = ["arecord", "-q", "-D", device, "-f", "S16_LE",
+             "-c", str(channels), "-r", str(rate)]
+    elif recorder == "rec":
+      cmd = ["rec", "-q", "-b", "16", "-t", "raw", "-c", str(channels),
+             "-r", str(rate), "-"]
+      if sox_filter not in ("", "none"):
+        cmd += sox_filter.split()
+      if sys.platform.startswith("linux"):
+        env = dict(os.environ)
+        env["AUDIODRIVER"] = "alsa"
+        env["AUDIODEV"] = device
+    else:
+      raise ValueError("Unknown recorder '%s'!" % recorder)
+    return cmd, env
+
+  def _read_block(self):
+    """read a full block or return None on end of stream"""
+    chunks = []
+    rem = self.byte_size
+    while rem > 0:
+      data = os.read(self.fd, rem)
+      if len(data) == 0:
+        return None
+      chunks.append(data)
+      rem -= len(data)
+    return b"".join(chunks)
+
+  def calc_level(self, data):
+    """return the rms level of a block of S16 samples scaled to [0;scale]"""
+    # like rms.c: take every channels-th of the first block_size samples
+    # and divide by block_size
+    samples = numpy.frombuffer(data, dtype="<i2")
+    d = samples[0:self.block_size:self.channels].astype(numpy.float64)
+    self.min = int(d.min())
+    self.max = int(d.max())
+    zr = self.zero_range
+    if zr > 0:
+      # clip [-zr;zr] to zero and move the other values towards zero
+      d = numpy.abs(d) - zr
+      self.num_zero = int(numpy.count_nonzero(d <= 0))
+      d = numpy.maximum(d, 0)
+    # float64 sum is exact for 16 bit squares of a block
+    total = int(numpy.dot(d, d)) // self.block_size
+    return int(math.sqrt(total / self.norm) * self.scale)
+
+  def calc_bands(self, data):
+    """return the levels of the bands of a block scaled to [0;scale]"""
+    samples = numpy.frombuffer(data, dtype="<i2")[0::self.channels]
+    # all frames of the block in one batched fft
+    n = self.num_frames * self.fft_size
+    frames = samples[0:n].reshape(self.num_frames, self.fft_size)
+    spec = numpy.fft.rfft(frames * self.window, axis=1)
+    power = (spec.real ** 2 + spec.imag ** 2).mean(axis=0)
+    band_power = self.band_matrix.dot(power)
+    levels = numpy.sqrt(band_power / self.band_norm) * self.scale
+    return [int(l) for l in levels]
+
+  def read_rms(self):
+    """read the next rms value"""
+    data = self._read_block()
+    if data is None:
+      return None
+    level = self.calc_level(data)
+    if self.band_names:
+      band_levels = self.calc_bands(data)
+    # pace like rms.c if data arrives faster than the interval
+    ts = time.time()
+    delta = int((ts - self.last_ts) * 1000 + 0.5)
+    if delta < self.interval:
+      wait_ms = self.interval - delta
+      if self.wait_above >= 0 and wait_ms >= self.wait_above:
+        time.sleep(wait_ms / 1000.0)
+        ts = time.time()
+        delta = int((ts - self.last_ts) * 1000 + 0.5)
+    self.last_ts = ts
+    if self.band_names:
+      return [delta, level] + band_levels
+    return [delta, level]
+
+  def stop(self):
+    if self.p is not None:
+      self.p.terminate()
+
+
+class SimRecorder:
+  """stand-in for the vumeter tool without audio hardware.
+     delivers silence paced by the interval"""
+  def __init__(self, interval=250):
+    self.interval = interval
+    self.cmd = ["sim", str(interval)]
+    self.next_ts = None
+
+  def read_rms(self):
+    ts = time.time()
+    if self.next_ts is None:
+      self.next_ts = ts
+    self.next_ts += self.interval / 1000.0
+    delay = self.next_ts - ts
+    if delay > 0:
+      time.sleep(delay)
+    return [self.interval, 0]
+
+  def stop(self):
+    pass
+
+
 # test
 if __name__ == '__main__':
   r = Recorder()
@@ -0,0 +1,165 @@
+#
+# ring buffer of timestamped audio levels
+#
+# the audio thread puts every level with its time stamp. the bot tick
+# gets all levels not consumed yet in order. the last entries stay in the
+# ring and give the recent level history.
+#
+# there is exactly one writer (audio thread) and one reader (bot thread),
+# so no lock is needed: the writer fills the slot first and then moves
+# head, the reader only moves tail. Both indices only grow and each is
+# written by one thread only. A reader checks after copying a slot that
+# the writer did not reach it meanwhile.
+#
+
+from __future__ import print_function
+
+import array
+
+
+class LevelRing:
+  """fixed size ring of (ts, level, bands) with a single writer and reader
+
+     the writer never blocks: if the reader is too slow the oldest
+     unread entries are overwritten and counted in num_overruns.
+  """
+  def __init__(self, size, num_bands=0):
+    self.size = size
+    self.num_bands = num_bands
+    self.ts = array.array('d', [0.0] * size)
+    self.levels = array.array('i', [0] * size)
+    self.bands = array.array('i', [0] * (size * num_bands))
+    # slot holds bands of its entry
+    self.has_bands = array.array('b', [0] * size)
+    # total number of entries written and read
+    self.head = 0
+    self.tail = 0
+    self.num_overruns = 0
+
+  def __len__(self):
+    """number of unread entries"""
+    return min(self.head - self.tail, self.size - 1)
+
+  def put(self, ts, level, bands=None):
+    """add entry. only called by the writer"""
+    head = self.head
+    pos = head % self.size
+    self.ts[pos] = ts
+    self.levels[pos] = level
+    if bands is not None and self.num_bands > 0:
+      off = pos * self.num_bands
+      self.bands[off:off + self.num_bands] = array.array('i', bands)
+      self.has_bands[pos] = 1
+    else:
+      self.has_bands[pos] = 0
+    # publish slot
+    self.head = head + 1
+
+  def _valid(self, idx):
+    """is entry idx still in the ring and not being overwritten?"""
+    return self.head - idx < self.size
+
+  def get(self):
+    """return next unread (ts, level, bands) or None. only called by reader"""
+    while True:
+      tail = self.tail
+      head = self.head
+      if tail == head:
+        return None
+      # overrun: skip to the oldest entry safe to read
+      if not self._valid(tail):
+        skip = head - self.size + 1
+        self.num_overruns += skip - tail
+        tail = skip
+      pos = tail % self.size
+      ts = self.ts[pos]
+      level = self.levels[pos]
+      bands = None
+      if self.has_bands[pos]:
+        off = pos * self.num_bands
+        bands = self.bands[off:off + self.num_bands].tolist()
+      if self._valid(tail):
+        self.tail = tail + 1
+        return ts, level, bands
+      # writer overtook us while copying: retry
+      self.tail = tail
+
+  def get_last(self):
+    """return the newest (ts, level, bands) read or not, or None.
+       only called by the reader
+    """
+    while True:
+      head = self.head
+      if head == 0:
+        return None
+      pos = (head - 1) % self.size
+      ts = self.ts[pos]
+      level = self.levels[pos]
+      bands = None
+      if self.has_bands[pos]:
+        off = pos * self.num_bands
+        bands = self.bands[off:off + self.num_bands].tolist()
+      if self._valid(head - 1):
+        return ts, level, bands
+
+  def get_history(self, since_ts):
+    """return (ts, level) of the entries at or after since_ts, oldest first.
+       only called by the reader
+    """
+    head = self.head
+    first = max(head - self.size + 1, 0)
+    pos = head
+    while pos > first and self.ts[(pos - 1) % self.size] >= since_ts:
+      pos -= 1
+    result = [(self.ts[i % self.size], self.levels[i % self.size])
+              for i in range(pos, head)]
+    # drop entries overwritten while copying
+    skip = self.head - self.size + 1 - pos
+    if skip > 0:
+      result = result[skip:]
+    return result
+
+
+# ----- test -----
+if __name__ == '__main__':
+  import threading
+  r = LevelRing(4, 2)
+  for i in range(6):
+    r.put(float(i), i * 10, [i, -i])
+  print(len(r), r.get(), r.num_overruns)
+  print(r.get_history(3.0))
+  while True:
+    e = r.get()
+    if e is None:
+      break
+    print(e)
+
+  # writer thread against reader: entries must arrive in order and intact
+  r = LevelRing(8, 2)
+  num = 200000
+  def writer():
+    for i in range(num):
+      r.put(float(i), i, [i, i])
+  t = threading.Thread(target=writer)
+  t.start()
+  last = -1
+  got = 0
+  while t.is_alive() or len(r) > 0:
+    e = r.get()
+    if e is None:
+      continue
+    ts, level, bands = e
+    assert level > last and ts == level and bands == [level, level], e
+    last = level
+    got += 1
+  t.join()
+  print("got", got, "overruns", r.num_overruns, "sum", got + r.num_overruns == num)
+
+  # entries without bands must not return the bands of an older entry
+  r = LevelRing(2, 2)
+  r.put(0.0, 0, [1, 2])
+  r.get()
+  r.put(1.0, 1)
+  print(r.get(), r.get_last())
+  r.put(2.0, 2)
+  print(r.get())
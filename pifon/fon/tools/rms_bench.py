@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# rms_bench.py - compare the rms tool with the numpy rms engine
+#
+# feeds the same synthetic S16 audio into tools/rms (build it with make)
+# and into NumpyRecorder without pacing. checks that both give the same
+# levels and reports the CPU time used per second of audio.
+#
+# Usage: rms_bench.py [seconds] [zero_range] [channels]
+#
+
+from __future__ import print_function
+
+import sys
+import os
+import time
+import subprocess
+import tempfile
+import threading
+import resource
+
+MY_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(MY_DIR, "..", "audio"))
+
+import recorder
+
+RATE = 48000
+INTERVAL = 250
+
+
+def gen_audio(seconds, channels):
+  """noise with a slowly changing volume like a room with some noise"""
+  numpy = recorder.numpy
+  num = RATE * seconds * channels
+  rng = numpy.random.RandomState(42)
+  t = numpy.arange(num) / float(RATE * channels)
+  vol = 2000 + 6000 * (1 + numpy.sin(t * 0.7))
+  data = rng.standard_normal(num) * vol
+  return numpy.clip(data, -32768, 32767).astype("<i2").tobytes()
+
+
+def cpu_children():
+  r = resource.getrusage(resource.RUSAGE_CHILDREN)
+  return r.ru_utime + r.ru_stime
+
+
+def cpu_self():
+  r = resource.getrusage(resource.RUSAGE_SELF)
+  return r.ru_utime + r.ru_stime
+
+
+def run_tool(path, zero_range, channels, num_blocks):
+  rms = os.path.join(MY_DIR, "rms")
+  cmd = [rms, "-r", str(RATE), "-i", str(INTERVAL), "-c", str(channels),
+         "-z", str(zero_range), "-w", "-1", "-d"]
+  c0 = cpu_children()
+  s0 = cpu_self()
+  levels = []
+  with open(path, "rb") as fh:
+    data = fh.read()
+  # rms spins on EOF: keep its input open until all levels are read
+  p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+  writer = threading.Thread(target=p.stdin.write, args=(data,))
+  writer.start()
+  # parse the output lines like Recorder
+  while len(levels) < num_blocks:
+    items = p.stdout.readline().strip().split(b" ")
+    levels.append(int(items[-1]))
+  writer.join()
+  p.kill()
+  p.wait()
+  return levels, cpu_children() - c0 + cpu_self() - s0
+
+
+def run_numpy(path, zero_range, channels):
+  levels = []
+  with open(path, "rb") as fh:
+    s0 = cpu_self()
+    r = recorder.NumpyRecorder(RATE, INTERVAL, channels, zero_range=zero_range,
+                               source=fh, wait_above=-1)
+    while True:
+      res = r.read_rms()
+      if res is None:
+        break
+      levels.append(res[1])
+  return levels, cpu_self() - s0
+
+
+def main():
+  seconds = 60
+  zero_range = 0
+  channels = 1
+  if len(sys.argv) > 1:
+    seconds = int(sys.argv[1])
+  if len(sys.argv) > 2:
+    zero_range = int(sys.argv[2])
+  if len(sys.argv) > 3:
+    channels = int(sys.argv[3])
+  if recorder.numpy is None:
+    print("numpy not found!", file=sys.stderr)
+    return 1
+  if not os.path.isfile(os.path.join(MY_DIR, "rms")):
+    print("build tools/rms first: make -C", MY_DIR, file=sys.stderr)
+    return 1
+
+  fd, path = tempfile.mkstemp(suffix=".raw")
+  try:
+    os.write(fd, gen_audio(seconds, channels))
+    os.close(fd)
+    num_blocks = seconds * 1000 // INTERVAL
+    tool_levels, tool_cpu = run_tool(path, zero_range, channels, num_blocks)
+    np_levels, np_cpu = run_numpy(path, zero_range, channels)
+  finally:
+    os.unlink(path)
+
+  same = tool_levels == np_levels
+  print("%d s audio, %d blocks, zero_range=%d, channels=%d: levels %s" % \
+    (seconds, len(tool_levels), zero_range, channels,
+     "match" if same else "DIFFER"))
+  print("%-8s %10s %14s" % ("engine", "cpu [s]", "cpu/audio [%]"))
+  print("%-8s %10.3f %14.3f" % ("rms", tool_cpu, tool_cpu * 100.0 / seconds))
+  print("%-8s %10.3f %14.3f" % ("numpy", np_cpu, np_cpu * 100.0 / seconds))
+  return 0 if same else 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
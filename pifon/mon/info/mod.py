@@ -9,6 +9,18 @@ from audioinfo import AudioInfo
 from playerinfo import PlayerInfo
 
 class InfoMod(BotMod):
+  # commands to get the full state of a peer module without snapshot
+  audio_queries = (
+    ['audio','query_state'],
+    ['audio','query_active'],
+    ['audio','query_listen_url'],
+    ['audio','query_location']
+  )
+  player_queries = (
+    ['player','query_mode'],
+    ['player','query_chime']
+  )
+
   def __init__(self, name="info", listener=None, tick=1):
     BotMod.__init__(self, name)
     self.events = [
@@ -27,11 +39,13 @@ class InfoMod(BotMod):
       BotEvent("audio", "active", arg_types=(bool,), callee=self.event_audio_active),
       BotEvent("audio", "listen_url", arg_types=(str,), callee=self.event_audio_listen_url),
       BotEvent("audio", "location", arg_types=(str,), callee=self.event_audio_location),
+      BotEvent("audio", "snapshot", arg_types=(str,str), var_args=True, callee=self.event_audio_snapshot),
       BotEvent("pinger", "check", arg_types=(str, str), callee=self.event_pinger_check),
       BotEvent("player", "play", arg_types=(str, str), callee=self.event_player_play),
       BotEvent("player", "stop", arg_types=(str,), callee=self.event_player_stop),
       BotEvent("player", "mode", arg_types=(str,str), callee=self.event_player_mode),
-      BotEvent("player", "chime", arg_types=(bool,), callee=self.event_player_chime)
+      BotEvent("player", "chime", arg_types=(bool,), callee=self.event_player_chime),
+      BotEvent("player", "snapshot", arg_types=(str,str), var_args=True, callee=self.event_player_snapshot)
     ]
     self.audios = {}
     self.pending_audios = {}
@@ -81,6 +95,8 @@ class InfoMod(BotMod):
 
   def on_peer_disconnect(self, peer):
     self.log("on_peer_disconnect", peer)
+    self.pending_audios.pop(peer, None)
+    self.pending_players.pop(peer, None)
     if peer in self.audios:
       a = self.audios[peer]
       self._call("audio_del",a)
@@ -105,17 +121,27 @@ class InfoMod(BotMod):
     if mod_name == 'audio':
       a = self._create_pending_audio(peer)
       self.log("added audio from", peer)
-      # request state
-      self.send_command(['audio','query_state'],to=[peer])
-      self.send_command(['audio','query_active'],to=[peer])
-      self.send_command(['audio','query_listen_url'],to=[peer])
-      self.send_command(['audio','query_location'],to=[peer])
+      # request state in one round trip
+      self.send_command(['audio','snapshot'], to=[peer], callback=self._audio_queried)
     elif mod_name == 'player':
       p = self._create_pending_player(peer)
       self.log("added player from",peer)
       # request mode
-      self.send_command(['player','query_mode'],to=[peer])
-      self.send_command(['player','query_chime'],to=[peer])
+      self.send_command(['player','snapshot'], to=[peer], callback=self._player_queried)
+
+  def _audio_queried(self, req):
+    # replies were already dispatched as events
+    if req.peer in self.pending_audios:
+      # older peer without snapshot: query one by one
+      self.log("audio snapshot failed. query", req.peer)
+      for cmd in self.audio_queries:
+        self.send_command(cmd, to=[req.peer])
+
+  def _player_queried(self, req):
+    if req.peer in self.pending_players:
+      self.log("player snapshot failed. query", req.peer)
+      for cmd in self.player_queries:
+        self.send_command(cmd, to=[req.peer])
 
   def on_tick(self, ts, delta):
     # forward to listener
@@ -257,6 +283,34 @@ class InfoMod(BotMod):
       a.audio_location = args[0]
       self._update_audio(a, AudioInfo.FLAG_AUDIO_LOCATION)
 
+  def event_audio_snapshot(self, sender, args):
+    a = self._get_audio(sender)
+    if a is None:
+      return
+    snap = self.parse_snapshot(args)
+    flags = 0
+    if 'state' in snap:
+      a.audio_state = snap['state']
+      flags |= AudioInfo.FLAG_AUDIO_STATE
+      if a.audio_state == 'idle':
+        self._remove_non_idle(a)
+      else:
+        self._add_non_idle(a)
+    if 'active' in snap:
+      a.audio_active = snap['active'] == 'True'
+      flags |= AudioInfo.FLAG_AUDIO_ACTIVE
+      if a.audio_active:
+        self._add_active(a)
+      else:
+        self._remove_active(a)
+    if 'listen_url' in snap:
+      a.audio_listen_url = snap['listen_url']
+      flags |= AudioInfo.FLAG_AUDIO_LISTEN_URL
+    if 'location' in snap:
+      a.audio_location = snap['location']
+      flags |= AudioInfo.FLAG_AUDIO_LOCATION
+    self._update_audio(a, flags)
+
   def event_pinger_check(self, sender, args):
     peer = args[0]
     a = self._get_audio(peer)
@@ -319,6 +373,21 @@ class InfoMod(BotMod):
       if not self._make_player_live(p):
         self._call('player_update', p, PlayerInfo.FLAG_MODE)
 
+  def event_player_snapshot(self, sender, args):
+    p = self._get_player(sender)
+    if p is None:
+      return
+    snap = self.parse_snapshot(args)
+    flags = 0
+    if 'mode' in snap:
+      p.mode = snap['mode']
+      flags |= PlayerInfo.FLAG_MODE
+    if 'chime' in snap:
+      p.chime = snap['chime'] == 'True'
+      flags |= PlayerInfo.FLAG_CHIME
+    if not self._make_player_live(p):
+      self._call('player_update', p, flags)
+
   def event_player_chime(self, sender, args):
     p = self._get_player(sender)
     if p is not None:
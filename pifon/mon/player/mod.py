@@ -9,6 +9,12 @@ import worker
 import control
 
 class PlayerMod(BotMod):
+  # commands to get the state of an audio peer without snapshot
+  audio_queries = (
+    ['audio', 'query_listen_url'],
+    ['audio', 'query_active']
+  )
+
   def __init__(self):
     BotMod.__init__(self, "player")
     self.cmds = [
@@ -25,6 +31,7 @@ class PlayerMod(BotMod):
       StopEvent(self.on_stop),
       BotEvent("audio","active",callee=self.on_player_active,arg_types=(bool,)),
       BotEvent("audio","listen_url",callee=self.on_player_listen_url,arg_types=(str,)),
+      BotEvent("audio","snapshot",callee=self.on_audio_snapshot,arg_types=(str,str),var_args=True),
     ]
     self.audio_peers = []
 
@@ -96,6 +103,11 @@ class PlayerMod(BotMod):
   def cmd_query_chime(self, sender):
     self._report_chime([sender])
 
+  def get_snapshot(self):
+    return [('mode', self.control.mode_names[self.control.state]),
+            ('play_server', self.control.play_srv),
+            ('chime', self.worker.get_play_chimes())]
+
   def _report_chime(self, to):
     self.send_event(['chime',self.worker.get_play_chimes()],to)
 
@@ -112,8 +124,20 @@ class PlayerMod(BotMod):
       self.audio_peers.append(peer)
       self.log("CONNECT", peer)
       self.control.audio_connect(peer)
-      self.send_command(['audio', 'query_listen_url'], to=[peer])
-      self.send_command(['audio', 'query_active'], to=[peer])
+      self.send_command(['audio', 'snapshot'], to=[peer], callback=self._audio_queried)
+
+  def _audio_queried(self, req):
+    # replies were already dispatched as events
+    replies = req.get_replies()
+    if replies is not None:
+      for r in replies:
+        if r[0:2] == ['audio.event', 'snapshot']:
+          return
+    if req.peer in self.audio_peers:
+      # older peer: query one by one
+      self.log("audio snapshot failed. query", req.peer)
+      for cmd in self.audio_queries:
+        self.send_command(cmd, to=[req.peer])
 
   def on_peer_disconnected(self, peer):
     if peer in self.audio_peers:
@@ -125,6 +149,14 @@ class PlayerMod(BotMod):
     self.log("got player_listen_url", args)
     self.control.audio_src(sender, args[0])
 
+  def on_audio_snapshot(self, sender, args):
+    snap = self.parse_snapshot(args)
+    self.log("got audio snapshot", sender, snap)
+    if 'listen_url' in snap:
+      self.control.audio_src(sender, snap['listen_url'])
+    if 'active' in snap:
+      self.control.audio_active(sender, snap['active'] == 'True')
+
   def on_player_active(self, sender, args):
     self.log("got player_active", sender, args)
     self.control.audio_active(sender, args[0])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# broker.py - round trip time of two links through a local bot broker
+#
+# Usage: broker.py [round trips]
+#
+# runs a broker on a temp socket, attaches two links and measures
+# ping/pong round trips between them.
+#
+
+from __future__ import print_function
+
+import sys
+import os
+import time
+import tempfile
+import shutil
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bot.broker import BotBroker, BrokerLink
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+
+class Collector:
+  def __init__(self):
+    self.queue = queue.Queue()
+
+  def put(self, line):
+    self.queue.put(line)
+
+  def get(self):
+    return self.queue.get(True, 2.0)
+
+
+def attach(path, nick):
+  out = Collector()
+  link = BrokerLink(path, nick)
+  link.set_output(out)
+  if not link.connect():
+    raise IOError("can't attach " + nick)
+  return link, out
+
+
+def run(num):
+  tmp_dir = tempfile.mkdtemp()
+  path = os.path.join(tmp_dir, "broker.sock")
+  broker = BotBroker(path)
+  broker.open()
+  def serve():
+    while broker.stay:
+      broker.process(0.05)
+  thread = threading.Thread(target=serve)
+  thread.start()
+  try:
+    a, ao = attach(path, "a")
+    ao.get()
+    b, bo = attach(path, "b")
+    # roster lines
+    bo.get()
+    bo.get()
+    ao.get()
+    rtts = []
+    for i in range(num):
+      t0 = time.time()
+      a.put("b|bot ping")
+      bo.get()
+      b.put("a|bot.event pong")
+      ao.get()
+      rtts.append(time.time() - t0)
+    a.close()
+    b.close()
+  finally:
+    broker.stop()
+    thread.join()
+    broker.close()
+    shutil.rmtree(tmp_dir)
+  rtts.sort()
+  print("%d round trips: avg %.3f ms  p90 %.3f ms  max %.3f ms" % \
+    (num, sum(rtts) * 1000.0 / num, rtts[int(num * 0.9)] * 1000.0,
+     rtts[-1] * 1000.0))
+  return 0
+
+
+if __name__ == '__main__':
+  num = 1000
+  if len(sys.argv) > 1:
+    num = int(sys.argv[1])
+  sys.exit(run(num))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# framing.py - compare text lines and length prefixed frames on the bot pipe
+#
+# Usage: framing.py [messages]
+#
+# measures encoding and decoding of traced audio level events in memory
+# and the throughput of both formats through an os pipe.
+#
+
+from __future__ import print_function
+
+import sys
+import os
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bot.io import split_args, format_args
+from bot.frame import encode_frame, BotFrameDecoder
+
+_py3 = sys.version_info[0] > 2
+
+
+def gen_msgs(num):
+  """messages like those sent by a traced audio module"""
+  msgs = []
+  for i in range(num):
+    args = ["audio.event", "level", str(i % 100), str(i % 17), str(i % 7)]
+    if i % 10 == 0:
+      args = ["audio.event", "location", "Kids Room"]
+    msgs.append(("fon@pifon", ["mon@pifon"], args))
+  return msgs
+
+
+# ----- text lines -----
+
+def text_encode(msgs):
+  buf = []
+  for sender, receivers, args in msgs:
+    buf.append(sender + ";" + ",".join(receivers) + "|" + format_args(args))
+  buf.append("")
+  data = "\n".join(buf)
+  if _py3:
+    data = data.encode("utf-8")
+  return data
+
+
+class TextDecoder:
+  def __init__(self):
+    self.data = b""
+
+  def feed(self, data):
+    lines = (self.data + data).split(b"\n")
+    self.data = lines.pop()
+    result = []
+    for l in lines:
+      if _py3:
+        l = l.decode("utf-8", "replace")
+      pos = l.find(';')
+      sender = l[0:pos]
+      l = l[pos+1:]
+      pos = l.find('|')
+      receivers = None
+      if pos > 0:
+        receivers = l[0:pos].split(',')
+      result.append((sender, receivers, split_args(l[pos+1:])))
+    return result
+
+
+# ----- frames -----
+
+def frame_encode(msgs):
+  return b"".join([encode_frame(s, r, a) for s, r, a in msgs])
+
+
+# ----- runner -----
+
+def bench_memory(name, encode, decoder, msgs):
+  t0 = time.time()
+  data = encode(msgs)
+  t1 = time.time()
+  got = decoder.feed(data)
+  t2 = time.time()
+  if got != msgs:
+    print("MISMATCH:", name)
+  n = len(msgs)
+  print("%-6s memory  enc %6.2f us/msg  dec %6.2f us/msg  %6.1f bytes/msg" % \
+    (name, (t1 - t0) * 1000000.0 / n, (t2 - t1) * 1000000.0 / n,
+     len(data) / float(n)))
+
+
+def bench_pipe(name, encode, decoder, msgs, batch=16):
+  """writer thread encodes batches, reader decodes what arrives"""
+  rfd, wfd = os.pipe()
+  def writer():
+    for i in range(0, len(msgs), batch):
+      data = encode(msgs[i:i+batch])
+      while len(data) > 0:
+        n = os.write(wfd, data)
+        data = data[n:]
+    os.close(wfd)
+  t = threading.Thread(target=writer)
+  t0 = time.time()
+  t.start()
+  num = 0
+  while True:
+    data = os.read(rfd, 65536)
+    if len(data) == 0:
+      break
+    num += len(decoder.feed(data))
+  t.join()
+  dt = time.time() - t0
+  os.close(rfd)
+  print("%-6s pipe    %9.0f msgs/s  (%d msgs)" % (name, num / dt, num))
+
+
+def run(num):
+  msgs = gen_msgs(num)
+  bench_memory("text", text_encode, TextDecoder(), msgs)
+  bench_memory("frame", frame_encode, BotFrameDecoder(), msgs)
+  bench_pipe("text", text_encode, TextDecoder(), msgs)
+  bench_pipe("frame", frame_encode, BotFrameDecoder(), msgs)
+  return 0
+
+
+if __name__ == '__main__':
+  num = 100000
+  if len(sys.argv) > 1:
+    num = int(sys.argv[1])
+  sys.exit(run(num))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# split_args.py - compare the bot line tokenizers
+#
+# Usage: split_args.py [rounds]
+#
+
+from __future__ import print_function
+
+import sys
+import os
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bot.io import split_args, format_args, BotArgsCache
+from bot.io_test import legacy_split_args
+
+
+# typical lines seen by a monitor bot
+lines = [
+  "audio.event level 42 17 3",
+  "audio.event level 7 0 12",
+  "bot ping",
+  "bot.event pong",
+  "audio.event state attack",
+  "audio.event listen_url http://pifon.local:8000/pifon",
+  format_args(["audio.event", "location", "Kids Room"]),
+  format_args(["audio.event", "desc", "alevel", 1, "int", "[1, 100]",
+               "audio level to reach in attack phase [1-100]"]),
+  "pinger.event check fon@pifon alive",
+  "player.event mode monitor None"
+]
+
+
+def run(rounds):
+  # verify results first
+  for l in lines:
+    a = legacy_split_args(l)
+    b = split_args(l)
+    if a != b:
+      print("MISMATCH:", l, a, b)
+      return 1
+
+  def bench_legacy():
+    for l in lines:
+      legacy_split_args(l)
+
+  def bench_regex():
+    for l in lines:
+      split_args(l)
+
+  cache = BotArgsCache()
+  def bench_cache():
+    for l in lines:
+      cache.split_args(l)
+
+  n = len(lines) * rounds
+  for name, func in (("legacy", bench_legacy),
+                     ("regex", bench_regex),
+                     ("cached", bench_cache)):
+    t = min(timeit.repeat(func, number=rounds, repeat=3))
+    print("%-8s %8.2f us/line" % (name, t * 1000000.0 / n))
+  return 0
+
+
+if __name__ == '__main__':
+  rounds = 10000
+  if len(sys.argv) > 1:
+    rounds = int(sys.argv[1])
+  sys.exit(run(rounds))
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# asyncio based runtime for bots (needs python 3.5+)
+
+from __future__ import print_function
+
+import asyncio
+import sys
+import time
+import traceback
+
+from bot.main import Bot
+from bot.io import BotIO
+from bot.event import BotEvent
+
+
+class AsyncBot(Bot):
+  """run the bot modules on an asyncio event loop
+
+     stdin is read with an asyncio stream reader and module ticks are
+     driven by a scheduler task. Command and event callees may be
+     coroutine functions: they are started as tasks and run concurrently
+     without blocking dispatch or ticks. Plain BotMod callees are called
+     directly as in the blocking Bot.
+  """
+  def __init__(self, verbose=False, loop=None):
+    Bot.__init__(self, verbose)
+    self.loop = loop
+    self.tasks = set()
+    self.stop_event = None
+    self.flush_pending = False
+    self.ticker = None
+
+  # ----- async callee adapter -----
+
+  def _setup_dispatch(self):
+    # wrap coroutine callees before the dispatch tables are built
+    for mod in self.modules:
+      self._adapt_callees(mod.get_commands())
+      self._adapt_callees(mod.get_events())
+    self._adapt_callees(self.cmds)
+    self._adapt_callees(self.events)
+    Bot._setup_dispatch(self)
+
+  def _adapt_callees(self, cmds):
+    if cmds is None:
+      return
+    for cmd in cmds:
+      callee = cmd.callee
+      if callee is not None and asyncio.iscoroutinefunction(callee):
+        cmd.callee = self._gen_task_starter(callee)
+
+  def _gen_task_starter(self, func):
+    def start_task(*args):
+      self.spawn(func(*args))
+    return start_task
+
+  def spawn(self, coro):
+    """run a coroutine as a task of the bot"""
+    task = self.loop.create_task(coro)
+    self.tasks.add(task)
+    task.add_done_callback(self._task_done)
+    return task
+
+  def run_blocking(self, func, *args):
+    """run a blocking function in a worker thread. returns a future"""
+    return self.loop.run_in_executor(None, func, *args)
+
+  def _task_done(self, task):
+    self.tasks.discard(task)
+    if task.cancelled():
+      return
+    e = task.exception()
+    if e is not None:
+      self._log("bot: ERROR in task:", str(e))
+      traceback.print_exception(type(e), e, e.__traceback__, file=sys.stderr)
+      self.request_shutdown()
+
+  # ----- output -----
+
+  def _request_flush(self):
+    # coalesce all writes of this loop iteration into one flush
+    if not self.flush_pending:
+      self.flush_pending = True
+      self.loop.call_soon(self._flush)
+
+  def _flush(self):
+    self.flush_pending = False
+    self.bio.flush()
+
+  # ----- main loop -----
+
+  def request_shutdown(self):
+    Bot.request_shutdown(self)
+    if self.stop_event is not None:
+      self.stop_event.set()
+
+  def _main_loop(self):
+    if self.loop is None:
+      self.loop = asyncio.new_event_loop()
+      asyncio.set_event_loop(self.loop)
+    self.bio.set_write_notifier(self._request_flush)
+    try:
+      self.loop.run_until_complete(self._async_main_loop())
+    except KeyboardInterrupt:
+      self._log("bot: Break")
+    # report stop
+    self._trigger_internal_event(BotEvent.STOP)
+    self.bio.get_cfg().flush()
+    self.bio.flush()
+
+  async def _async_main_loop(self):
+    self._init_tick()
+    self.stop_event = asyncio.Event()
+    self.stay = True
+    for fd in self.wakeups:
+      self.loop.add_reader(fd, self._handle_wakeups, [fd])
+
+    # report start
+    self._trigger_internal_event(BotEvent.START)
+
+    self._reset_ranges()
+    self.show_ts = time.time()
+
+    self.spawn(self._reader_task())
+    self.ticker = self.spawn(self._ticker_task())
+    await self.stop_event.wait()
+
+    # shutdown: cancel reader, ticker and still running handlers
+    for fd in self.wakeups:
+      self.loop.remove_reader(fd)
+    tasks = list(self.tasks)
+    for t in tasks:
+      t.cancel()
+    if len(tasks) > 0:
+      await asyncio.wait(tasks)
+
+  async def _reader_task(self):
+    reader = asyncio.StreamReader()
+    protocol = asyncio.StreamReaderProtocol(reader)
+    await self.loop.connect_read_pipe(lambda: protocol, sys.stdin)
+    while self.stay:
+      # dispatch what BotIO has buffered (also lines read during init)
+      self._dispatch_msgs(self.bio.pop_msgs())
+      data = await reader.read(BotIO.READ_SIZE)
+      self.bio.feed(data)
+      if self.bio.is_eof():
+        self._log("bot: input closed")
+        self.request_shutdown()
+
+  def add_wakeup(self, fd, func):
+    Bot.add_wakeup(self, fd, func)
+    if self.stop_event is not None:
+      self.loop.add_reader(fd, self._handle_wakeups, [fd])
+
+  def remove_wakeup(self, fd):
+    Bot.remove_wakeup(self, fd)
+    if self.stop_event is not None:
+      self.loop.remove_reader(fd)
+
+  def _add_timer(self, interval, func):
+    entry = Bot._add_timer(self, interval, func)
+    # restart ticker: it may sleep too long or has ended without entries
+    if self.ticker is not None:
+      self.ticker.cancel()
+    self.ticker = self.spawn(self._ticker_task())
+    return entry
+
+  async def _ticker_task(self):
+    while self.stay:
+      timeout = self.sched.get_timeout(time.time())
+      if timeout is None:
+        # no ticking modules
+        break
+      await asyncio.sleep(timeout)
+      b = time.time()
+      late = self._tick()
+      self._account_delta(b, time.time() - b, late)
+
+
+# ----- test -----
+if __name__ == '__main__':
+  from bot.mod import BotMod
+  from bot.cmd import BotCmd
+
+  class SlowMod(BotMod):
+    def __init__(self):
+      BotMod.__init__(self, "slow")
+      self.cmds = [
+        BotCmd("work",callee=self.cmd_work)
+      ]
+
+    async def cmd_work(self, sender):
+      # does not block ticks or other commands
+      await asyncio.sleep(2)
+      self.send_event(["done"], to=[sender])
+
+    def get_commands(self):
+      return self.cmds
+
+  bot = AsyncBot(True)
+  bot.add_module(SlowMod())
+  bot.run()
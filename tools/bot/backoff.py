@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# exponential backoff for restarts and reconnects
+
+from __future__ import print_function
+
+import random
+
+
+class BotBackoff:
+  """return growing delays for repeated failures
+
+     the delay starts with initial and is multiplied by factor on every
+     failure up to maximum. A run that lasted at least reset_after seconds
+     is considered healthy and starts over with the initial delay. With
+     jitter > 0 each delay is randomized by +/- jitter (a fraction).
+  """
+  def __init__(self, initial=0.1, maximum=30.0, factor=2.0, reset_after=60.0,
+               jitter=0.0):
+    self.initial = initial
+    self.maximum = maximum
+    self.factor = factor
+    self.reset_after = reset_after
+    self.jitter = jitter
+    self.delay = initial
+    self.failures = 0
+
+  def reset(self):
+    self.delay = self.initial
+    self.failures = 0
+
+  def next_delay(self, run_time=None):
+    """return delay before the next attempt.
+       run_time is the duration of the run that just failed"""
+    if run_time is not None and run_time >= self.reset_after:
+      self.reset()
+    delay = self.delay
+    self.delay = min(self.delay * self.factor, self.maximum)
+    self.failures += 1
+    if self.jitter > 0:
+      delay *= 1.0 + random.uniform(-self.jitter, self.jitter)
+    return delay
+
+
+class BotReconnectStats:
+  """count reconnects and the time from losing a link until it is back"""
+  def __init__(self):
+    self.reconnects = 0
+    self.down_ts = None
+    self.last = 0.0
+    self.max = 0.0
+    self.sum = 0.0
+    # lines dropped while down
+    self.dropped = 0
+
+  def is_down(self):
+    return self.down_ts is not None
+
+  def lost(self, ts):
+    """link was lost. repeated calls keep the first time"""
+    if self.down_ts is None:
+      self.down_ts = ts
+
+  def restored(self, ts):
+    """link is back. return the time it was down or None"""
+    if self.down_ts is None:
+      return None
+    delta = ts - self.down_ts
+    self.down_ts = None
+    self.reconnects += 1
+    self.last = delta
+    self.sum += delta
+    if delta > self.max:
+      self.max = delta
+    return delta
+
+  def format(self):
+    avg = 0.0
+    if self.reconnects > 0:
+      avg = self.sum / self.reconnects
+    return "reconnects=%d last=%.3fs avg=%.3fs max=%.3fs dropped=%d" % \
+      (self.reconnects, self.last, avg, self.max, self.dropped)
+
+
+# ----- test -----
+if __name__ == '__main__':
+  b = BotBackoff(jitter=0.2)
+  for i in range(12):
+    print(b.failures, "%.3f" % b.next_delay(1))
+  print("healthy run:", b.next_delay(100))
+  s = BotReconnectStats()
+  s.lost(1.0)
+  s.lost(2.0)
+  print(s.restored(3.5), s.format())
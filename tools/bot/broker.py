@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# local message broker for bots running on the same host
+#
+# bots attach to a unix domain socket instead of (or besides) the MUC.
+# the protocol on the socket is line based text:
+#
+#   client -> broker: first line is the nick of the client.
+#                     then bot output lines 'recv,recv|args' or 'args'
+#   broker -> client: bot input lines 'sender;recv,recv|args'
+#                     '<nick>;|connected <peer>' and
+#                     '<nick>;|disconnected <peer>' report the roster
+#
+# like in the MUC a line without receivers is seen by all other clients
+# and a line with receivers only by the named clients.
+
+from __future__ import print_function
+
+import sys
+import os
+import socket
+import select
+import threading
+import collections
+import logging
+
+_py3 = sys.version_info[0] > 2
+
+DEFAULT_SOCKET = "/tmp/botbroker.sock"
+
+
+def _encode(line):
+  if _py3:
+    return line.encode("utf-8")
+  elif type(line) is not str:
+    return line.encode("utf-8")
+  return line
+
+
+def _decode(data):
+  if _py3:
+    return data.decode("utf-8", "replace")
+  return data
+
+
+def split_lines(data, old_data):
+  """split received data into lines. return (lines, old_data)"""
+  lines = (old_data + data).split(b"\n")
+  old_data = lines.pop()
+  return [_decode(l.rstrip(b"\r")) for l in lines], old_data
+
+
+def get_receivers(line):
+  """return receivers of an output line or None"""
+  pos = line.find('|')
+  if pos == -1:
+    return None
+  return line[0:pos].split(',')
+
+
+class BotBrokerClient:
+  def __init__(self, sock):
+    self.sock = sock
+    self.nick = None
+    self.in_data = b""
+    # encoded lines to send and the data being sent
+    self.out_lines = collections.deque()
+    self.out_data = b""
+    # output exceeded the queue size: client is dropped
+    self.lagging = False
+
+  def has_output(self):
+    return len(self.out_data) > 0 or len(self.out_lines) > 0
+
+  def __repr__(self):
+    return "[BotBrokerClient:%s]" % self.nick
+
+
+class BotBroker:
+  """route bot lines between clients attached to a unix domain socket
+
+     a client that does not read and has more than queue_size lines
+     pending is disconnected. Its pending lines are counted in
+     num_dropped. It gets a consistent roster when it joins again.
+  """
+  def __init__(self, path, queue_size=1000):
+    self.path = path
+    self.queue_size = queue_size
+    self.num_dropped = 0
+    self.sock = None
+    self.clients = []
+    # nick -> client
+    self.nicks = {}
+    self.stay = True
+
+  def open(self):
+    if os.path.exists(self.path):
+      os.unlink(self.path)
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.bind(self.path)
+    self.sock.listen(16)
+    self.sock.setblocking(0)
+
+  def close(self):
+    for c in self.clients:
+      c.sock.close()
+    self.clients = []
+    self.nicks = {}
+    if self.sock is not None:
+      self.sock.close()
+      self.sock = None
+      os.unlink(self.path)
+
+  def get_nicks(self):
+    return sorted(self.nicks)
+
+  def run(self):
+    self.open()
+    try:
+      while self.stay:
+        self.process(1.0)
+    finally:
+      self.close()
+
+  def stop(self):
+    self.stay = False
+
+  def process(self, timeout=None):
+    """wait for sockets and handle all pending traffic"""
+    rfds = [self.sock] + [c.sock for c in self.clients]
+    wfds = [c.sock for c in self.clients if c.has_output()]
+    r, w, x = select.select(rfds, wfds, [], timeout)
+    if self.sock in r:
+      self._accept()
+    # read first: replies are sent in the same pass
+    for c in list(self.clients):
+      if c.sock in r:
+        self._read(c)
+    for c in list(self.clients):
+      if c.lagging:
+        logging.info("broker: drop lagging %s", c)
+        self._drop(c)
+      elif c.has_output():
+        self._write(c)
+
+  def _accept(self):
+    try:
+      sock, addr = self.sock.accept()
+    except socket.error:
+      return
+    sock.setblocking(0)
+    self.clients.append(BotBrokerClient(sock))
+
+  def _read(self, c):
+    try:
+      data = c.sock.recv(65536)
+    except socket.error:
+      data = b""
+    if len(data) == 0:
+      self._drop(c)
+      return
+    lines, c.in_data = split_lines(data, c.in_data)
+    for line in lines:
+      if c.nick is None:
+        self._join(c, line.strip())
+        if c.nick is None:
+          return
+      else:
+        self._route(c, line)
+
+  def _write(self, c):
+    if len(c.out_data) == 0:
+      c.out_data = b"".join(c.out_lines)
+      c.out_lines.clear()
+    try:
+      n = c.sock.send(c.out_data)
+      c.out_data = c.out_data[n:]
+    except socket.error as e:
+      logging.info("broker: write failed: %s: %s", c, e)
+      self._drop(c)
+
+  def _send(self, c, line):
+    if c.lagging:
+      self.num_dropped += 1
+      return
+    if len(c.out_lines) >= self.queue_size:
+      # dropped after this pass: do not change clients while routing
+      c.lagging = True
+      self.num_dropped += len(c.out_lines) + 1
+      c.out_lines.clear()
+      return
+    c.out_lines.append(_encode(line + "\n"))
+
+  def _join(self, c, nick):
+    if nick == "" or nick in self.nicks:
+      logging.info("broker: reject nick '%s'", nick)
+      self._drop(c)
+      return
+    c.nick = nick
+    self.nicks[nick] = c
+    logging.info("broker: join %s", nick)
+    # report roster to new client: itself first
+    self._send(c, "%s;|connected %s" % (nick, nick))
+    for o in self.clients:
+      if o is not c and o.nick is not None:
+        self._send(c, "%s;|connected %s" % (nick, o.nick))
+        self._send(o, "%s;|connected %s" % (o.nick, nick))
+
+  def _drop(self, c):
+    if c not in self.clients:
+      return
+    self.clients.remove(c)
+    c.sock.close()
+    if c.nick is not None:
+      logging.info("broker: leave %s", c.nick)
+      del self.nicks[c.nick]
+      for o in self.clients:
+        if o.nick is not None:
+          self._send(o, "%s;|disconnected %s" % (o.nick, c.nick))
+
+  def _route(self, c, line):
+    if line == "":
+      return
+    receivers = get_receivers(line)
+    msg = c.nick + ";" + line
+    if receivers is None:
+      msg = c.nick + ";|" + line
+      for o in self.clients:
+        if o is not c and o.nick is not None:
+          self._send(o, msg)
+    else:
+      for r in receivers:
+        o = self.nicks.get(r)
+        if o is not None and o is not c:
+          self._send(o, msg)
+
+
+class BrokerLink:
+  """client side of a BotBroker connection
+
+     lines received from the broker are passed to the put() method of the
+     output. a reader thread is used, so the output must be thread safe
+     like ProcRunner. If the broker goes away the link reports all known
+     peers as disconnected. Lines put while not connected are kept (at
+     most queue_size, oldest are dropped) and sent after the next connect.
+  """
+  def __init__(self, path, nick, queue_size=1000):
+    self.path = path
+    self.nick = nick
+    self.output = None
+    self.sock = None
+    self.thread = None
+    self.lock = threading.Lock()
+    self.peers = set()
+    self.pending = collections.deque(maxlen=queue_size)
+    self.num_dropped = 0
+
+  def set_output(self, output):
+    self.output = output
+
+  def connect(self):
+    """connect to broker. return True if connected"""
+    if self.thread is not None:
+      self.thread.join()
+      self.thread = None
+    try:
+      sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      sock.connect(self.path)
+    except socket.error as e:
+      logging.info("link: can't connect to '%s': %s", self.path, e)
+      return False
+    with self.lock:
+      self.sock = sock
+      lines = [self.nick] + list(self.pending)
+      self.pending.clear()
+    self._sendall("\n".join(lines) + "\n")
+    self.thread = threading.Thread(target=self._reader)
+    self.thread.daemon = True
+    self.thread.start()
+    return True
+
+  def is_connected(self):
+    return self.sock is not None
+
+  def close(self):
+    sock = self.sock
+    if sock is not None:
+      try:
+        sock.shutdown(socket.SHUT_RDWR)
+      except socket.error:
+        pass
+    if self.thread is not None:
+      self.thread.join()
+      self.thread = None
+
+  def put(self, line):
+    """send an output line of the bot"""
+    with self.lock:
+      if self.sock is None:
+        if len(self.pending) == self.pending.maxlen:
+          self.num_dropped += 1
+        self.pending.append(line)
+        return
+    self._sendall(line + "\n")
+
+  def _sendall(self, line):
+    data = _encode(line)
+    with self.lock:
+      try:
+        self.sock.sendall(data)
+      except socket.error as e:
+        logging.info("link: send failed: %s", e)
+      except AttributeError:
+        # closed meanwhile
+        pass
+
+  def _reader(self):
+    old_data = b""
+    while True:
+      try:
+        data = self.sock.recv(65536)
+      except socket.error:
+        data = b""
+      if len(data) == 0:
+        break
+      lines, old_data = split_lines(data, old_data)
+      for line in lines:
+        self._track(line)
+        self.output.put(line)
+    # broker is gone
+    with self.lock:
+      self.sock.close()
+      self.sock = None
+    for peer in sorted(self.peers):
+      self.output.put("%s;|disconnected %s" % (self.nick, peer))
+    self.peers = set()
+
+  def _track(self, line):
+    prefix = self.nick + ";|"
+    if line.startswith(prefix):
+      args = line[len(prefix):].split(" ")
+      if len(args) == 2:
+        if args[0] == "connected":
+          self.peers.add(args[1])
+        elif args[0] == "disconnected":
+          self.peers.discard(args[1])
+
+
+class BotRoster:
+  """merge the rosters of several transports
+
+     a nick is connected while at least one source sees it.
+  """
+  def __init__(self):
+    # nick -> set of sources
+    self.nicks = {}
+
+  def add(self, nick, source):
+    """add nick seen by source. return True if nick is new"""
+    sources = self.nicks.get(nick)
+    if sources is None:
+      self.nicks[nick] = set([source])
+      return True
+    sources.add(source)
+    return False
+
+  def remove(self, nick, source):
+    """remove nick from source. return True if nick is gone"""
+    sources = self.nicks.get(nick)
+    if sources is None or source not in sources:
+      return False
+    sources.discard(source)
+    if len(sources) == 0:
+      del self.nicks[nick]
+      return True
+    return False
+
+  def has(self, nick, source):
+    sources = self.nicks.get(nick)
+    return sources is not None and source in sources
+
+  def get_only(self, source, ignore=None):
+    """return nicks seen only by the given source"""
+    return [n for n, s in self.nicks.items()
+            if n != ignore and len(s) == 1 and source in s]
+
+
+# ----- test -----
+if __name__ == '__main__':
+  # run a broker on the given socket path
+  logging.basicConfig(level=logging.INFO, format='%(levelname)-8s %(message)s')
+  path = DEFAULT_SOCKET
+  if len(sys.argv) > 1:
+    path = sys.argv[1]
+  b = BotBroker(path)
+  try:
+    b.run()
+  except KeyboardInterrupt:
+    pass
@@ -0,0 +1,159 @@
+# unittests for the local bot broker. runs offline on a temp socket
+
+import unittest
+import threading
+import tempfile
+import shutil
+import os
+import time
+import socket
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from bot.broker import BotBroker, BrokerLink, BotRoster
+
+
+class Collector:
+  def __init__(self):
+    self.queue = queue.Queue()
+
+  def put(self, line):
+    self.queue.put(line)
+
+  def get(self, timeout=2.0):
+    return self.queue.get(True, timeout)
+
+  def get_all(self, num):
+    return [self.get() for i in range(num)]
+
+
+class BrokerTest(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmp_dir, "broker.sock")
+    self.broker = BotBroker(self.path)
+    self.broker.open()
+    self.thread = threading.Thread(target=self._run)
+    self.thread.start()
+    self.links = []
+
+  def tearDown(self):
+    for l in self.links:
+      l.close()
+    self.broker.stop()
+    self.thread.join()
+    self.broker.close()
+    shutil.rmtree(self.tmp_dir)
+
+  def _run(self):
+    while self.broker.stay:
+      self.broker.process(0.05)
+
+  def _attach(self, nick):
+    out = Collector()
+    link = BrokerLink(self.path, nick)
+    link.set_output(out)
+    self.assertTrue(link.connect())
+    self.links.append(link)
+    return link, out
+
+  def test_roster(self):
+    a, ao = self._attach("a")
+    self.assertEqual(ao.get(), "a;|connected a")
+    b, bo = self._attach("b")
+    self.assertEqual(bo.get_all(2), ["b;|connected b", "b;|connected a"])
+    self.assertEqual(ao.get(), "a;|connected b")
+    b.close()
+    self.assertEqual(ao.get(), "a;|disconnected b")
+    # link reports its peers when closed
+    self.assertEqual(bo.get_all(2), ["b;|disconnected a", "b;|disconnected b"])
+
+  def test_duplicate_nick(self):
+    a, ao = self._attach("a")
+    ao.get()
+    a2, a2o = self._attach("a")
+    self.assertRaises(queue.Empty, a2o.get, 0.2)
+    self.assertFalse(a2.is_connected())
+
+  def test_route(self):
+    a, ao = self._attach("a")
+    ao.get()
+    b, bo = self._attach("b")
+    c, co = self._attach("c")
+    bo.get_all(3)
+    co.get_all(3)
+    ao.get_all(2)
+    # broadcast is seen by all others
+    a.put("audio.event level 1 2 3")
+    self.assertEqual(bo.get(), "a;|audio.event level 1 2 3")
+    self.assertEqual(co.get(), "a;|audio.event level 1 2 3")
+    # receivers only
+    a.put("c|bot ping")
+    self.assertEqual(co.get(), "a;c|bot ping")
+    b.put("a,c|hello")
+    self.assertEqual(ao.get(), "b;a,c|hello")
+    self.assertEqual(co.get(), "b;a,c|hello")
+    self.assertRaises(queue.Empty, bo.get, 0.1)
+
+  def test_round_trip(self):
+    a, ao = self._attach("a")
+    ao.get()
+    b, bo = self._attach("b")
+    bo.get_all(2)
+    ao.get()
+    num = 20
+    t0 = time.time()
+    for i in range(num):
+      a.put("b|bot ping %d" % i)
+      self.assertEqual(bo.get(), "a;b|bot ping %d" % i)
+      b.put("a|bot.event pong %d" % i)
+      self.assertEqual(ao.get(), "b;a|bot.event pong %d" % i)
+    # generous bound: a local round trip takes well below a millisecond
+    self.assertLess((time.time() - t0) / num, 0.1)
+
+  def test_stalled_client(self):
+    self.broker.queue_size = 10
+    a, ao = self._attach("a")
+    ao.get()
+    # a client that joins but never reads
+    slow = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    slow.connect(self.path)
+    slow.sendall(b"slow\n")
+    self.assertEqual(ao.get(), "a;|connected slow")
+    # fill the socket buffer and the broker queue
+    line = "slow|" + "x" * 1000
+    end = time.time() + 5
+    got = None
+    while got is None and time.time() < end:
+      for i in range(100):
+        a.put(line)
+      try:
+        got = ao.get(0.05)
+      except queue.Empty:
+        pass
+    slow.close()
+    self.assertEqual(got, "a;|disconnected slow")
+    self.assertTrue(self.broker.num_dropped > 0)
+    self.assertEqual(self.broker.get_nicks(), ["a"])
+
+
+class BotRosterTest(unittest.TestCase):
+  def test_merge(self):
+    r = BotRoster()
+    self.assertTrue(r.add("a", "local"))
+    self.assertFalse(r.add("a", "remote"))
+    self.assertTrue(r.add("b", "remote"))
+    self.assertEqual(r.get_only("remote"), ["b"])
+    self.assertFalse(r.remove("a", "local"))
+    self.assertEqual(sorted(r.get_only("remote")), ["a", "b"])
+    self.assertTrue(r.remove("a", "remote"))
+    self.assertFalse(r.remove("a", "remote"))
+    self.assertFalse(r.has("a", "remote"))
+    self.assertEqual(r.get_only("remote", ignore="b"), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
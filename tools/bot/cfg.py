@@ -1,13 +1,216 @@
 #!/usr/bin/env python3
 from __future__ import print_function
 import os
+import time
+import struct
+import threading
+import logging
+import ctypes
+import ctypes.util
+try:
+  import queue
+except ImportError:
+  import Queue as queue
 try:
   from configparser import SafeConfigParser, Error
 except ImportError:
   from ConfigParser import SafeConfigParser, Error
 
+try:
+  from StringIO import StringIO
+except ImportError:
+  from io import StringIO
+
+from bot.wakeup import BotWakeup
+
+
+class BotCfgWatcher:
+  """watch config files with inotify
+
+     the directories of the files are watched, so files that are created
+     or replaced by an editor are noticed, too. Use create() to get a
+     watcher or None if inotify is not available.
+  """
+  IN_ATTRIB = 0x4
+  IN_CLOSE_WRITE = 0x8
+  IN_MOVED_FROM = 0x40
+  IN_MOVED_TO = 0x80
+  IN_CREATE = 0x100
+  IN_DELETE = 0x200
+  IN_Q_OVERFLOW = 0x4000
+  IN_CLOEXEC = 0o2000000
+
+  MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+         IN_CREATE | IN_DELETE
+
+  _event = struct.Struct("iIII")
+
+  def __init__(self, libc, fd, files):
+    self.libc = libc
+    self.fd = fd
+    # wd -> set of watched file names
+    self.wds = {}
+    dirs = {}
+    for f in files:
+      path = os.path.abspath(f)
+      dirs.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+    for d in dirs:
+      wd = libc.inotify_add_watch(fd, d.encode("utf-8"), self.MASK)
+      if wd >= 0:
+        self.wds[wd] = dirs[d]
+
+  @classmethod
+  def create(cls, files):
+    try:
+      libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+      init = libc.inotify_init1
+    except (OSError, AttributeError, TypeError):
+      return None
+    fd = init(os.O_NONBLOCK | cls.IN_CLOEXEC)
+    if fd < 0:
+      return None
+    w = cls(libc, fd, files)
+    if len(w.wds) == 0:
+      w.close()
+      return None
+    return w
+
+  def fileno(self):
+    return self.fd
+
+  def close(self):
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
+
+  def poll(self):
+    """return True if a watched file was touched since last poll"""
+    changed = False
+    while True:
+      try:
+        data = os.read(self.fd, 4096)
+      except OSError:
+        break
+      if len(data) == 0:
+        break
+      pos = 0
+      hdr = self._event.size
+      while pos + hdr <= len(data):
+        wd, mask, cookie, size = self._event.unpack_from(data, pos)
+        pos += hdr
+        name = data[pos:pos+size].rstrip(b"\0").decode("utf-8", "replace")
+        pos += size
+        if mask & self.IN_Q_OVERFLOW:
+          changed = True
+        elif name in self.wds.get(wd, ()):
+          changed = True
+    return changed
+
+
+def write_atomic(path, text):
+  """write text to a temp file next to path and rename it to path.
+     the mode of an existing file is kept
+  """
+  d = os.path.dirname(os.path.abspath(path))
+  tmp = os.path.join(d, ".%s.%d.tmp" % (os.path.basename(path), os.getpid()))
+  try:
+    mode = os.stat(path).st_mode & 0o7777
+  except OSError:
+    mode = None
+  try:
+    with open(tmp, "w") as fh:
+      fh.write(text)
+      fh.flush()
+      os.fsync(fh.fileno())
+    if mode is not None:
+      os.chmod(tmp, mode)
+    os.rename(tmp, path)
+  except (IOError, OSError):
+    if os.path.exists(tmp):
+      os.unlink(tmp)
+    raise
+
+
+class BotCfgWriter:
+  """write config files on a background thread
+
+     put() replaces the pending text of a file, so saves within the
+     delay are coalesced into a single write. flush() writes all
+     pending files right away.
+  """
+  def __init__(self, delay=1.0, done=None):
+    self.delay = delay
+    # done(path) is called after a file was written
+    self.done = done
+    self.cond = threading.Condition()
+    # path -> (due time, text)
+    self.pending = {}
+    self.busy = False
+    self.num_puts = 0
+    self.num_writes = 0
+    self.thread = None
+
+  def put(self, path, text, ts):
+    with self.cond:
+      self.pending[path] = (ts + self.delay, text)
+      self.num_puts += 1
+      if self.thread is None:
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+      self.cond.notify()
+
+  def flush(self):
+    """write all pending files now and wait for the thread"""
+    with self.cond:
+      while self.busy:
+        self.cond.wait()
+      pending = self.pending
+      self.pending = {}
+    for path in pending:
+      self._write(path, pending[path][1])
+
+  def _run(self):
+    while True:
+      with self.cond:
+        while True:
+          ts = time.time()
+          due = [p for p in self.pending if self.pending[p][0] <= ts]
+          if len(due) > 0:
+            break
+          if len(self.pending) == 0:
+            self.cond.wait()
+          else:
+            timeout = min(e[0] for e in self.pending.values()) - ts
+            self.cond.wait(timeout)
+        items = [(p, self.pending.pop(p)[1]) for p in due]
+        self.busy = True
+      try:
+        for path, text in items:
+          self._write(path, text)
+      finally:
+        with self.cond:
+          self.busy = False
+          self.cond.notify_all()
+
+  def _write(self, path, text):
+    try:
+      write_atomic(path, text)
+    except (IOError, OSError) as e:
+      logging.error("cfg: can't write '%s': %s", path, e)
+      return
+    self.num_writes += 1
+    if self.done is not None:
+      self.done(path)
+
+
 class BotCfg:
-  """manage a configuration in a *.cfg file"""
+  """manage a configuration in a *.cfg file
+
+     the files are parsed once and typed sections are cached. load()
+     parses again only if a file changed. check() reloads changed files
+     and passes changed keys of the sections in use to the listeners.
+  """
   def __init__(self, name, force_cfg_file=None):
     self.name = name
     self.force_cfg_file = force_cfg_file
@@ -15,6 +218,19 @@ class BotCfg:
     self.home_cfg_file = os.path.expanduser("~/." + file_name)
     self.cwd_cfg_file = file_name
     self.cfg = SafeConfigParser()
+    # state of last parse: stat of candidate files and files read
+    self._stamps = None
+    self._paths = None
+    # section name -> (def_dict, typed values)
+    self._sections = {}
+    self._listeners = []
+    self._watcher = None
+    self._writer = None
+    # background saves: (path, stamps) handed from the writer thread
+    # to handle_saved() and the done callbacks waiting for a path
+    self._saves = queue.Queue()
+    self._save_done = {}
+    self._save_wakeup = None
 
   def __repr__(self):
     return "[BotCfg:read=%s,write=%s,%s]" % \
@@ -45,21 +261,103 @@ class BotCfg:
     else:
       return self.home_cfg_file
 
+  def _get_cand_files(self):
+    files = [self.cwd_cfg_file, self.home_cfg_file]
+    if self.force_cfg_file is not None:
+      files.append(self.force_cfg_file)
+    return files
+
+  def _get_stamps(self):
+    stamps = []
+    for f in self._get_cand_files():
+      try:
+        st = os.stat(f)
+        stamps.append((st.st_mtime, st.st_size))
+      except OSError:
+        stamps.append(None)
+    return stamps
+
   def load(self):
-    """load config from file
-       returns the config file or None
+    """load config from file. files are parsed again only if changed
+       returns the config files or None
     """
+    stamps = self._get_stamps()
+    if self._paths is not None and stamps == self._stamps:
+      return self._paths
+    return self._parse(stamps)
+
+  def _parse(self, stamps):
     cfg_files = self._get_read_files()
     if cfg_files is None:
       return None
-    # parse config
+    # parse config into a fresh parser
+    cfg = SafeConfigParser()
     try:
-      self.cfg.read(cfg_files)
-      return cfg_files
+      cfg.read(cfg_files)
     except Error:
       return None
     except IOError:
       return None
+    self.cfg = cfg
+    self._stamps = stamps
+    self._paths = cfg_files
+    return cfg_files
+
+  # ----- change watching -----
+
+  def add_listener(self, listener):
+    """listener(section_name, changed_values) is called by check()"""
+    self._listeners.append(listener)
+
+  def remove_listener(self, listener):
+    self._listeners.remove(listener)
+
+  def watch(self):
+    """use inotify to detect changes if available. else check() polls"""
+    if self._watcher is None:
+      self._watcher = BotCfgWatcher.create(self._get_cand_files())
+    return self._watcher is not None
+
+  def fileno(self):
+    """return fd readable on changes if watched with inotify or None"""
+    if self._watcher is None:
+      return None
+    return self._watcher.fileno()
+
+  def unwatch(self):
+    if self._watcher is not None:
+      self._watcher.close()
+      self._watcher = None
+
+  def check(self):
+    """reload changed config files and notify listeners of changed keys
+       return True if the config was reloaded
+    """
+    if self._watcher is not None and not self._watcher.poll():
+      return False
+    # own background saves are no change
+    self.handle_saved()
+    stamps = self._get_stamps()
+    if stamps == self._stamps:
+      return False
+    if self._parse(stamps) is None:
+      # keep old config
+      self._stamps = stamps
+      return False
+    # refresh typed sections and report changes
+    sections = self._sections
+    self._sections = {}
+    for name in sorted(sections):
+      def_dict, old = sections[name]
+      new = self.get_section(name, def_dict)
+      changed = {}
+      for key in new:
+        if old.get(key) != new[key]:
+          changed[key] = new[key]
+      if len(changed) > 0:
+        for listener in list(self._listeners):
+          listener(name, changed)
+    return True
 
   def save(self):
     """save config to file
@@ -68,14 +366,70 @@ class BotCfg:
     if cfg_file is None:
       return None
     try:
-      fh = open(cfg_file, "w")
-      self.cfg.write(fh)
-      fh.close()
+      write_atomic(cfg_file, self._format())
+      # own write is no change to report
+      self._stamps = self._get_stamps()
       return cfg_file
     except Error:
       return None
-    except IOError:
+    except (IOError, OSError):
+      return None
+
+  def save_later(self, delay=1.0, done=None):
+    """save config to file on a background thread after delay seconds.
+       done(path) is called by handle_saved() after the file was written
+       return the config file or None"""
+    cfg_file = self._get_write_file()
+    if cfg_file is None:
+      return None
+    try:
+      text = self._format()
+    except Error:
       return None
+    if self._writer is None:
+      self._writer = BotCfgWriter(delay, self._saved)
+    self._writer.delay = delay
+    if done is not None:
+      self._save_done.setdefault(cfg_file, []).append(done)
+    self._writer.put(cfg_file, text, time.time())
+    return cfg_file
+
+  def saved_fileno(self):
+    """return fd readable after a background save. call handle_saved()"""
+    if self._save_wakeup is None:
+      self._save_wakeup = BotWakeup()
+    return self._save_wakeup.fileno()
+
+  def handle_saved(self):
+    """finish background saves in the thread using the config"""
+    if self._save_wakeup is not None:
+      self._save_wakeup.clear()
+    while True:
+      try:
+        cfg_file, stamps = self._saves.get(False)
+      except queue.Empty:
+        break
+      # own write is no change to report
+      self._stamps = stamps
+      for done in self._save_done.pop(cfg_file, []):
+        done(cfg_file)
+
+  def flush(self):
+    """write a pending save now"""
+    if self._writer is not None:
+      self._writer.flush()
+      self.handle_saved()
+
+  def _format(self):
+    fh = StringIO()
+    self.cfg.write(fh)
+    return fh.getvalue()
+
+  def _saved(self, cfg_file):
+    # writer thread: hand over to handle_saved()
+    self._saves.put((cfg_file, self._get_stamps()))
+    if self._save_wakeup is not None:
+      self._save_wakeup.wake()
 
   def _read_value(self, def_value, value):
     if def_value is None:
@@ -109,6 +463,9 @@ class BotCfg:
     """give a default section and look up values in config
       return new section dictionary with config and default values
     """
+    cached = self._sections.get(name)
+    if cached is not None and cached[0] == def_dict:
+      return dict(cached[1])
     # make sure parser has section
     if not self.cfg.has_section(name):
       self.cfg.add_section(name)
@@ -128,7 +485,8 @@ class BotCfg:
         self.cfg.set(name, key, self._write_value(value))
         # return default
         result[key] = value
-    return result
+    self._sections[name] = (dict(def_dict), result)
+    return dict(result)
 
   def set_section(self, name, val_dict):
     """give new values for a section"""
@@ -139,6 +497,9 @@ class BotCfg:
     for key in val_dict:
       value = val_dict[key]
       self.cfg.set(name, key, self._write_value(value))
+    # typed values are outdated
+    if name in self._sections:
+      del self._sections[name]
 
 
 if __name__ == '__main__':
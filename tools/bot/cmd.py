@@ -1,11 +1,16 @@
 from __future__ import print_function
 
 class BotCmd:
-  """a bot command"""
-  def __init__(self, name, arg_types=None, callee=None):
+  """a bot command
+
+     with var_args the last of the arg_types is repeated for any number
+     of extra args.
+  """
+  def __init__(self, name, arg_types=None, callee=None, var_args=False):
     self.name = name
     self.arg_types = arg_types
     self.callee = callee
+    self.var_args = var_args
 
   def get_name(self):
     return self.name
@@ -28,14 +33,19 @@ class BotCmd:
       return True
     # check args
     else:
-      if n != len(self.arg_types) + 1:
+      arg_types = self.arg_types
+      if self.var_args:
+        if n < len(arg_types):
+          return "Wrong number of args"
+        arg_types = arg_types[:-1] + (arg_types[-1],) * (n - len(arg_types))
+      elif n != len(arg_types) + 1:
         return "Wrong number of args"
       params = []
       off = 1
-      for t in self.arg_types:
+      for t in arg_types:
         res = self._parse_arg(t, args[off])
         if res is None:
-          return "Wrong argument @" + off
+          return "Wrong argument @" + str(off)
         off += 1
         params.append(res)
       self.callee(sender, params)
@@ -57,6 +67,11 @@ class BotCmd:
         return int(a)
       except ValueError:
         return None
+    elif t is float:
+      try:
+        return float(a)
+      except ValueError:
+        return None
     else:
       return None
 
@@ -19,10 +19,12 @@ class BotEvent(BotCmd):
   STOP = "stop"
   TICK = "tick"
   UPDATE_FIELD = "update_field"
+  UPDATE_FIELDS = "update_fields"
+  WAKEUP = "wakeup"
   MOD_LIST = "mod_list"
 
-  def __init__(self, mod_name, name, arg_types=None, callee=None):
-    BotCmd.__init__(self, name, arg_types, callee)
+  def __init__(self, mod_name, name, arg_types=None, callee=None, var_args=False):
+    BotCmd.__init__(self, name, arg_types, callee, var_args)
     self.mod_name = mod_name + ".event"
 
   def handle_event(self, args, sender):
@@ -87,11 +89,25 @@ class TickEvent(InternalEvent):
     InternalEvent.__init__(self, BotEvent.TICK, callee)
 
 
+class WakeupEvent(InternalEvent):
+  """the wakeup fd of the module is readable. callee(ts)"""
+  def __init__(self, callee=None):
+    InternalEvent.__init__(self, BotEvent.WAKEUP, callee)
+
+
 class UpdateFieldEvent(InternalEvent):
   def __init__(self, callee=None):
     InternalEvent.__init__(self, BotEvent.UPDATE_FIELD, callee)
 
 
+class UpdateFieldsEvent(InternalEvent):
+  """a batch of fields changed by set_many. callee(fields)
+     modules without this event get an UpdateFieldEvent per field
+  """
+  def __init__(self, callee=None):
+    InternalEvent.__init__(self, BotEvent.UPDATE_FIELDS, callee)
+
+
 # ----- test -----
 if __name__ == '__main__':
   be = BotEvent("foo","bar", arg_types=(str, bool, int), callee=print)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# length prefixed framing of bot messages
+#
+# a frame is a 4 byte big endian payload size followed by the payload.
+# the payload holds NUL separated fields:
+#   sender, receivers (comma separated), arg, arg, ...
+# an empty receivers field means no receivers (None).
+
+from __future__ import print_function
+
+import sys
+import struct
+
+_header = struct.Struct("!I")
+
+# frames larger than this are considered a protocol error
+MAX_FRAME_SIZE = 1024 * 1024
+
+_py3 = sys.version_info[0] > 2
+
+
+def encode_frame(sender, receivers, args):
+  """return the frame of a message as bytes"""
+  if receivers is None:
+    rcv = ""
+  else:
+    rcv = ",".join(receivers)
+  if sender is None:
+    sender = ""
+  fields = [sender, rcv] + [str(a) for a in args]
+  payload = "\0".join(fields)
+  if _py3:
+    payload = payload.encode("utf-8")
+  return _header.pack(len(payload)) + payload
+
+
+def decode_payload(payload):
+  """return (sender, receivers, args) of a frame payload"""
+  if _py3:
+    payload = payload.decode("utf-8", "replace")
+  fields = payload.split("\0")
+  if len(fields) < 2:
+    raise ValueError("invalid frame")
+  rcv = fields[1]
+  if rcv == "":
+    receivers = None
+  else:
+    receivers = rcv.split(",")
+  return fields[0], receivers, fields[2:]
+
+
+class BotFrameDecoder:
+  """split a byte stream into decoded frames"""
+  def __init__(self):
+    self.data = b""
+
+  def feed(self, data):
+    """add data and return list of complete (sender, receivers, args)"""
+    data = self.data + data
+    result = []
+    pos = 0
+    end = len(data)
+    hdr = _header.size
+    while end - pos >= hdr:
+      size = _header.unpack_from(data, pos)[0]
+      if size > MAX_FRAME_SIZE:
+        raise ValueError("frame too large: %d" % size)
+      if end - pos - hdr < size:
+        break
+      pos += hdr
+      result.append(decode_payload(data[pos:pos+size]))
+      pos += size
+    self.data = data[pos:]
+    return result
+
+
+# ----- test -----
+if __name__ == '__main__':
+  f = encode_frame("me", ["a","b"], ["audio.event", "level", 1, "a b"])
+  f += encode_frame("", None, ["bot", "ping"])
+  d = BotFrameDecoder()
+  print(d.feed(f[:5]))
+  print(d.feed(f[5:]))
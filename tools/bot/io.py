@@ -7,8 +7,74 @@ import select
 import sys
 import os
 import time
+import re
+import collections
 
 import bot.cfg
+from bot.frame import encode_frame, BotFrameDecoder
+
+# a token is a run of plain chars and "quoted strings" with backslash escapes.
+# an unterminated string extends to the end of the line.
+_token_re = re.compile(r'(?:[^ \t"]+|"(?:[^"\\]|\\.)*(?:"|\\?\Z))+', re.S)
+_string_re = re.compile(r'"((?:[^"\\]|\\.)*)(?:"|\\?\Z)', re.S)
+_escape_re = re.compile(r'\\(.)', re.S)
+_plain_re = re.compile(r'[^ \t]+')
+
+def _unquote_string(m):
+  return _escape_re.sub(r'\1', m.group(1))
+
+def split_args(line):
+  """split a line into arguments separated by blanks or tabs.
+     double quoted strings may contain blanks and backslash escapes.
+     return the list of arguments
+  """
+  # fast path: no strings in line
+  if '"' not in line:
+    return _plain_re.findall(line)
+  args = _token_re.findall(line)
+  for i in range(len(args)):
+    a = args[i]
+    if '"' in a:
+      args[i] = _string_re.sub(_unquote_string, a)
+  return args
+
+def quote_arg(txt):
+  """quote an argument so that split_args() returns it unchanged"""
+  if txt == '' or '"' in txt or ' ' in txt or '\t' in txt or '\\' in txt:
+    return '"' + txt.replace('\\', '\\\\').replace('"', '\\"') + '"'
+  else:
+    return txt
+
+def format_args(args):
+  """join args to a line. the inverse of split_args()"""
+  return " ".join([quote_arg(str(a)) for a in args])
+
+
+class BotArgsCache:
+  """a small LRU cache of lines and their parsed args"""
+  def __init__(self, size=128):
+    self.size = size
+    self.cache = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def split_args(self, line):
+    """return the args of the line as a new list"""
+    cache = self.cache
+    args = cache.pop(line, None)
+    if args is None:
+      self.misses += 1
+      args = tuple(split_args(line))
+      if len(cache) >= self.size:
+        cache.popitem(last=False)
+    else:
+      self.hits += 1
+    # (re-)insert as most recently used entry
+    cache[line] = args
+    return list(args)
+
+_args_cache = BotArgsCache()
+
 
 class BotIOMsg:
   def __init__(self, line, sender, receivers, is_internal):
@@ -22,41 +88,7 @@ class BotIOMsg:
     self.ts = None
 
   def split_args(self):
-    args = []
-    cur = None
-    in_str = False
-    quote = False
-    for c in self.line:
-      # string handling
-      if in_str:
-        if quote:
-          cur += c
-          quote = False
-        else:
-          if c == '\\':
-            quote = True
-          elif c == '"':
-            in_str = False
-          else:
-            cur += c
-      # no string
-      elif c not in (" ","\t"):
-        if cur is None:
-          cur = ""
-        if c == '"':
-          in_str = True
-        else:
-          cur += c
-      # white space
-      else:
-        # append last string
-        if cur is not None:
-          args.append(cur)
-          cur = None
-    # append last
-    if cur is not None:
-      args.append(cur)
-    self.args = args
+    self.args = _args_cache.split_args(self.line)
 
   def __str__(self):
     if self.receivers is None:
@@ -68,8 +100,37 @@ class BotIOMsg:
 class BotIO:
   """small helpers to read and write commands to the stdin/stdout bot pipe"""
 
+  # max bytes fetched from stdin with a single read
+  READ_SIZE = 65536
+
+  # framing modes supported besides text lines
+  FRAMINGS = ('frame',)
+  # text line that switches a stream to framed mode
+  FRAMING_SWITCH = "!framing frame"
+
   def __init__(self, verbose=False):
     self._verbose = verbose
+    # input buffer: raw data of an incomplete line and already split lines
+    self._in_fd = sys.stdin.fileno()
+    self._in_data = b""
+    self._in_lines = collections.deque()
+    self._in_eof = False
+    # extra fds found ready by the last read_msgs()
+    self._ready_fds = []
+    # framing: decoder of framed input. switch line expected if offered
+    self._in_frames = None
+    self._in_switch = False
+    self._out_framed = False
+    # output buffer: in buffered mode lines are collected until flush()
+    self._out_fd = sys.stdout.fileno()
+    self._out_buf = []
+    self._out_notify = None
+    self._buffered = False
+    # output stats: flushes, lines, bytes, lines and bytes of last flush
+    self._out_flushes = 0
+    self._out_lines = 0
+    self._out_bytes = 0
+    self._out_last = (0, 0)
     # no bot connected? fake nick
     if os.isatty(sys.stdin.fileno()):
       self._nick = "fake"
@@ -79,17 +140,23 @@ class BotIO:
     else:
       self._nick = None
       # wait for init command by bot
-      l = sys.stdin.readline()
-      line = l.strip()
+      while len(self._in_lines) == 0 and not self._in_eof:
+        self._read_chunk(None)
+      if len(self._in_lines) == 0:
+        raise ValueError("no init by bot: eof")
+      line = self._in_lines.popleft()
       msg = self._parse_line(line)
-      if not msg or len(msg.args) != 4:
-        raise ValueError("no init by bot: " + str(msg.args))
+      if not msg or len(msg.args) not in (4, 5):
+        raise ValueError("no init by bot: " + line)
       self._nick = msg.sender
       self._cmd_name = msg.args[1]
       self._cfg_name = msg.args[2]
       force_cfg = msg.args[3]
       if force_cfg == 'None':
         force_cfg = None
+      # optional framing offered by bot
+      if len(msg.args) == 5:
+        self._init_framing(msg.args[4].split(','))
     # show nick
     if verbose:
       print("botio: init: nick='%s' cmd_name='%s' cfg_name='%s' force_cfg=%s" % \
@@ -100,6 +167,19 @@ class BotIO:
     self._cfg = bot.cfg.BotCfg(self._cfg_name, force_cfg)
     self._cfg_paths = self._cfg.load()
 
+  def _init_framing(self, offered):
+    """accept framing if offered: ack with switch line and frame output"""
+    if 'frame' not in offered:
+      return
+    self.write_line(self.FRAMING_SWITCH, urgent=True)
+    self._out_framed = True
+    # input switches after the switch line of the bot
+    self._in_switch = True
+
+  def is_framed(self):
+    """return (input_framed, output_framed)"""
+    return (self._in_frames is not None, self._out_framed)
+
   def get_nick(self):
     return self._nick
 
@@ -132,21 +212,35 @@ class BotIO:
         if len(receivers) == 1 and receivers[0] == '':
           receivers = None
 
-        # a message from my nick is considered internal
-        is_internal = sender == self._nick
+        return self._new_msg(line, sender, receivers)
+    # something went wrong
+    return None
 
-        msg = BotIOMsg(line, sender, receivers, is_internal)
-        msg.ts = time.time()
-        msg.split_args()
+  def _parse_item(self, item):
+    """return BotIOMsg of a buffered text line or decoded frame or None"""
+    if type(item) is tuple:
+      sender, receivers, args = item
+      return self._new_msg(format_args(args), sender, receivers, args)
+    else:
+      return self._parse_line(item)
 
-        # parse internal message
-        if is_internal:
-          if not self._parse_internal(msg):
-            return None
+  def _new_msg(self, line, sender, receivers, args=None):
+    # a message from my nick is considered internal
+    is_internal = sender == self._nick
 
-        return msg
-    # something went wrong
-    return None
+    msg = BotIOMsg(line, sender, receivers, is_internal)
+    msg.ts = time.time()
+    if args is None:
+      msg.split_args()
+    else:
+      msg.args = args
+
+    # parse internal message
+    if is_internal:
+      if not self._parse_internal(msg):
+        return None
+
+    return msg
 
   def _parse_internal(self, msg):
     """parse message from xmppbot"""
@@ -178,33 +272,117 @@ class BotIO:
   def get_roster(self):
     return self._roster
 
+  def is_eof(self):
+    """has the bot closed our input pipe?"""
+    return self._in_eof and len(self._in_lines) == 0
+
+  def _read_chunk(self, timeout, fds=None):
+    """wait for input and read all available data with a single read
+       also wait for the extra fds and keep the ready ones
+       return True if new data arrived or False on timeout/eof
+    """
+    if self._in_eof:
+      return False
+    if fds:
+      (r,w,x) = select.select([self._in_fd] + fds,[],[], timeout)
+      self._ready_fds = [fd for fd in r if fd != self._in_fd]
+    else:
+      (r,w,x) = select.select([self._in_fd],[],[], timeout)
+    if self._in_fd not in r:
+      return False
+    data = os.read(self._in_fd, self.READ_SIZE)
+    if len(data) == 0:
+      self._in_eof = True
+      return False
+    self._feed(data)
+    return True
+
+  def _feed(self, data):
+    """add raw input data and split off all complete lines or frames"""
+    if self._in_frames is not None:
+      self._in_lines.extend(self._in_frames.feed(data))
+      return
+    data = self._in_data + data
+    lines = data.split(b"\n")
+    # last entry is an incomplete line (or empty)
+    self._in_data = lines.pop()
+    for i in range(len(lines)):
+      l = lines[i]
+      if sys.version_info[0] > 2:
+        l = l.decode("utf-8", "replace")
+      line = l.strip()
+      if self._verbose:
+        print("botio: got '%s'" % line, file=sys.stderr)
+      # switch to framed input: remainder of data is framed
+      if self._in_switch and line == self.FRAMING_SWITCH:
+        self._in_switch = False
+        self._in_frames = BotFrameDecoder()
+        rest = b"\n".join(lines[i+1:] + [self._in_data])
+        self._in_data = b""
+        self._in_lines.extend(self._in_frames.feed(rest))
+        return
+      self._in_lines.append(line)
+
+  def feed(self, data):
+    """add input data read by someone else (e.g. an event loop).
+       empty data marks the end of input
+    """
+    if len(data) == 0:
+      self._in_eof = True
+    else:
+      self._feed(data)
+
+  def read_msgs(self, timeout=0.1, internal=False, fds=None):
+    """return all messages that are currently available
+
+       waits up to timeout for new input if nothing is buffered.
+       returns a (possibly empty) list of BotIOMsg. invalid lines are dropped.
+       the wait also ends if one of the extra fds is readable: see
+       get_ready_fds()
+    """
+    self._ready_fds = []
+    if len(self._in_lines) == 0:
+      self._read_chunk(timeout, fds)
+    return self.pop_msgs(internal)
+
+  def get_ready_fds(self):
+    """return the extra fds that were readable in the last read_msgs()"""
+    return self._ready_fds
+
+  def pop_msgs(self, internal=False):
+    """return all messages of the already buffered input lines"""
+    result = []
+    lines = self._in_lines
+    while len(lines) > 0:
+      msg = self._parse_item(lines.popleft())
+      if msg:
+        if not internal or msg.is_internal:
+          result.append(msg)
+    return result
+
   def read_line(self, timeout=0.1, internal=False):
     """return next line from bot or None if nothing was received
        return (line, sender, [receiver, ...])
        return False if line is invalid or None on timeout
     """
     while True:
-      (r,w,x) = select.select([sys.stdin],[],[], timeout)
-      if sys.stdin in r:
-        l = sys.stdin.readline()
-        line = l.strip()
-        if self._verbose:
-          print("botio: got '%s'" % line, file=sys.stderr)
-        msg = self._parse_line(line)
-        if msg:
-          # if its internal and return internal then report it
-          # otherwise loop
-          if internal:
-            if msg.is_internal:
-              return msg
-          else:
+      if len(self._in_lines) == 0:
+        if not self._read_chunk(timeout):
+          # timeout
+          return None
+        continue
+      msg = self._parse_item(self._in_lines.popleft())
+      if msg:
+        # if its internal and return internal then report it
+        # otherwise loop
+        if internal:
+          if msg.is_internal:
             return msg
         else:
-          # parse error of message
-          return False
+          return msg
       else:
-        # timeout
-        return None
+        # parse error of message
+        return False
 
   def read_args(self, timeout=0.1):
     """already split line into args"""
@@ -213,40 +391,85 @@ class BotIO:
       result.split_args()
     return result
 
-  def write_line(self, msg, receivers=None):
-    """write a line"""
+  def set_buffered(self, on):
+    """enable buffered output: lines are only written on flush()"""
+    self._buffered = on
+    if not on:
+      self.flush()
+
+  def is_buffered(self):
+    return self._buffered
+
+  def set_write_notifier(self, notify):
+    """call notify() whenever a line enters an empty output buffer"""
+    self._out_notify = notify
+
+  def write_line(self, msg, receivers=None, urgent=False):
+    """write a line
+
+       in buffered mode the line is queued until the next flush()
+       unless it is marked urgent.
+    """
+    if self._out_framed:
+      self._write_frame(split_args(msg), receivers, urgent)
+      return
     if receivers is not None:
       msg = ",".join(receivers) + "|" + msg
     if self._verbose:
       print("botio: put '%s'" % msg, file=sys.stderr)
-    sys.stdout.write(msg + "\n")
-    sys.stdout.flush()
+    self._out_buf.append(msg)
+    if urgent or not self._buffered:
+      self.flush()
+    elif self._out_notify is not None and len(self._out_buf) == 1:
+      self._out_notify()
 
-  def write_args(self, args, receivers=None):
-    result = []
-    for a in args:
-      # convert to string
-      a = str(a)
-      # does it contain quotable chars
-      if '"' in a or ' ' in a or '\\' in a:
-        a = self._quote(a)
-      result.append(a)
-    self.write_line(" ".join(result), receivers)
-
-  def _quote(self, txt):
-    result = []
-    result.append('"')
-    for c in txt:
-      if c == '"':
-        result.append('\\')
-        result.append('"')
-      elif c == '\\':
-        result.append('\\')
-        result.append('\\')
-      else:
-        result.append(c)
-    result.append('"')
-    return "".join(result)
+  def write_args(self, args, receivers=None, urgent=False):
+    if self._out_framed:
+      self._write_frame(args, receivers, urgent)
+    else:
+      self.write_line(format_args(args), receivers, urgent)
+
+  def _write_frame(self, args, receivers, urgent):
+    if self._verbose:
+      print("botio: put frame", receivers, args, file=sys.stderr)
+    self._out_buf.append(encode_frame(None, receivers, args))
+    if urgent or not self._buffered:
+      self.flush()
+    elif self._out_notify is not None and len(self._out_buf) == 1:
+      self._out_notify()
+
+  def flush(self):
+    """write all buffered lines with a single write"""
+    buf = self._out_buf
+    num = len(buf)
+    if num == 0:
+      return
+    if self._out_framed:
+      data = b"".join(buf)
+    else:
+      buf.append("")
+      data = "\n".join(buf)
+      if sys.version_info[0] > 2:
+        data = data.encode("utf-8")
+    self._out_buf = []
+    size = len(data)
+    while len(data) > 0:
+      n = os.write(self._out_fd, data)
+      data = data[n:]
+    # update stats
+    self._out_flushes += 1
+    self._out_lines += num
+    self._out_bytes += size
+    self._out_last = (num, size)
+
+  def get_write_stats(self):
+    """return output stats: (flushes, lines, bytes, (last_lines, last_bytes))"""
+    return (self._out_flushes, self._out_lines, self._out_bytes, self._out_last)
+
+  def reset_write_stats(self):
+    self._out_flushes = 0
+    self._out_lines = 0
+    self._out_bytes = 0
 
 
 # ----- test -----
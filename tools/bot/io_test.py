@@ -0,0 +1,86 @@
+# unittests for the bot line tokenizer
+
+import unittest
+import random
+
+from bot.io import split_args, quote_arg, format_args, BotArgsCache
+
+
+def legacy_split_args(line):
+  """reference: the original char by char tokenizer of BotIOMsg.
+     also used by bench/split_args.py
+  """
+  args = []
+  cur = None
+  in_str = False
+  quote = False
+  for c in line:
+    if in_str:
+      if quote:
+        cur += c
+        quote = False
+      elif c == '\\':
+        quote = True
+      elif c == '"':
+        in_str = False
+      else:
+        cur += c
+    elif c not in (" ","\t"):
+      if cur is None:
+        cur = ""
+      if c == '"':
+        in_str = True
+      else:
+        cur += c
+    elif cur is not None:
+      args.append(cur)
+      cur = None
+  if cur is not None:
+    args.append(cur)
+  return args
+
+
+class SplitArgsTests(unittest.TestCase):
+  def test_plain(self):
+    self.assertEqual(split_args("audio.event level 1 2 3"),
+                     ["audio.event", "level", "1", "2", "3"])
+    self.assertEqual(split_args(" a \t b  "), ["a", "b"])
+    self.assertEqual(split_args(""), [])
+
+  def test_strings(self):
+    self.assertEqual(split_args('a "b c" d'), ["a", "b c", "d"])
+    self.assertEqual(split_args('a"b c"d'), ["ab cd"])
+    self.assertEqual(split_args('"x\\"y" ""'), ['x"y', ''])
+    self.assertEqual(split_args('a\\b'), ['a\\b'])
+    # unterminated strings run to end of line
+    self.assertEqual(split_args('a "b c'), ["a", "b c"])
+    self.assertEqual(split_args('"b\\'), ["b"])
+
+  def test_legacy_fuzz(self):
+    rnd = random.Random(42)
+    chars = 'ab "\\\t'
+    for i in range(5000):
+      n = rnd.randint(0, 12)
+      line = "".join([rnd.choice(chars) for j in range(n)])
+      self.assertEqual(split_args(line), legacy_split_args(line), repr(line))
+
+  def test_quote_roundtrip(self):
+    args = ["a", "", "b c", 'q"q', "back\\slash", "t\tab", 42, None]
+    line = format_args(args)
+    self.assertEqual(split_args(line), [str(a) for a in args])
+    self.assertEqual(quote_arg("plain"), "plain")
+
+  def test_cache(self):
+    cache = BotArgsCache(size=2)
+    a = cache.split_args("bot ping")
+    a.append("x")
+    self.assertEqual(cache.split_args("bot ping"), ["bot", "ping"])
+    self.assertEqual(cache.hits, 1)
+    cache.split_args("a")
+    cache.split_args("b")
+    self.assertEqual(len(cache.cache), 2)
+    self.assertFalse("bot ping" in cache.cache)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -6,13 +6,24 @@ import sys
 import importlib
 import traceback
 
-from bot.io import BotIO, BotIOMsg
+from bot.io import BotIO, BotIOMsg, format_args
 from bot.cmd import BotCmd
 from bot.opts import BotOpts
 from bot.event import BotEvent
+from bot.sched import BotScheduler
+from bot.stats import BotStats
+from bot.request import BotRequests
 
 class Bot:
   """main class for a bot instance"""
+
+  # check interval of request timeouts in s
+  REQUEST_CHECK = 0.25
+  # default request timeout in s. peers without 'bot multi' do not reply
+  REQUEST_TIMEOUT = 1
+  # poll interval in s of modules without tick: they may enable it later
+  TICK_RECHECK = 5
+
   def __init__(self, verbose=False):
     self.modules = []
     self.bio = None
@@ -23,6 +34,21 @@ class Bot:
     self.verbose = verbose
     self.connected = False
     self.rem_mods = {}
+    self.stats = None
+    self.stats_file = None
+    self.stats_interval = 0
+    self.cfg_watch = 0
+    self.save_delay = 0
+    # pending requests to peers and their expiry timer
+    self.requests = BotRequests()
+    self.request_timer = None
+    # (requester, replies, module name) while a multi command runs
+    self.capture = None
+    # fd -> func(ts) called when fd is readable
+    self.wakeups = {}
+    # modules with tick interval 0 and the timer polling them
+    self.untick_mods = []
+    self.recheck_timer = None
 
   def add_module(self, module):
     """add a module to the bot"""
@@ -52,17 +78,34 @@ class Bot:
     self.cfg_paths = self.bio.get_cfg_paths()
     self._log("bot: got nick='%s' cmd_name='%s' cfg_name='%s' cfg_paths=%s" % \
       (self.nick, self.cmd_name, self.cfg_name, self.cfg_paths))
-
-  def _gen_funcs(self, name, other_mod):
+    # bot config
+    def_cfg = {
+      'buffered_output' : True,
+      'stats' : True,
+      'stats_file' : None,
+      'stats_interval' : 60,
+      'cfg_watch' : 2,
+      'save_delay' : 1.0
+    }
+    bot_cfg = self.bio.get_cfg().get_section("bot", def_cfg)
+    self._log("bot: config", bot_cfg)
+    self.bio.set_buffered(bot_cfg['buffered_output'])
+    if bot_cfg['stats']:
+      self.stats = BotStats()
+      self.stats_file = bot_cfg['stats_file']
+      self.stats_interval = bot_cfg['stats_interval']
+    # watch config for changes: 0 disables. without inotify it is the
+    # poll interval in s
+    self.cfg_watch = bot_cfg['cfg_watch']
+    self.save_delay = bot_cfg['save_delay']
+    if self.cfg_watch > 0:
+      watch = self.bio.get_cfg().watch()
+      self._log("bot: watch config with", "inotify" if watch else "polling")
+
+  def _gen_funcs(self, name, mod):
     # set reply function for module
-    def send(args, to=None):
-      self.bio.write_args(args, receivers=to)
-      # internal loop back
-      if to is None or self.nick in to:
-        a = map(str, args)
-        msg = BotIOMsg(" ".join(a), self.nick, to, False)
-        msg.split_args()
-        self._handle_msg(msg, other_mod)
+    def send(args, to=None, urgent=False):
+      self._send(args, to, urgent, mod)
 
     # set log function
     def log(*args):
@@ -71,6 +114,19 @@ class Bot:
 
     return send, log
 
+  def _send(self, args, to=None, urgent=False, mod=None):
+    """write a line. mod is the sending module or None for the bot"""
+    line = format_args(args)
+    if self.capture is not None and self._capture_line(line, to, mod):
+      return
+    self.bio.write_line(line, receivers=to, urgent=urgent)
+    # internal loop back: parse the same line a peer will see
+    if to is None or self.nick in to:
+      msg = BotIOMsg(line, self.nick, to, False)
+      msg.ts = time.time()
+      msg.split_args()
+      self._handle_msg(msg, mod)
+
   def _auto_add_modules(self):
     """auto add modules from config"""
     cfg = self.bio.get_cfg()
@@ -104,60 +160,76 @@ class Bot:
       raise RuntimeError("No modules added!")
     self.bot_tick_interval = 1
     for m in self.modules:
-      name = m.get_name()
+      self._setup_module(m)
+
+    # report bot tick
+    self._log("bot: tick", self.bot_tick_interval)
 
-      # other modules
-      other_mod = []
-      for m2 in self.modules:
-        if m2 != m:
-          other_mod.append(m2)
+  def _setup_module(self, m):
+    name = m.get_name()
 
-      send, log = self._gen_funcs(name, other_mod)
+    send, log = self._gen_funcs(name, m)
 
-      # get bot config
-      cfg = self.bio.get_cfg()
+    # get bot config
+    cfg = self.bio.get_cfg()
 
-      # has options?
-      opts = m.get_opts()
-      bo = None
-      if opts is not None:
+    # has options?
+    opts = m.get_opts()
+    bo = None
+    if opts is not None:
 
-        def send_mod_event(args, to=None):
-          a = [name + ".event"] + args
-          send(a, to=to)
+      def send_mod_event(args, to=None):
+        a = [name + ".event"] + args
+        send(a, to=to)
 
-        cfg_name = m.get_opts_name()
-        bo = BotOpts(send_mod_event, opts, cfg=cfg, cfg_name=cfg_name)
+      cfg_name = m.get_opts_name()
+      bo = BotOpts(send_mod_event, opts, cfg=cfg, cfg_name=cfg_name,
+                   save_delay=self.save_delay)
 
-        def field_handler(field):
-          self._trigger_internal_event(BotEvent.UPDATE_FIELD, [field], mods=[m])
+      def field_handler(field):
+        self._trigger_internal_event(BotEvent.UPDATE_FIELD, [field], mods=[m])
 
-        bo.set_notifier(field_handler)
-        self._log("bot: module",name,"opts:", bo.get_values())
+      def fields_handler(fields):
+        if (m, BotEvent.UPDATE_FIELDS) in self.mod_internal_index:
+          self._trigger_internal_event(BotEvent.UPDATE_FIELDS, [fields], mods=[m])
+        else:
+          for field in fields:
+            field_handler(field)
 
-      # setup bot
-      m.nick = self.nick
-      m.bot = self
-      m.setup(send, log, cfg, bo)
+      bo.set_notifier(field_handler, fields_handler)
+      self._log("bot: module",name,"opts:", bo.get_values())
 
-      # get tick (after setup of bot)
-      tick = m.get_tick_interval()
-      self._log("bot: module",name,"tick",tick)
-      if tick > 0 and tick < self.bot_tick_interval:
-        self.bot_tick_interval = tick
+    # setup bot
+    m.nick = self.nick
+    m.bot = self
+    m.setup(send, log, cfg, bo)
 
-    # report bot tick
-    self._log("bot: tick", self.bot_tick_interval)
+    # wakeup fd
+    fd = m.get_wakeup_fd()
+    if fd is not None:
+      self.add_wakeup(fd, self._gen_wakeup(m))
+
+    # get tick (after setup of bot)
+    tick = m.get_tick_interval()
+    self._log("bot: module",name,"tick",tick)
+    if tick > 0 and tick < self.bot_tick_interval:
+      self.bot_tick_interval = tick
 
   def _setup_cmds(self):
     self.cmds = [
       BotCmd("lsmod",callee=self._cmd_lsmod),
-      BotCmd("ping",callee=self._cmd_ping)
+      BotCmd("ping",callee=self._cmd_ping),
+      BotCmd("stats",callee=self._cmd_stats),
+      BotCmd("reset_stats",callee=self._cmd_reset_stats),
+      BotCmd("multi",arg_types=(str,str),callee=self._cmd_multi,var_args=True)
     ]
     self.events = [
       BotEvent("bot","module",arg_types=(str,str),callee=self._event_bot_module),
-      BotEvent("bot","end_module",callee=self._event_bot_end_module)
+      BotEvent("bot","end_module",callee=self._event_bot_end_module),
+      BotEvent("bot","multi_reply",arg_types=(str,str),callee=self._event_bot_multi_reply,var_args=True),
+      BotEvent("bot","error",arg_types=(str,),callee=self._event_bot_error,var_args=True)
     ]
+    self._setup_dispatch()
 
   def _cmd_lsmod(self, sender):
     self._log("cmd: lsmod")
@@ -166,7 +238,146 @@ class Bot:
     self._reply(["bot.event", "end_module"], to=[sender])
 
   def _cmd_ping(self, sender):
-    self._reply(["bot.event", "pong"], to=[sender])
+    # do not delay pongs as peers measure our alive state with them
+    self._reply(["bot.event", "pong"], to=[sender], urgent=True)
+
+  def _cmd_stats(self, sender):
+    if self.stats is not None:
+      for kind, name, num, avg, p90, mx in self.stats.get_summary():
+        self._reply(["bot.event", "stats", kind, name, num,
+                     "%.3f" % avg, "%.3f" % p90, "%.3f" % mx], to=[sender])
+    self._reply(["bot.event", "end_stats"], to=[sender])
+
+  def _cmd_reset_stats(self, sender):
+    if self.stats is not None:
+      self.stats.reset()
+
+  def _cmd_multi(self, sender, args):
+    """run all command lines and send their replies to sender at once.
+       coroutine callees of AsyncBot reply later and are not collected
+    """
+    req_id = args[0]
+    old_capture = self.capture
+    replies = []
+    try:
+      for line in args[1:]:
+        msg = BotIOMsg(line, sender, [self.nick], False)
+        msg.ts = time.time()
+        msg.split_args()
+        mod_name = None
+        if len(msg.args) > 0:
+          mod_name = msg.args[0]
+        self.capture = (sender, replies, mod_name)
+        self._handle_msg(msg)
+    finally:
+      self.capture = old_capture
+    self._send(["bot.event", "multi_reply", req_id] + replies, to=[sender])
+
+  def _capture_line(self, line, to, mod=None):
+    """keep reply line for a running multi. return True if captured.
+       only events to the requester sent by the bot or the module of the
+       running command are replies. mod is the sending module or None
+    """
+    capture = self.capture
+    if to is None or len(to) != 1 or to[0] != capture[0]:
+      return False
+    if mod is not None and mod.get_name() != capture[2]:
+      return False
+    pos = line.find(' ')
+    if pos == -1 or not line[0:pos].endswith('.event'):
+      return False
+    capture[1].append(line)
+    return True
+
+  def _event_bot_multi_reply(self, sender, args):
+    req_id = args[0]
+    lines = args[1:]
+    # dispatch replies as if sent one by one
+    replies = []
+    for line in lines:
+      msg = BotIOMsg(line, sender, [self.nick], False)
+      msg.ts = time.time()
+      msg.split_args()
+      self._handle_msg(msg)
+      replies.append(msg.args)
+    req = self.requests.complete(sender, req_id)
+    if req is not None:
+      req.finish(replies)
+
+  def _event_bot_error(self, sender, args):
+    # a peer rejecting 'bot multi' fails its oldest request right away
+    if args[0].startswith("multi:"):
+      req = self.requests.complete_oldest(sender)
+      if req is not None:
+        self._log("bot: request failed", req, args[0])
+        req.finish(None)
+
+  def send_request(self, peer, cmds, callback, timeout=None):
+    """send a list of commands to peer in a single multi message.
+       callback(req) gets the combined replies. return the BotRequest
+    """
+    if timeout is None:
+      timeout = self.REQUEST_TIMEOUT
+    req = self.requests.add(peer, cmds, callback, timeout, time.time())
+    lines = [format_args(c) for c in cmds]
+    self._send(["bot", "multi", req.id] + lines, to=[peer])
+    if self.request_timer is None:
+      self.request_timer = self._add_timer(self.REQUEST_CHECK, self._expire_requests)
+    return req
+
+  def _expire_requests(self, ts):
+    for req in self.requests.expire(ts):
+      self._log("bot: request timeout", req)
+      req.finish(None)
+    # stop timer if nothing is pending
+    if len(self.requests) == 0:
+      self.request_timer = None
+      return False
+
+  def _gen_wakeup(self, m):
+    name = m.get_name()
+    def wakeup(ts):
+      stats = self.stats
+      if stats is not None:
+        b = time.time()
+        self._trigger_internal_event(BotEvent.WAKEUP, [ts], mods=[m])
+        stats.add('wakeup', name, time.time() - b)
+      else:
+        self._trigger_internal_event(BotEvent.WAKEUP, [ts], mods=[m])
+    return wakeup
+
+  def add_wakeup(self, fd, func):
+    """call func(ts) from the main loop whenever fd is readable.
+       func must consume the data of fd
+    """
+    self.wakeups[fd] = func
+
+  def remove_wakeup(self, fd):
+    del self.wakeups[fd]
+
+  def _handle_wakeups(self, fds):
+    ts = time.time()
+    for fd in fds:
+      func = self.wakeups.get(fd)
+      if func is not None:
+        func(ts)
+
+  def _add_timer(self, interval, func):
+    """call func(ts) every interval s until it returns False"""
+    return self.sched.add(self, interval, time.time(), func=func)
+
+  def _dump_stats(self, ts):
+    try:
+      self.stats.dump(self.stats_file)
+    except IOError as e:
+      self._log("bot: stats dump failed:", str(e))
+
+  def _check_cfg(self, ts):
+    if self.bio.get_cfg().check():
+      self._log("bot: config reloaded")
+
+  def _cfg_saved(self, ts):
+    self.bio.get_cfg().handle_saved()
 
   def _get_mod_set(self, sender):
     if sender in self.rem_mods:
@@ -207,33 +418,21 @@ class Bot:
     # report start
     self._trigger_internal_event(BotEvent.START)
 
-    tick_delta = self.bot_tick_interval
-
-    self.delta_range = [tick_delta, -tick_delta]
-    self.extra_range = [tick_delta, -tick_delta]
+    self._reset_ranges()
     self.show_ts = time.time()
 
     self.stay = True
-    extra = 0
     while self.stay:
       try:
-        # handle tick
-        b = time.time()
-        self._tick()
-        e = time.time()
-
-        # calc remaining time in interval to wait
-        delta = e - b
-        wait = tick_delta - delta - extra
-        if wait <= 0.01:
-          wait = 0.01
-
-        # handle incoming messages
-        real_wait = self._read_dispatch_msgs(wait)
-        extra = real_wait - wait
+        # wait for input until next tick is due
+        timeout = self.sched.get_timeout(time.time())
+        self._read_dispatch_msgs(timeout)
 
+        # handle due ticks
+        b = time.time()
+        late = self._tick()
         # internal (debug) accounting
-        self._account_delta(b, delta, extra)
+        self._account_delta(b, time.time() - b, late)
 
       except KeyboardInterrupt:
         self._log("bot: Break")
@@ -245,8 +444,16 @@ class Bot:
 
     # report stop
     self._trigger_internal_event(BotEvent.STOP)
+    self.bio.get_cfg().flush()
+    self.bio.flush()
+
+  def _reset_ranges(self):
+    tick_delta = self.bot_tick_interval
+    self.delta_range = [tick_delta, -tick_delta]
+    self.extra_range = [tick_delta, -tick_delta]
 
   def _account_delta(self, ts, delta, extra):
+    """record the duration of a tick round and its lateness"""
     if delta < self.delta_range[0]:
       self.delta_range[0] = delta
     if delta > self.delta_range[1]:
@@ -264,50 +471,127 @@ class Bot:
       emi = int(self.extra_range[0] * 1000)
       ema = int(self.extra_range[1] * 1000)
       self._log("dispatch delta:", dmi, dma, " extra:", emi, ema)
+      self._log_write_stats()
       self.show_ts = ts
       # reset ranges
-      tick_delta = self.bot_tick_interval
-      self.delta_range = [tick_delta, -tick_delta]
-      self.extra_range = [tick_delta, -tick_delta]
+      self._reset_ranges()
+
+  def _log_write_stats(self):
+    flushes, lines, size, last = self.bio.get_write_stats()
+    if flushes > 0:
+      self._log("output: flushes:", flushes, " lines:", lines, " bytes:", size,
+                " per flush:", "%.1f" % (lines / float(flushes)),
+                "%.1f" % (size / float(flushes)))
+      self.bio.reset_write_stats()
 
   def _read_dispatch_msgs(self, timeout):
-    start = time.time()
-    end = start + timeout
-    t = start
-    while t < end:
-      msg = self.bio.read_args(timeout=timeout)
-      if msg:
-        if msg.is_internal:
-          self._handle_internal_msg(msg)
-        else:
-          self._handle_msg(msg, self.modules)
-      tn = time.time()
-      delta = tn - t
-      t = tn
-      timeout -= delta
-      if timeout <= 0:
-        break
-    return t - start
+    """wait up to timeout (None: forever) for input and dispatch it"""
+    # fetch all pending messages as a batch
+    fds = list(self.wakeups) if self.wakeups else None
+    msgs = self.bio.read_msgs(timeout=timeout, fds=fds)
+    self._dispatch_msgs(msgs)
+    if fds is not None:
+      self._handle_wakeups(self.bio.get_ready_fds())
+    # write all replies of this batch at once
+    self.bio.flush()
+    if self.bio.is_eof():
+      self._log("bot: input closed")
+      self.stay = False
+
+  def _dispatch_msgs(self, msgs):
+    for msg in msgs:
+      if msg.is_internal:
+        self._handle_internal_msg(msg)
+      else:
+        self._handle_msg(msg)
 
   def _init_tick(self):
     ts = time.time()
+    self.sched = BotScheduler()
     for m in self.modules:
       m.last_ts = ts
+      tick = m.get_tick_interval()
+      if tick > 0:
+        self.sched.add(m, tick, ts, m.get_tick_policy())
+      else:
+        self.untick_mods.append(m)
+    if len(self.untick_mods) > 0:
+      self.recheck_timer = self.sched.add(self, self.TICK_RECHECK, ts,
+                                          func=self._recheck_ticks)
+    # periodic stats dump
+    if self.stats is not None and self.stats_file and self.stats_interval > 0:
+      self.sched.add(self, self.stats_interval, ts, func=self._dump_stats)
+    # config change watch: wake up on inotify events or poll
+    if self.cfg_watch > 0:
+      fd = self.bio.get_cfg().fileno()
+      if fd is not None:
+        self.add_wakeup(fd, self._check_cfg)
+      else:
+        self.sched.add(self, self.cfg_watch, ts, func=self._check_cfg)
+    # background saves of options are finished in the main loop
+    if self.save_delay > 0:
+      fd = self.bio.get_cfg().saved_fileno()
+      self.add_wakeup(fd, self._cfg_saved)
 
   def _tick(self):
-    """call tick in modules"""
+    """call tick in all modules that are due.
+       return how late the latest entry was
+    """
     ts = time.time()
-    for m in self.modules:
+    entries = self.sched.pop_due(ts)
+    if len(entries) == 0:
+      return 0
+    late = 0
+    stats = self.stats
+    for e in entries:
+      m = e.obj
+      if ts - e.due > late:
+        late = ts - e.due
+      # timer callback
+      if e.func is not None:
+        if e.func(ts) is not False:
+          self.sched.reschedule(e, ts)
+        continue
+      delta = ts - m.last_ts
+      if stats is not None:
+        name = m.get_name()
+        stats.add('late', name, ts - e.due)
+        b = time.time()
+        self._trigger_internal_event(BotEvent.TICK, [ts, delta], mods=[m])
+        stats.add('tick', name, time.time() - b)
+      else:
+        self._trigger_internal_event(BotEvent.TICK, [ts, delta], mods=[m])
+      m.last_ts = ts
+      # reschedule with current interval
       tick = m.get_tick_interval()
       if tick > 0:
-        delta = ts - m.last_ts
-        if delta >= tick:
-          #self._log("bot: do tick", m.name)
-          self._trigger_internal_event(BotEvent.TICK, [ts, delta], mods=[m])
-          m.last_ts = ts
+        self.sched.reschedule(e, ts, tick)
+      else:
+        self._untick(m)
+    self.bio.flush()
+    return late
+
+  def _untick(self, m):
+    """module has stopped ticking: poll its interval until it ticks again"""
+    self.untick_mods.append(m)
+    if self.recheck_timer is None:
+      self.recheck_timer = self._add_timer(self.TICK_RECHECK, self._recheck_ticks)
+
+  def _recheck_ticks(self, ts):
+    for m in list(self.untick_mods):
+      tick = m.get_tick_interval()
+      if tick > 0:
+        self.untick_mods.remove(m)
+        self.sched.add(m, tick, ts, m.get_tick_policy())
+    # stop timer if all modules tick
+    if len(self.untick_mods) == 0:
+      self.recheck_timer = None
+      return False
 
-  def _reply(self, args, to=None):
-    self.bio.write_args(args, receivers=to)
+  def _reply(self, args, to=None, urgent=False):
+    if self.capture is not None and self._capture_line(format_args(args), to):
+      return
+    self.bio.write_args(args, receivers=to, urgent=urgent)
 
   def _error(self, msg, to):
     self._reply(["bot.event", "error", msg], [to])
@@ -342,9 +626,49 @@ class Bot:
           self._trigger_internal_event(BotEvent.DISCONNECT)
       else:
         self._trigger_internal_event(BotEvent.PEER_DISCONNECT, [msg_nick])
+        for req in self.requests.drop_peer(msg_nick):
+          req.finish(None)
     return True
 
-  def _handle_msg(self, msg, modules):
+  def _setup_dispatch(self):
+    """build the lookup tables used to route messages and events"""
+    # (mod_name, cmd_name) -> (mod, BotCmd). mod is None for bot commands
+    self.cmd_index = {}
+    # mod_name -> mod
+    self.mod_index = {}
+    # (event_mod_name, event_name) -> [(mod, BotEvent), ...]
+    self.event_index = {}
+    # internal event name -> [(mod, callee), ...]
+    self.internal_index = {}
+    # (mod, internal event name) -> [callee, ...]
+    self.mod_internal_index = {}
+    int_mod_name = BotEvent.INTERNAL + ".event"
+    for cmd in self.cmds:
+      self.cmd_index.setdefault(('bot', cmd.get_name()), (None, cmd))
+    for mod in self.modules:
+      mod_name = mod.get_name()
+      self.mod_index.setdefault(mod_name, mod)
+      cmds = mod.get_commands()
+      if cmds is not None:
+        for cmd in cmds:
+          self.cmd_index.setdefault((mod_name, cmd.get_name()), (mod, cmd))
+      events = mod.get_events()
+      if events is not None:
+        for ev in events:
+          key = (ev.mod_name, ev.name)
+          self.event_index.setdefault(key, []).append((mod, ev))
+          if ev.mod_name == int_mod_name and ev.callee is not None:
+            self.internal_index.setdefault(ev.name, []).append((mod, ev.callee))
+            self.mod_internal_index.setdefault((mod, ev.name), []).append(ev.callee)
+    # bot events are checked after all module events
+    for ev in self.events:
+      key = (ev.mod_name, ev.name)
+      self.event_index.setdefault(key, []).append((None, ev))
+
+  def _handle_msg(self, msg, skip_mod=None):
+    """route a message to the matching command or events.
+       skip_mod is a module that will not see the message (its sender)
+    """
     # get command name
     a = msg.args
     n = len(a)
@@ -353,60 +677,77 @@ class Bot:
     if n < 2:
       self._error("huh?", to)
       return
-    # is it a bot command?
     mod_name = a[0]
     cmd_name = a[1]
+    # is it a bot command?
     if mod_name == 'bot':
-      # check internal command
-      for cmd in self.cmds:
-        if cmd_name == cmd.get_name():
-          res = cmd.handle_cmd(a[1:], msg.sender)
-          if type(res) is str:
-            self._error(cmd_name + ": " + res, to)
-            return res
-    # is it a module prefix
-    for mod in modules:
-      if mod_name == mod.get_name():
-        # parse module command
-        res = self._handle_mod_cmd(mod, a[1:], msg.sender)
+      entry = self.cmd_index.get(('bot', cmd_name))
+      if entry is not None:
+        if self.stats is not None:
+          b = self._stats_begin(msg, "bot." + cmd_name)
+        res = entry[1].handle_cmd(a[1:], msg.sender)
+        if self.stats is not None:
+          self.stats.add('cmd', "bot." + cmd_name, time.time() - b)
         if type(res) is str:
           self._error(cmd_name + ": " + res, to)
           return res
-      # is it an event?
-      res = self._handle_mod_event(mod.get_events(), a, to)
+    # is it a module prefix
+    mod = self.mod_index.get(mod_name)
+    if mod is not None and mod is not skip_mod:
+      # parse module command
+      if self.stats is not None:
+        name = mod_name + "." + cmd_name
+        b = self._stats_begin(msg, name)
+        res = self._handle_mod_cmd(mod, a[1:], msg.sender)
+        self.stats.add('cmd', name, time.time() - b)
+      else:
+        res = self._handle_mod_cmd(mod, a[1:], msg.sender)
       if type(res) is str:
         self._error(cmd_name + ": " + res, to)
         return res
-    # check for an bot event?
-    res = self._handle_mod_event(self.events, a, to)
-    if type(res) is str:
-      self._error(cmd_name + ": " + res, to)
-      return res
+    # is it an event?
+    entries = self.event_index.get((mod_name, cmd_name))
+    if entries is not None:
+      if self.stats is not None:
+        name = mod_name + "." + cmd_name
+        b = self._stats_begin(msg, name)
+      for mod, ev in entries:
+        if mod is not None and mod is skip_mod:
+          continue
+        res = ev.handle_event(a, to)
+        if type(res) is str:
+          self._error(ev.mod_name + " " + ev.name + ": " + res, to)
+          self._error(cmd_name + ": " + res, to)
+          return res
+      if self.stats is not None:
+        self.stats.add('event', name, time.time() - b)
     # unknown
     #self._error("Unknown command: " + cmd_name, to)
 
-  def _handle_mod_event(self, events, args, to):
-    """handle a module event"""
-    if len(args) < 1:
-      return False
-    # check events
-    if events is not None:
-      for ev in events:
-        if ev.mod_name == args[0] and ev.name == args[1]:
-            res = ev.handle_event(args, to)
-            if type(res) is str:
-              self._error(ev.mod_name + " " + ev.name + ": " + res, to)
-              return res
+  def _stats_begin(self, msg, name):
+    """account queueing latency of a message and return handler start"""
+    b = time.time()
+    if msg.ts is not None:
+      self.stats.add('queue', name, b - msg.ts)
+    return b
 
   def _handle_mod_cmd(self, mod, args, to):
     """handle a module command"""
     cmd_name = args[0]
     # check bot commands
-    cmds = mod.get_commands()
-    if cmds is not None:
-      for c in cmds:
-        if cmd_name == c.get_name():
-          return c.handle_cmd(args, to)
+    entry = self.cmd_index.get((mod.get_name(), cmd_name))
+    if entry is not None:
+      return entry[1].handle_cmd(args, to)
+    # state snapshot
+    if cmd_name == 'snapshot' and len(args) == 1:
+      snap = mod.get_snapshot()
+      if snap is not None:
+        a = [mod.get_name() + ".event", "snapshot"]
+        for key, value in snap:
+          a.append(key)
+          a.append(value)
+        self._send(a, to=[to], mod=mod)
+        return True
     # check options
     bo = mod.botopts
     if bo is not None:
@@ -418,19 +759,25 @@ class Bot:
 
   def _trigger_internal_event(self, name, args=None, mods=None):
     if mods is None:
-      mods = self.modules
-    for mod in mods:
-      events = mod.get_events()
-      if events is not None:
-        for ev in events:
-          if ev.mod_name == BotEvent.INTERNAL + ".event" and ev.name == name:
-            callee = ev.callee
-            if callee is not None:
-              if args is None:
-                callee()
-              else:
-                callee(*args)
-
+      entries = self.internal_index.get(name)
+      if entries is None:
+        return
+      callees = [e[1] for e in entries]
+    elif len(mods) == 1:
+      callees = self.mod_internal_index.get((mods[0], name))
+      if callees is None:
+        return
+    else:
+      callees = []
+      for mod in mods:
+        c = self.mod_internal_index.get((mod, name))
+        if c is not None:
+          callees += c
+    for callee in callees:
+      if args is None:
+        callee()
+      else:
+        callee(*args)
 
 # ----- test -----
 if __name__ == '__main__':
@@ -4,6 +4,11 @@ from __future__ import print_function
 
 class BotMod(object):
   """base class for bot modules"""
+
+  # catch-up policies for late ticks (see BotScheduler)
+  TICK_COALESCE = "coalesce"
+  TICK_SKIP = "skip"
+
   def __init__(self, name):
     self.name = name
     self.send = None
@@ -25,13 +30,27 @@ class BotMod(object):
     self.cfg = cfg
     self.botopts = botopts
 
-  def send_command(self, args, to=None):
-    self.send(args, to=to)
+  def send_command(self, args, to=None, urgent=False, callback=None, timeout=None):
+    """send a command. with callback it is sent as request to the single
+       peer in to and callback(req) gets its replies. return the request.
+       timeout None is Bot.REQUEST_TIMEOUT
+    """
+    if callback is not None:
+      self.log("send_command", args, "to=", to, "request")
+      return self.bot.send_request(to[0], [args], callback, timeout)
+    self.send(args, to=to, urgent=urgent)
     self.log("send_command", args, "to=", to)
 
-  def send_event(self, args, to=None):
+  def send_multi(self, peer, cmds, callback, timeout=None):
+    """send several commands to peer in one message. callback(req) gets
+       all replies at once. return the request
+    """
+    self.log("send_multi", cmds, "to=", peer)
+    return self.bot.send_request(peer, cmds, callback, timeout)
+
+  def send_event(self, args, to=None, urgent=False):
     a = [self.name + ".event"] + args
-    self.send(a, to=to)
+    self.send(a, to=to, urgent=urgent)
     self.log("send_event", a, "to=", to)
 
   def get_version(self):
@@ -54,10 +73,38 @@ class BotMod(object):
     """return the list of events"""
     return None
 
+  def get_snapshot(self):
+    """return a list of (key, value) with the full state of the module.
+       the bot then answers the 'snapshot' command with a single
+       '<name>.event snapshot <key> <value> ...' event. None disables it
+    """
+    return None
+
+  @staticmethod
+  def parse_snapshot(args):
+    """return dict of the key value args of a snapshot event"""
+    return dict(zip(args[0::2], args[1::2]))
+
   def get_tick_interval(self):
-    """return the interval in s the tick will be triggered. Use 0 for no tick"""
+    """return the interval in s the tick will be triggered. Use 0 for no tick.
+       polled after each tick. without tick it is polled every
+       Bot.TICK_RECHECK s
+    """
     return 0
 
+  def get_wakeup_fd(self):
+    """return a fd (e.g. of a BotWakeup) that wakes the bot when readable
+       or None. The bot then sends a WakeupEvent to the module
+    """
+    return None
+
+  def get_tick_policy(self):
+    """return how late ticks are handled:
+       TICK_COALESCE keeps the tick grid and merges missed ticks into one,
+       TICK_SKIP drops missed ticks and restarts the interval
+    """
+    return self.TICK_COALESCE
+
 
 # ----- test -----
 if __name__ == '__main__':
@@ -1,13 +1,89 @@
 from __future__ import print_function
 
+_true_strs = ('1','true','on')
+_false_strs = ('0','false','off')
+
+
+def _conv_bool(value):
+  if isinstance(value, str):
+    v = value.lower()
+    if v in _true_strs:
+      return True
+    elif v in _false_strs:
+      return False
+    raise ValueError(value)
+  return bool(value)
+
+
+def _conv_int(value):
+  if isinstance(value, bool):
+    raise ValueError(value)
+  if isinstance(value, float):
+    if not value.is_integer():
+      raise ValueError(value)
+  return int(value)
+
+
+def _conv_float(value):
+  if isinstance(value, bool):
+    raise ValueError(value)
+  return float(value)
+
+
+def _conv_str(value):
+  if not isinstance(value, str):
+    raise ValueError(value)
+  return value
+
+
+class enum(str):
+  """type of enum fields: the value is one of the strings in val_range"""
+  pass
+
+
 class BotOptField:
-  """hold a field of the bot options"""
+  """hold a field of the bot options
+
+     the converter and range check of the type are selected once, so
+     set() only calls them. Types are bool, int, float, str and enum.
+  """
+
+  converters = {
+    bool : _conv_bool,
+    int : _conv_int,
+    float : _conv_float,
+    str : _conv_str,
+    enum : _conv_str
+  }
+
+  types = {
+    'bool' : bool,
+    'int' : int,
+    'float' : float,
+    'str' : str,
+    'enum' : enum
+  }
+
   def __init__(self, name, typ, value, desc=None, val_range=None):
     self.name = name
     self.typ = typ
     self.value = value
     self.range = val_range
     self.desc = desc
+    # version of the option set at last change
+    self.version = 0
+    self._conv = self.converters[typ]
+    self._check = self._make_check(typ, val_range)
+
+  @staticmethod
+  def _make_check(typ, val_range):
+    if val_range is None:
+      return None
+    if typ is enum:
+      choices = frozenset(val_range)
+      return lambda value: value in choices
+    lo, hi = val_range
+    return lambda value: lo <= value <= hi
 
   @staticmethod
   def parse(args):
@@ -19,92 +95,69 @@ class BotOptField:
     # name
     name = args[0]
     # typ
-    typ_str = args[1]
-    if typ_str == 'bool':
-      typ = bool
-    elif typ_str == 'int':
-      typ = int
-    elif typ_str == 'str':
-      typ = str
-    else:
+    typ = BotOptField.types.get(args[1])
+    if typ is None:
       return None
+    conv = BotOptField.converters[typ]
     # value
     try:
-      value = args[2]
-      if typ == bool:
-        v = value.lower()
-        if v in ('1','true','on'):
-          value = True
-        elif v in ('0','false','off'):
-          value = False
-        else:
-          return None
-      else:
-        value = typ(value)
+      value = conv(args[2])
     except ValueError:
       return None
-    # optional range [min,max]
+    # optional range [min,max] or [choice,...]
+    val_range = None
+    desc = None
     if n > 3:
       o = 3
       if args[o][0] == '[':
-        nob = args[o][1:-1]
-        el = nob.split(',')
-        if len(el) != 2:
+        el = args[o][1:-1].split(',')
+        try:
+          val_range = [conv(e.strip()) for e in el]
+        except ValueError:
+          return None
+        if typ is not enum and len(val_range) != 2:
           return None
-        val_range = [typ(el[0]), typ(el[1])]
         o += 1
-      else:
-         val_range = None
       # desc
       if n > o:
         desc = " ".join(args[o:])
-      else:
-        desc = None
-    else:
-      val_range = None
-      desc = None
     return BotOptField(name, typ, value, val_range=val_range, desc=desc)
 
   def __str__(self):
-    res = [self.name, self.typ.__name__, str(self.value)]
+    res = [self.name, self.get_type_name(), str(self.value)]
     if self.range is not None:
-      res.append(str(self.range).replace(" ",""))
+      res.append(self.format_range())
     if self.desc is not None:
       res.append(self.desc)
     return " ".join(res)
 
+  def get_type_name(self):
+    return self.typ.__name__
+
+  def format_range(self):
+    """return range as '[min,max]' or '[choice,...]' or 'None'"""
+    if self.range is None:
+      return 'None'
+    return "[" + ",".join([str(v) for v in self.range]) + "]"
+
   def get(self):
     return self.value
 
+  def convert(self, value):
+    """return value converted to field type or None if invalid"""
+    try:
+      value = self._conv(value)
+    except (ValueError, TypeError):
+      return None
+    if self._check is not None and not self._check(value):
+      return None
+    return value
+
   def set(self, value):
-    # bool conversion
-    if self.typ is bool:
-      if isinstance(value, str):
-        v = value.lower()
-        if v in ('1','true','on'):
-          value = True
-        elif v in ('0','false','off'):
-          value = False
-        else:
-          return None
-      else:
-        value = bool(value)
-    # int conversion
-    elif self.typ is int:
-      if isinstance(value, str):
-        try:
-          value = int(value)
-        except ValueError:
-          return False
-    # auto convert to type
-    if not isinstance(value, self.typ):
+    """set value. return True if changed, None if same and False if invalid"""
+    value = self.convert(value)
+    if value is None:
       return False
-    # check range
-    if self.range is not None:
-      if value < self.range[0]:
-        return False
-      if value > self.range[1]:
-        return False
     # really changes value
     if self.value != value:
       self.value = value
@@ -141,4 +194,12 @@ if __name__ == '__main__':
   print("str=",bf3s)
   bf3c = BotOptField.parse(bf3s)
   print("par=",bf3c)
+  # float
+  bf4 = BotOptField("lvl", float, 1.5, val_range=[1,100], desc="a level")
+  print("obj=",bf4, BotOptField.parse(str(bf4)))
+  print(bf4.set("2.5"), bf4.set(2.5), bf4.set("0.5"), bf4)
+  # enum
+  bf5 = BotOptField("mode", enum, "rms", val_range=["rms","band"])
+  print("obj=",bf5, BotOptField.parse(str(bf5)))
+  print(bf5.set("band"), bf5.set("foo"), bf5)
 
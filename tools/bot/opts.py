@@ -1,13 +1,20 @@
 #!/usr/bin/env python
 from __future__ import print_function
 import sys
+import time
 
 from bot.cmd import BotCmd
 
 class BotOpts:
-  """serve a set of bot options"""
+  """serve a set of bot options
 
-  def __init__(self, reply, opts, cfg=None, cfg_name=None):
+     each change of a value bumps the version of the set and stores it
+     in the field. 'query_since <version> <epoch>' returns only the fields
+     changed after the version a client has seen. The epoch identifies
+     this instance, so clients of an earlier run get a full sync.
+  """
+
+  def __init__(self, reply, opts, cfg=None, cfg_name=None, save_delay=0):
     self.reply = reply
     self.opts = {}
     self.def_values = {}
@@ -15,8 +22,12 @@ class BotOpts:
       self.opts[o.name] = o
       self.def_values[o.name] = o.value
     self.notify = None
-    # set config
+    self.notify_many = None
+    self.version = 0
+    self.epoch = str(int(time.time() * 1000))
+    # set config. save_delay > 0 writes in background after delay
     self.cfg = cfg
+    self.save_delay = save_delay
     if cfg_name is None:
       self.cfg_name = "bot_opts"
     else:
@@ -28,12 +39,17 @@ class BotOpts:
       new_vals = cfg.get_section(self.cfg_name, vals)
       for key in new_vals:
         self.set_value(key, new_vals[key], do_reply=False)
+      # apply live changes of the config file
+      cfg.add_listener(self._cfg_changed)
     # setup commands
     self._setup_cmds()
 
-  def set_notifier(self, notify):
-    """set notifier callback. calls notifier(field)"""
+  def set_notifier(self, notify, notify_many=None):
+    """set notifier callback. calls notifier(field)
+       set_many() calls notify_many(fields) once if given
+    """
     self.notify = notify
+    self.notify_many = notify_many
 
   # ----- local change -----
 
@@ -48,6 +64,8 @@ class BotOpts:
     field = self.opts[name]
     ok = field.set(value)
     if ok == True:
+      self.version += 1
+      field.version = self.version
       # internal notifier
       if self.notify is not None and do_notify:
         self.notify(field)
@@ -63,6 +81,48 @@ class BotOpts:
     else:
       return False
 
+  def set_many(self, values, do_notify=True, do_reply=True, sender=None):
+    """internal set of several values given as list of (name, value)
+
+       all values are checked first. nothing is set if one is invalid.
+       return list of invalid names or None if all were set.
+    """
+    new_values = []
+    bad = []
+    for name, value in values:
+      field = self.opts.get(name)
+      v = None
+      if field is not None:
+        v = field.convert(value)
+      if v is None:
+        bad.append(name)
+      else:
+        new_values.append((field, v))
+    if len(bad) > 0:
+      return bad
+    # apply all with one version
+    changed = []
+    for field, value in new_values:
+      if field.set(value):
+        changed.append(field)
+    if len(changed) > 0:
+      self.version += 1
+      for field in changed:
+        field.version = self.version
+      if do_notify:
+        if self.notify_many is not None:
+          self.notify_many(changed)
+        elif self.notify is not None:
+          for field in changed:
+            self.notify(field)
+      if do_reply:
+        for field in changed:
+          self.push_value(field.name)
+    elif do_reply and sender is not None:
+      for field, value in new_values:
+        self.push_value(field.name, receivers=[sender])
+    return None
+
   def get_values(self):
     """return a dict with name : values"""
     res = {}
@@ -80,7 +140,7 @@ class BotOpts:
       if path is None:
         self._error("load? not_found")
         return False
-      self._status("loaded "+path)
+      self._status("loaded "+",".join(path))
       new_vals = self.cfg.get_section(self.cfg_name, self.get_values())
       for key in new_vals:
         if not self.set_value(key, new_vals[key]):
@@ -91,21 +151,35 @@ class BotOpts:
       self._error("load? no_cfg")
       return False
 
+  def _cfg_changed(self, name, values):
+    """config listener: take over changed values of own section"""
+    if name != self.cfg_name:
+      return
+    self.set_many(sorted(values.items()))
+
   def save(self):
     """save option values to config file"""
     if self.cfg is not None:
       self.cfg.set_section(self.cfg_name, self.get_values())
-      path = self.cfg.save()
+      if self.save_delay > 0:
+        path = self.cfg.save_later(self.save_delay, done=self._saved)
+      else:
+        path = self.cfg.save()
       if path is None:
         self._error("save? not_found")
         return False
       else:
-        self._status("saved "+path)
+        # a background save reports when written
+        if self.save_delay == 0:
+          self._saved(path)
         return True
     else:
       self._error("save? no_cfg")
       return False
 
+  def _saved(self, path):
+    self._status("saved "+path)
+
   def reset(self, key):
     """reset a key"""
     if key in self.def_values:
@@ -133,8 +207,8 @@ class BotOpts:
     line.append(value.name)
     line.append(value.value)
     if not short:
-      line.append(value.typ.__name__)
-      line.append(str(value.range))
+      line.append(value.get_type_name())
+      line.append(value.format_range())
       line.append(str(value.desc))
     self.reply(line, to=receivers)
 
@@ -142,11 +216,21 @@ class BotOpts:
     """send all values to bot"""
     for key in self.opts:
       self.push_value(key, receivers=receivers, short=short)
+    self._push_end(receivers, short)
+
+  def push_since(self, version, receivers=None):
+    """send values changed after the given version"""
+    for key in self.opts:
+      if self.opts[key].version > version:
+        self.push_value(key, receivers=receivers)
+    self._push_end(receivers, True)
+
+  def _push_end(self, receivers, short):
     if short:
       result = 'end_values'
     else:
       result = 'end_descs'
-    self.reply([result], to=receivers)
+    self.reply([result, self.version, self.epoch], to=receivers)
 
   # ----- parse bot command -----
 
@@ -154,7 +238,9 @@ class BotOpts:
     self.cmds = [
       BotCmd("query_all",callee=self._cmd_query_all),
       BotCmd("query",arg_types=(str,),callee=self._cmd_query),
+      BotCmd("query_since",arg_types=(int,str),callee=self._cmd_query_since),
       BotCmd("set",arg_types=(str,str),callee=self._cmd_set),
+      BotCmd("set_many",arg_types=(str,str),callee=self._cmd_set_many,var_args=True),
       BotCmd("load",callee=self._cmd_load),
       BotCmd("save",callee=self._cmd_save),
       BotCmd("reset_all",callee=self._cmd_reset_all),
@@ -164,6 +250,14 @@ class BotOpts:
   def _cmd_query_all(self, sender):
     self.push_all(receivers=[sender], short=False)
 
+  def _cmd_query_since(self, sender, args):
+    version, epoch = args
+    # other instance or future version: client needs all
+    if epoch != self.epoch or version > self.version:
+      self.push_all(receivers=[sender], short=False)
+    else:
+      self.push_since(version, receivers=[sender])
+
   def _cmd_query(self, sender, args):
     key = args[0]
     if key not in self.opts:
@@ -179,7 +273,16 @@ class BotOpts:
     if key not in self.opts:
       self._error("key? " + key, sender)
     elif not self.set_value(key, val, sender=sender):
-      self._error("set? " + key + " " + args[2], sender)
+      self._error("set? " + key + " " + val, sender)
+
+  def _cmd_set_many(self, sender, args):
+    if len(args) % 2 != 0:
+      self._error("set_many? args", sender)
+      return
+    pairs = list(zip(args[0::2], args[1::2]))
+    bad = self.set_many(pairs, sender=sender)
+    if bad is not None:
+      self._error("set_many? " + " ".join(bad), sender)
 
   def _cmd_load(self, sender):
     self.load()
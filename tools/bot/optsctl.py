@@ -6,15 +6,25 @@ import sys
 from bot.optfield import BotOptField
 
 class BotOptsCtl:
-  """a bot options client"""
+  """a bot options client
 
-  def __init__(self, botio, receiver):
+     the field descriptors of the first full sync are kept. After a
+     reconnect only the values changed since the last seen version are
+     requested. If name is given, commands are sent to the module of
+     this name and its '<name>.event' replies are parsed.
+  """
+
+  def __init__(self, botio, receiver, name=None):
     self.botio = botio
     self.opts = {}
     self.notify = None
     self.notify_all = None
     self.receiver = receiver
+    self.name = name
     self.got_all = False
+    # last seen version and epoch of the server
+    self.version = None
+    self.epoch = None
 
   def set_notifier(self, notify, notify_all):
     """set notifier callback. calls notifier(field)"""
@@ -25,7 +35,7 @@ class BotOptsCtl:
 
   def get_value(self, name):
     """get a cached value"""
-    if name in opts:
+    if name in self.opts:
       return self.opts[name].get()
     else:
       return None
@@ -48,6 +58,8 @@ class BotOptsCtl:
   # ----- query values -----
 
   def _send(self, *args):
+    if self.name is not None:
+      args = (self.name,) + args
     self.botio.write_args(args, receivers=[self.receiver])
 
   def query_value(self, key):
@@ -58,10 +70,19 @@ class BotOptsCtl:
     """send all values to bot"""
     self._send('query_all')
 
+  def query_since(self):
+    """request values changed since last sync or all if never synced"""
+    if self.version is None:
+      self.query_all()
+    else:
+      self._send('query_since', self.version, self.epoch)
+
   def flush_all(self):
     """remove all locally stored options"""
     self.opts = {}
     self.got_all = False
+    self.version = None
+    self.epoch = None
     if self.notify_all is not None:
       self.notify_all(self.opts.values())
 
@@ -90,10 +111,11 @@ class BotOptsCtl:
       # initial query
       if msg.int_nick == self.receiver:
         if msg.int_cmd == 'connected':
-          self.query_all()
+          self.query_since()
           return True
         elif msg.int_cmd == 'disconnected':
-          self.flush_all()
+          # keep fields but values are stale until next sync
+          self.got_all = False
           return True
       # ignore internal commands
       return False
@@ -102,17 +124,24 @@ class BotOptsCtl:
       return False
     # check args
     args = msg.args
+    if self.name is not None:
+      if len(args) == 0 or args[0] != self.name + ".event":
+        return False
+      args = args[1:]
     n = len(args)
     if n < 1:
       self._error("no_cmd?")
       return False
     cmd = args[0]
     # 'value'
-    if cmd == 'value' and n > 1:
-      return self._handle_value(args[1:])
-    # 'end_values'
-    elif cmd == 'end_values':
-      return self._handle_end_values()
+    if cmd == 'value' and n == 3:
+      return self._handle_value(args[1], args[2])
+    # 'desc'
+    elif cmd == 'desc' and n > 3:
+      return self._handle_desc(args[1:])
+    # 'end_values' and 'end_descs'
+    elif cmd in ('end_values', 'end_descs'):
+      return self._handle_end_values(args[1:])
     # ignore errors
     elif cmd in ('error', 'status'):
       pass
@@ -121,19 +150,44 @@ class BotOptsCtl:
       self._error("cmd? " + cmd)
       return False
 
-  def _handle_value(self, items):
-    # try to parse field
-    field = BotOptField.parse(items)
+  def _handle_value(self, name, value):
+    field = self.opts.get(name)
+    if field is None:
+      # unknown field: fetch schema again
+      self.query_all()
+      return True
+    if field.set(value) is False:
+      self._error("value? " + name)
+      return False
+    if self.notify is not None:
+      self.notify(field)
+    return True
+
+  def _handle_desc(self, items):
+    # 'desc <name> <value> <type> [range] [desc]'
+    name, value, typ = items[0:3]
+    rest = items[3:]
+    # no range is sent as 'None'
+    if len(rest) > 0 and rest[0] == 'None':
+      rest = rest[1:]
+    if len(rest) > 0 and rest[-1] == 'None':
+      rest = rest[:-1]
+    field = BotOptField.parse([name, typ, value] + rest)
     if field is None:
       self._error("field? " + " ".join(items))
       return False
-    else:
-      self.opts[field.name] = field
-      if self.notify is not None:
-        self.notify(field)
-      return True
+    self.opts[field.name] = field
+    if self.notify is not None:
+      self.notify(field)
+    return True
 
-  def _handle_end_values(self):
+  def _handle_end_values(self, args):
+    if len(args) == 2:
+      try:
+        self.version = int(args[0])
+        self.epoch = args[1]
+      except ValueError:
+        self.version = None
     self.got_all = True
     if self.notify_all is not None:
       self.notify_all(self.opts.values())
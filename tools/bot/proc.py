@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# run a bot process and talk to it via its stdin/stdout pipe
+
+from __future__ import print_function
+
+import os
+import time
+import logging
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+import subprocess
+import select
+import fcntl
+import threading
+
+from bot.io import BotIO, split_args, format_args
+from bot.frame import encode_frame, BotFrameDecoder
+
+class ProcRunner:
+  def __init__(self, cmd, framing=False):
+    self.cmd = cmd
+    self.in_queue = queue.Queue()
+    self.stop_flag = False
+    self.output = None
+    self.framing = framing
+    # orders a restart against put() of other threads and guards the
+    # wake pipe closed by end()
+    self.lock = threading.Lock()
+    # self-pipe to wake up process() when input is queued
+    self.wake_r, self.wake_w = os.pipe()
+    for fd in (self.wake_r, self.wake_w):
+      fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    self.proc = None
+    # due time of a scheduled restart after the process ended or None
+    self.restart_ts = None
+    self.start()
+
+  def start(self, lines=None):
+    """launch the process. input queued for a previous run is dropped.
+
+       lines are queued as first input before any line of put()
+    """
+    self.restart_ts = None
+    with self.lock:
+      try:
+        while True:
+          self.in_queue.get(False)
+      except queue.Empty:
+        pass
+      self._launch()
+      if lines:
+        for line in lines:
+          self.in_queue.put(line)
+    if lines:
+      self.wake()
+
+  def _launch(self):
+    self.proc = subprocess.Popen(self.cmd,stdout=subprocess.PIPE,stdin=subprocess.PIPE,bufsize=0)
+    self.start_ts = time.time()
+    self.old_data = b""
+    self.out_eof = False
+    # framing: offered in init and enabled by ack of process
+    self.out_frames = None
+    self.in_framed = False
+
+  def restart(self, lines=None):
+    """start the process again after it ended. see start() for lines"""
+    for f in (self.proc.stdin, self.proc.stdout):
+      try:
+        f.close()
+      except (IOError, OSError):
+        pass
+    self.start(lines)
+
+  def get_run_time(self):
+    """return seconds since the process was started"""
+    return time.time() - self.start_ts
+
+  def set_output(self, output):
+    self.output = output
+
+  def get_init_args(self, cmd_name, cfg_name, force_cfg_file):
+    """return args of the init message sent to the process"""
+    args = ["init", cmd_name, cfg_name, str(force_cfg_file)]
+    if self.framing:
+      args.append(",".join(BotIO.FRAMINGS))
+    return args
+
+  def is_framed(self):
+    return self.in_framed
+
+  def put(self, line):
+    """queue an input line. may be called from any thread"""
+    with self.lock:
+      self.in_queue.put(line)
+    self.wake()
+
+  def wake(self):
+    """let a waiting process() return immediately"""
+    with self.lock:
+      # other threads may still put() after end()
+      if self.wake_w is None:
+        return
+      try:
+        os.write(self.wake_w, b"x")
+      except OSError:
+        # pipe full: a wake up is pending anyway
+        pass
+
+  def process(self, timeout=0.1):
+    stdout = self.proc.stdout
+    stdin  = self.proc.stdin
+    # update return code
+    self.proc.poll()
+    ret = self.proc.returncode
+    if ret is not None:
+      return ret
+    # wait for output of process or queued input
+    rfds = [self.wake_r]
+    if not self.out_eof:
+      rfds.append(stdout)
+    if self.in_queue.empty():
+      (r,w,x) = select.select(rfds,[],[],timeout)
+    else:
+      (r,w,x) = select.select(rfds,[],[],0)
+    if self.wake_r in r:
+      self._drain_wake()
+    if stdout in r:
+      self._read_output(stdout, stdin)
+    # write all queued input at once
+    self._write_input(stdin)
+
+  def _drain_wake(self):
+    try:
+      while len(os.read(self.wake_r, 4096)) > 0:
+        pass
+    except OSError:
+      pass
+
+  def _read_output(self, stdout, stdin):
+    """read all available output and pass every complete line or frame"""
+    data = os.read(stdout.fileno(), BotIO.READ_SIZE)
+    if len(data) == 0:
+      self.out_eof = True
+      return
+    if self.out_frames is not None:
+      self._put_frames(data)
+      return
+    lines = (self.old_data + data).split(b"\n")
+    self.old_data = lines.pop()
+    for i in range(len(lines)):
+      line = lines[i].rstrip(b"\r").decode("utf-8", "replace")
+      if self.framing and line.strip() == BotIO.FRAMING_SWITCH:
+        self._enable_framing(stdin)
+        # rest of data is already framed
+        rest = b"\n".join(lines[i+1:] + [self.old_data])
+        self.old_data = b""
+        self._put_frames(rest)
+        return
+      self.output.put(line)
+
+  def _write_input(self, stdin):
+    buf = []
+    try:
+      while True:
+        line = self.in_queue.get(False)
+        if self.in_framed:
+          buf.append(self._encode_frame(line))
+        else:
+          buf.append((line + '\n').encode())
+    except queue.Empty:
+      pass
+    if len(buf) > 0:
+      data = b"".join(buf)
+      fd = stdin.fileno()
+      while len(data) > 0:
+        n = os.write(fd, data)
+        data = data[n:]
+
+  def _enable_framing(self, stdin):
+    """process acked framing: all further data is framed"""
+    logging.info("bot: framing enabled")
+    self.out_frames = BotFrameDecoder()
+    # tell process that our output is now framed, too
+    stdin.write((BotIO.FRAMING_SWITCH + "\n").encode())
+    self.in_framed = True
+
+  def _put_frames(self, data):
+    for sender, receivers, args in self.out_frames.feed(data):
+      line = format_args(args)
+      if receivers is not None:
+        line = ",".join(receivers) + "|" + line
+      self.output.put(line)
+
+  def _encode_frame(self, line):
+    # sender;receiver,receiver|args
+    pos = line.find(';')
+    sender = line[0:pos]
+    line = line[pos+1:]
+    pos = line.find('|')
+    receivers = None
+    if pos > 0:
+      receivers = line[0:pos].split(',')
+    return encode_frame(sender, receivers, split_args(line[pos+1:]))
+
+  def is_running(self):
+    self.proc.poll()
+    return self.proc.returncode is None
+
+  def end(self):
+    # an ended process waiting for its restart is already gone
+    if self.proc.poll() is None:
+      self.proc.terminate()
+    with self.lock:
+      os.close(self.wake_r)
+      os.close(self.wake_w)
+      self.wake_r = None
+      self.wake_w = None
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# correlate commands sent to a peer with its combined reply
+#
+# a request sends 'bot multi <id> "<cmd line>" ...' to a peer. The peer
+# runs all commands and collects the replies addressed to the requester
+# into a single 'bot.event multi_reply <id> "<reply line>" ...'.
+
+from __future__ import print_function
+
+
+class BotRequest:
+  """a request to a peer
+
+     callback(req) is called once when the reply arrived or the request
+     failed. replies is then the list of reply arg lists or None if the
+     request timed out or the peer went away.
+  """
+  def __init__(self, req_id, peer, cmds, callback, deadline):
+    self.id = req_id
+    self.peer = peer
+    self.cmds = cmds
+    self.callback = callback
+    self.deadline = deadline
+    self.done = False
+    self.replies = None
+
+  def __repr__(self):
+    return "[BotRequest:%s@%s]" % (self.id, self.peer)
+
+  def is_done(self):
+    return self.done
+
+  def get_replies(self):
+    return self.replies
+
+  def finish(self, replies):
+    self.done = True
+    self.replies = replies
+    if self.callback is not None:
+      self.callback(self)
+
+
+class BotRequests:
+  """keep the pending requests by id"""
+  def __init__(self):
+    self.next_id = 1
+    self.pending = {}
+
+  def __len__(self):
+    return len(self.pending)
+
+  def add(self, peer, cmds, callback, timeout, ts):
+    """create a new pending request"""
+    req_id = str(self.next_id)
+    self.next_id += 1
+    req = BotRequest(req_id, peer, cmds, callback, ts + timeout)
+    self.pending[req_id] = req
+    return req
+
+  def complete(self, peer, req_id):
+    """remove and return request of reply or None if unknown"""
+    req = self.pending.get(req_id)
+    if req is None or req.peer != peer:
+      return None
+    del self.pending[req_id]
+    return req
+
+  def complete_oldest(self, peer):
+    """remove and return the oldest request to peer or None"""
+    result = None
+    for r in self.pending.values():
+      if r.peer == peer and (result is None or int(r.id) < int(result.id)):
+        result = r
+    if result is not None:
+      del self.pending[result.id]
+    return result
+
+  def expire(self, ts):
+    """remove and return all requests with deadline before ts"""
+    result = [r for r in self.pending.values() if r.deadline <= ts]
+    for r in result:
+      del self.pending[r.id]
+    return result
+
+  def drop_peer(self, peer):
+    """remove and return all requests to peer"""
+    result = [r for r in self.pending.values() if r.peer == peer]
+    for r in result:
+      del self.pending[r.id]
+    return result
+
+
+# ----- test -----
+if __name__ == '__main__':
+  def done(req):
+    print("done", req, req.get_replies())
+  rs = BotRequests()
+  a = rs.add("a", [["audio", "query_state"]], done, 1, 0)
+  b = rs.add("b", [["audio", "query_state"]], done, 2, 0)
+  print(rs.complete("b", a.id))
+  rs.complete("a", a.id).finish([["audio.event", "state", "idle"]])
+  for r in rs.expire(2):
+    r.finish(None)
+  print(len(rs))
+  # a peer rejecting the multi fails its oldest request
+  c = rs.add("c", [["audio", "snapshot"]], done, 1, 0)
+  d = rs.add("c", [["audio", "snapshot"]], done, 1, 0)
+  print(rs.complete_oldest("c") is c, rs.complete_oldest("c") is d, len(rs))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# deadline based scheduler for periodic bot ticks
+
+from __future__ import print_function
+
+import heapq
+
+
+class BotSchedEntry:
+  """a periodic entry in the scheduler. func is an optional callback"""
+  def __init__(self, obj, interval, due, policy, func=None):
+    self.obj = obj
+    self.interval = interval
+    self.due = due
+    self.policy = policy
+    self.func = func
+
+
+class BotScheduler:
+  """keep the next due time of periodic entries in a heap"""
+
+  # catch-up policies for late ticks
+  # coalesce: stay on the fixed grid. missed ticks are merged into one
+  COALESCE = "coalesce"
+  # skip: drop missed ticks and restart the interval at the late tick
+  SKIP = "skip"
+
+  def __init__(self):
+    self.heap = []
+    self.seq = 0
+
+  def __len__(self):
+    return len(self.heap)
+
+  def _push(self, entry):
+    self.seq += 1
+    heapq.heappush(self.heap, (entry.due, self.seq, entry))
+
+  def add(self, obj, interval, ts, policy=COALESCE, func=None):
+    """add a periodic object with first due time ts + interval"""
+    entry = BotSchedEntry(obj, interval, ts + interval, policy, func)
+    self._push(entry)
+    return entry
+
+  def get_next_due(self):
+    """return time stamp of earliest due entry or None if empty"""
+    if len(self.heap) == 0:
+      return None
+    return self.heap[0][0]
+
+  def get_timeout(self, ts):
+    """return time to wait from ts until next due entry or None if empty"""
+    due = self.get_next_due()
+    if due is None:
+      return None
+    timeout = due - ts
+    if timeout < 0:
+      return 0
+    return timeout
+
+  def pop_due(self, ts):
+    """remove and return all entries that are due at ts"""
+    result = []
+    heap = self.heap
+    while len(heap) > 0 and heap[0][0] <= ts:
+      result.append(heapq.heappop(heap)[2])
+    return result
+
+  def reschedule(self, entry, ts, interval=None):
+    """schedule a popped entry again after it was handled at ts"""
+    if interval is not None:
+      entry.interval = interval
+    interval = entry.interval
+    if entry.policy == self.SKIP:
+      due = ts + interval
+    else:
+      due = entry.due + interval
+      if due <= ts:
+        # merge all missed ticks and stay on grid
+        missed = int((ts - entry.due) / interval)
+        due = entry.due + (missed + 1) * interval
+        if due <= ts:
+          due += interval
+    entry.due = due
+    self._push(entry)
+
+
+# ----- test -----
+if __name__ == '__main__':
+  s = BotScheduler()
+  s.add("fast", 0.25, 0)
+  s.add("slow", 1, 0)
+  s.add("late", 1, 0, BotScheduler.SKIP)
+  t = 0
+  while t < 3:
+    t = s.get_next_due()
+    # simulate a late wakeup
+    if t == 2:
+      t = 2.6
+    for e in s.pop_due(t):
+      print("%5.2f %-5s due=%5.2f late=%5.2f" % (t, e.obj, e.due, t - e.due))
+      s.reschedule(e, t)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# shape the outgoing lines of a bot before they become MUC stanzas
+
+from __future__ import print_function
+
+
+class BotShaperEntry:
+  def __init__(self, receivers, line, due, key=None):
+    self.receivers = receivers
+    self.line = line
+    self.due = due
+    self.key = key
+
+
+class BotShaper:
+  """coalesce, batch and rate limit outgoing bot lines
+
+     lines are given in the output format of a bot: 'recv,recv|args' or
+     'args'. Lines starting with one of the coalesce prefixes (after the
+     receivers) are held for the window and superseded by newer lines with
+     the same prefix and receivers. The newer line takes the place after
+     all lines put before it but keeps the due time of the held line.
+     All due lines are sent in order: runs
+     of consecutive lines with the same receivers are joined with newlines
+     into one stanza body of at most max_batch lines. A token bucket limits
+     the number of stanzas per second. Lines wait in the shaper while no
+     token is available and are batched even further.
+  """
+  def __init__(self, coalesce=None, window=0.5, batch=True, max_batch=16,
+               rate=0, burst=10):
+    if coalesce is None:
+      coalesce = []
+    self.coalesce = tuple(coalesce)
+    self.window = window
+    self.batch = batch
+    self.max_batch = max_batch
+    self.rate = rate
+    self.burst = burst
+    self.tokens = float(burst)
+    self.token_ts = None
+    self.entries = []
+    # key -> held entry
+    self.held = {}
+    # stats
+    self.num_lines = 0
+    self.num_coalesced = 0
+    self.num_stanzas = 0
+
+  def _get_key(self, receivers, args):
+    for prefix in self.coalesce:
+      if args.startswith(prefix):
+        if len(args) == len(prefix) or args[len(prefix)] == ' ':
+          return (receivers, prefix)
+    return None
+
+  def put(self, line, ts):
+    """add an output line of the bot"""
+    self.num_lines += 1
+    pos = line.find('|')
+    if pos == -1:
+      receivers = ""
+      args = line
+    else:
+      receivers = line[0:pos]
+      args = line[pos+1:]
+    key = self._get_key(receivers, args)
+    if key is not None:
+      entry = self.held.get(key)
+      if entry is not None:
+        # supersede held line. move it behind the lines put meanwhile
+        # so it can not overtake them
+        entry.line = line
+        self.entries.remove(entry)
+        self.entries.append(entry)
+        self.num_coalesced += 1
+        return
+      entry = BotShaperEntry(receivers, line, ts + self.window, key)
+      self.held[key] = entry
+    else:
+      entry = BotShaperEntry(receivers, line, ts)
+    self.entries.append(entry)
+
+  def _refill(self, ts):
+    if self.token_ts is not None:
+      self.tokens += (ts - self.token_ts) * self.rate
+      if self.tokens > self.burst:
+        self.tokens = float(self.burst)
+    self.token_ts = ts
+
+  def pop_stanzas(self, ts):
+    """return list of stanza bodies that can be sent now"""
+    if len(self.entries) == 0:
+      return []
+    if self.rate > 0:
+      self._refill(ts)
+    result = []
+    keep = []
+    cur = None
+    cur_rcv = None
+    for e in self.entries:
+      if e.due > ts:
+        keep.append(e)
+        continue
+      # append to current stanza?
+      if cur is not None and self.batch and e.receivers == cur_rcv \
+         and len(cur) < self.max_batch:
+        cur.append(e.line)
+      elif self.rate > 0 and self.tokens < 1.0:
+        # out of tokens: keep order of remaining lines
+        keep.append(e)
+        cur = None
+        continue
+      else:
+        cur = [e.line]
+        cur_rcv = e.receivers
+        result.append(cur)
+        if self.rate > 0:
+          self.tokens -= 1.0
+      if e.key is not None:
+        del self.held[e.key]
+    self.entries = keep
+    self.num_stanzas += len(result)
+    return ["\n".join(lines) for lines in result]
+
+  def get_timeout(self, ts):
+    """return seconds until pop_stanzas() has something to send or None"""
+    if len(self.entries) == 0:
+      return None
+    due = min([e.due for e in self.entries])
+    if self.rate > 0 and self.tokens < 1.0:
+      due = max(due, ts + (1.0 - self.tokens) / self.rate)
+    return max(0.0, due - ts)
+
+  def get_stats(self):
+    """return (lines, coalesced, stanzas)"""
+    return (self.num_lines, self.num_coalesced, self.num_stanzas)
+
+
+# ----- test -----
+if __name__ == '__main__':
+  s = BotShaper(coalesce=["audio.event level"], window=0.5, rate=2, burst=1)
+  ts = 0.0
+  for i in range(10):
+    s.put("audio.event level %d 0 0" % i, ts)
+    s.put("mon@pifon|audio.event state idle", ts)
+    s.put("mon@pifon|bot.event pong", ts)
+    print(ts, s.pop_stanzas(ts), s.get_timeout(ts))
+    ts += 0.1
+  while s.get_timeout(ts) is not None:
+    ts += s.get_timeout(ts)
+    print(ts, s.pop_stanzas(ts))
+  print(s.get_stats())
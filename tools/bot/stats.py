@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# timing statistics of the bot dispatcher
+
+from __future__ import print_function
+
+import time
+
+
+class BotHistogram:
+  """a histogram of durations with fixed buckets in ms"""
+
+  # upper bounds of the buckets in ms. last bucket is open
+  BOUNDS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+  def __init__(self):
+    self.buckets = [0] * (len(self.BOUNDS) + 1)
+    self.count = 0
+    self.sum = 0.0
+    self.max = 0.0
+
+  def add(self, ms):
+    self.count += 1
+    self.sum += ms
+    if ms > self.max:
+      self.max = ms
+    i = 0
+    for b in self.BOUNDS:
+      if ms < b:
+        break
+      i += 1
+    self.buckets[i] += 1
+
+  def get_avg(self):
+    if self.count == 0:
+      return 0.0
+    return self.sum / self.count
+
+  def get_percentile(self, p):
+    """estimate percentile p [0;100] as upper bound of its bucket"""
+    if self.count == 0:
+      return 0.0
+    want = self.count * p / 100.0
+    num = 0
+    n = len(self.BOUNDS)
+    for i in range(n):
+      num += self.buckets[i]
+      if num >= want:
+        return min(self.BOUNDS[i], self.max)
+    return self.max
+
+
+class BotStats:
+  """collect handler time, queueing latency and tick lateness
+
+     samples are keyed by a kind and a name:
+       'cmd' <mod>.<cmd>     execution time of command handlers
+       'event' <mod>.<ev>    execution time of event handlers
+       'queue' <mod>.<name>  time from receiving a message to handler start
+       'tick' <mod>          execution time of tick handlers
+       'late' <mod>          lateness of a tick against its deadline
+  """
+
+  KINDS = ('cmd', 'event', 'queue', 'tick', 'late')
+
+  def __init__(self):
+    self.hists = {}
+    self.start_ts = time.time()
+
+  def reset(self):
+    self.hists = {}
+    self.start_ts = time.time()
+
+  def add(self, kind, name, seconds):
+    key = (kind, name)
+    h = self.hists.get(key)
+    if h is None:
+      h = BotHistogram()
+      self.hists[key] = h
+    h.add(seconds * 1000.0)
+
+  def get_summary(self):
+    """return list of (kind, name, count, avg, p90, max) with times in ms"""
+    result = []
+    for key in sorted(self.hists):
+      h = self.hists[key]
+      result.append((key[0], key[1], h.count, h.get_avg(),
+                     h.get_percentile(90), h.max))
+    return result
+
+  def format_summary(self):
+    """return summary as list of lines"""
+    lines = []
+    for kind, name, num, avg, p90, mx in self.get_summary():
+      lines.append("%-5s %-32s n=%-7d avg=%8.3f p90=%8.3f max=%8.3f" % \
+        (kind, name, num, avg, p90, mx))
+    return lines
+
+  def dump(self, file_name):
+    """append a summary to the given file"""
+    ts = time.time()
+    with open(file_name, "a") as fh:
+      fh.write("# %s  period %.1fs\n" % \
+        (time.strftime("%d.%m.%Y %H:%M:%S", time.localtime(ts)),
+         ts - self.start_ts))
+      for line in self.format_summary():
+        fh.write(line + "\n")
+
+
+# ----- test -----
+if __name__ == '__main__':
+  import random
+  s = BotStats()
+  for i in range(1000):
+    s.add('cmd', 'audio.query_state', random.random() * 0.002)
+    s.add('late', 'audio', random.random() * 0.02)
+  for line in s.format_summary():
+    print(line)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# wake up the bot main loop from another thread
+#
+# a thread calls wake() after it produced new data. the bot waits for
+# fileno() together with its input and calls clear() before it handles
+# the data. only the first wake() after a clear() writes to the pipe.
+
+from __future__ import print_function
+
+import os
+import fcntl
+
+
+class BotWakeup:
+  """a self pipe to wake a select based loop"""
+  def __init__(self):
+    self.rfd, self.wfd = os.pipe()
+    for fd in (self.rfd, self.wfd):
+      flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+      fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    self.pending = False
+
+  def fileno(self):
+    return self.rfd
+
+  def wake(self):
+    """signal new data. called by the producer thread"""
+    if not self.pending:
+      self.pending = True
+      try:
+        os.write(self.wfd, b"!")
+      except OSError:
+        # pipe full: a wakeup is pending anyway
+        pass
+
+  def clear(self):
+    """reset before the new data is handled. called by the loop"""
+    self.pending = False
+    while True:
+      try:
+        data = os.read(self.rfd, 512)
+      except OSError:
+        break
+      if len(data) < 512:
+        break
+
+  def close(self):
+    os.close(self.rfd)
+    os.close(self.wfd)
+
+
+# ----- test -----
+if __name__ == '__main__':
+  import select
+  import threading
+  import time
+  w = BotWakeup()
+  def producer():
+    for i in range(3):
+      time.sleep(0.1)
+      w.wake()
+  t = threading.Thread(target=producer)
+  t0 = time.time()
+  t.start()
+  n = 0
+  while n < 3:
+    r, _, _ = select.select([w], [], [], 1)
+    if w.rfd in [x.fileno() for x in r]:
+      w.clear()
+      n += 1
+      print("woken after %.3f" % (time.time() - t0))
+  t.join()
+  w.close()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+  botbroker - route bot messages between local bots
+
+  bots started with localbot.py or xmppbot.py --broker attach to the
+  unix domain socket of the broker.
+"""
+
+from __future__ import print_function
+
+import sys
+import logging
+import argparse
+
+from bot.broker import BotBroker, DEFAULT_SOCKET
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="local broker for bots")
+  parser.add_argument('-s', '--socket', default=DEFAULT_SOCKET, help="path of unix domain socket")
+  parser.add_argument('-v', '--verbose', action='store_true', default=False, help="be more verbos")
+  parser.add_argument('-q', '--queue-size', type=int, default=1000, help="max lines pending for a client. slower clients are dropped")
+  return parser.parse_args()
+
+if __name__ == '__main__':
+  args = parse_args()
+  log = logging.ERROR
+  if args.verbose:
+    log = logging.INFO
+  logging.basicConfig(level=log, format='%(levelname)-8s %(message)s')
+  broker = BotBroker(args.socket, args.queue_size)
+  try:
+    broker.run()
+  except KeyboardInterrupt:
+    print("***Break",file=sys.stderr)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+  loadtest - measure the bot stack with many audio bots and monitors
+
+  starts a local broker as stand-in for the MUC, N pifon audio bots with
+  simulated recorder and levels and M monitor bots running test.LoadMod.
+  Each monitor counts the level events and pings every audio bot once
+  per second. At the end the round trip times and event rates of all
+  monitors are reported. The monitors are started after all audio bots
+  are up and report the time until they know the full state of each
+  audio bot (time to live). The level events of the audio bots carry their
+  send time, so the monitors also report the one way event latency.
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import time
+import socket
+import argparse
+import tempfile
+import shutil
+import signal
+import threading
+import subprocess
+import logging
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from bot.io import split_args
+from bot.broker import BotBroker, BrokerLink
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+FON_DIR = os.path.join(TOOLS_DIR, "..", "pifon", "fon")
+
+fon_cfg = """[modules]
+auto_load=audio.AudioMod
+
+[audio]
+sim=True
+trace=True
+update=%(update)d
+location=%(name)s
+listen_url=http://localhost:8000/%(name)s
+
+[vumeter]
+recorder=sim
+interval=%(interval)d
+stamp=True
+"""
+
+mon_cfg = """[modules]
+auto_load=test.LoadMod
+
+[load]
+query=%(query)s
+"""
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="load test of bots on a local broker")
+  parser.add_argument('-a', '--audios', type=int, default=4, help="number of audio bots")
+  parser.add_argument('-m', '--monitors', type=int, default=1, help="number of monitor bots")
+  parser.add_argument('-d', '--duration', type=float, default=10, help="measure period in seconds")
+  parser.add_argument('-w', '--warmup', type=float, default=3, help="wait before measuring in seconds")
+  parser.add_argument('-u', '--update', type=int, default=1, help="level update interval of audio bots [100ms]")
+  parser.add_argument('-i', '--interval', type=int, default=50, help="recorder interval of audio bots [ms]")
+  parser.add_argument('-p', '--python', default="python2", help="python used for the (python 2) audio bots")
+  parser.add_argument('-P', '--mon-python', default=sys.executable, help="python used for the monitor bots")
+  parser.add_argument('-F', '--framing', action='store_true', default=False, help="use framed pipes")
+  parser.add_argument('-b', '--blip', type=float, default=0, help="stop broker for given seconds after warmup and measure recovery")
+  parser.add_argument('-q', '--query', default='snapshot', choices=('snapshot', 'single'), help="how monitors get the state of audio bots")
+  parser.add_argument('-k', '--keep', action='store_true', default=False, help="keep temp dir with logs")
+  return parser.parse_args()
+
+def find_exe(name):
+  if os.path.dirname(name) != "":
+    return name
+  for path in os.environ.get("PATH", "").split(os.pathsep):
+    exe = os.path.join(path, name)
+    if os.access(exe, os.X_OK):
+      return exe
+  return None
+
+class Collector:
+  def __init__(self):
+    self.queue = queue.Queue()
+    self.num = 0
+
+  def put(self, line):
+    self.num += 1
+    self.queue.put(line)
+
+class LoadTest:
+  def __init__(self, args):
+    self.args = args
+    self.tmp_dir = tempfile.mkdtemp(prefix="loadtest")
+    self.sock = os.path.join(self.tmp_dir, "broker.sock")
+    self.broker = BotBroker(self.sock)
+    self.procs = []
+    self.host = socket.gethostname().split('.')[0]
+    self.nick = "loadtest@" + self.host
+    self.out = Collector()
+    self.link = BrokerLink(self.sock, self.nick)
+    self.link.set_output(self.out)
+
+  def _run_broker(self):
+    while self.broker.stay:
+      self.broker.process(0.1)
+
+  def _start_broker(self):
+    self.broker.stay = True
+    self.broker.open()
+    self.thread = threading.Thread(target=self._run_broker)
+    self.thread.start()
+
+  def _stop_broker(self):
+    self.broker.stop()
+    self.thread.join()
+    self.broker.close()
+
+  def _blip(self, nicks, seconds):
+    """stop the broker for a while. return time until all bots are back"""
+    self._stop_broker()
+    time.sleep(seconds)
+    self._start_broker()
+    t0 = time.time()
+    while not self.link.connect():
+      time.sleep(0.01)
+    pending = set(nicks)
+    if not self._wait_for(self._gen_connected(pending), 60):
+      print("bots did not reconnect:", sorted(pending), file=sys.stderr)
+      return None
+    return time.time() - t0
+
+  def _gen_connected(self, pending):
+    prefix = self.nick + ";|connected "
+    def connected(line):
+      if line.startswith(prefix):
+        pending.discard(line[len(prefix):])
+      return len(pending) == 0
+    return connected
+
+  def _start_bot(self, name, cfg_txt, python, mod_dir):
+    cfg_file = os.path.join(self.tmp_dir, name + ".cfg")
+    with open(cfg_file, "w") as fh:
+      fh.write(cfg_txt)
+    cmd = [sys.executable, os.path.join(TOOLS_DIR, "localbot.py"),
+           "-s", self.sock, "-n", name, "-c", cfg_file, "-C", name]
+    if self.args.framing:
+      cmd.append("-F")
+    cmd += [python, os.path.join(TOOLS_DIR, "runbot.py"), mod_dir]
+    log = open(os.path.join(self.tmp_dir, name + ".log"), "w")
+    p = subprocess.Popen(cmd, cwd=self.tmp_dir, stdout=log, stderr=log)
+    self.procs.append(p)
+    return name + "@" + self.host
+
+  def _wait_for(self, func, timeout):
+    """pass incoming lines to func until it returns True"""
+    end = time.time() + timeout
+    while True:
+      left = end - time.time()
+      if left <= 0:
+        return False
+      try:
+        line = self.out.queue.get(True, left)
+      except queue.Empty:
+        return False
+      if func(line):
+        return True
+
+  def _drain(self, timeout):
+    self._wait_for(lambda line: False, timeout)
+
+  def run(self):
+    args = self.args
+    python = find_exe(args.python)
+    if python is None:
+      print("python for audio bots not found:", args.python, file=sys.stderr)
+      return 1
+    self._start_broker()
+    try:
+      return self._run(python)
+    finally:
+      self.link.close()
+      # break localbot: it ends its bot process, too
+      for p in self.procs:
+        p.send_signal(signal.SIGINT)
+      for p in self.procs:
+        p.wait()
+      self._stop_broker()
+      if args.keep:
+        print("logs in", self.tmp_dir)
+      else:
+        shutil.rmtree(self.tmp_dir)
+
+  def _run(self, python):
+    args = self.args
+    if not self.link.connect():
+      print("can't attach to broker", file=sys.stderr)
+      return 1
+    # start audio bots
+    pending = set()
+    mons = []
+    for i in range(args.audios):
+      name = "fon%d" % i
+      cfg = fon_cfg % {'update' : args.update, 'interval' : args.interval,
+                       'name' : name}
+      pending.add(self._start_bot(name, cfg, python, FON_DIR))
+    nicks = list(pending)
+    if not self._wait_for(self._gen_connected(pending), 30):
+      print("audio bots did not connect:", sorted(pending), file=sys.stderr)
+      return 1
+
+    # then the monitors: they see all audio bots at once
+    cfg = mon_cfg % {'query' : args.query}
+    for i in range(args.monitors):
+      nick = self._start_bot("mon%d" % i, cfg, args.mon_python, TOOLS_DIR)
+      pending.add(nick)
+      mons.append(nick)
+    nicks += mons
+    if not self._wait_for(self._gen_connected(pending), 30):
+      print("monitors did not connect:", sorted(pending), file=sys.stderr)
+      return 1
+    print("%d audio bots, %d monitors connected" % (args.audios, args.monitors))
+    self._drain(args.warmup)
+
+    # broker outage
+    if args.blip > 0:
+      recover = self._blip(nicks, args.blip)
+      if recover is None:
+        return 1
+      print("broker down for %.1fs: all bots back after %.3fs" % (args.blip, recover))
+      self._drain(args.warmup)
+
+    # measure
+    self.link.put(",".join(mons) + "|load reset_stats")
+    self.out.num = 0
+    t0 = time.time()
+    self._drain(args.duration)
+    dt = time.time() - t0
+    total = self.out.num
+
+    # collect stats of monitors
+    stats = {}
+    def got_stats(line):
+      pos = line.find(';')
+      sender = line[0:pos]
+      body = line[line.find('|')+1:]
+      a = split_args(body)
+      if len(a) == 16 and a[0] == "load.event" and a[1] == "stats":
+        stats[sender] = a[2:]
+      return len(stats) == len(mons)
+    self.link.put(",".join(mons) + "|load query_stats")
+    if not self._wait_for(got_stats, 10):
+      print("missing stats of:", sorted(set(mons) - set(stats)), file=sys.stderr)
+
+    # report
+    want = args.audios * 10.0 / args.update
+    print("nominal level rate per monitor: %.1f/s" % want)
+    fmt = "%-16s %5s %8s %8s %6s %5s %9s %9s %9s %5s %9s %9s %9s %9s %9s"
+    print(fmt % \
+      ("monitor", "peers", "levels", "rate/s", "pings", "lost", "rtt avg",
+       "rtt p90", "rtt max", "live", "ttl avg", "ttl max", "lat avg",
+       "lat p90", "lat max"))
+    for m in mons:
+      if m in stats:
+        print(fmt % tuple([m] + stats[m]))
+    print("broker: %d msgs to harness in %.1fs = %.1f msgs/s" % (total, dt, total / dt))
+    return 0
+
+if __name__ == '__main__':
+  args = parse_args()
+  logging.basicConfig(level=logging.ERROR, format='%(levelname)-8s %(message)s')
+  sys.exit(LoadTest(args).run())
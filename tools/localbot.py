@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+  localbot - attach a process to a local bot broker
+
+  like xmppbot but messages are exchanged with other bots on the same
+  host via botbroker only. No chat server is needed.
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import logging
+import argparse
+import socket
+import time
+
+import bot.cfg
+from bot.proc import ProcRunner
+from bot.broker import BrokerLink, DEFAULT_SOCKET
+from bot.backoff import BotBackoff, BotReconnectStats
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="local bot for external programs")
+  parser.add_argument('cmd', nargs='+', help="command with optional arguments to launch")
+  parser.add_argument('-v', '--verbose', action='store_true', default=False, help="be more verbos")
+  parser.add_argument('-c', '--config-file', action='store', default=None, help="name of config file")
+  parser.add_argument('-C', '--config-name', action='store', default=None, help="name of program used for configuration")
+  parser.add_argument('-F', '--framing', action='store_true', default=False, help="offer length prefixed framing to process")
+  parser.add_argument('-s', '--socket', default=DEFAULT_SOCKET, help="path of broker socket")
+  parser.add_argument('-n', '--nick', default=None, help="set nick name")
+  return parser.parse_args()
+
+def get_cmd_name(cmd):
+  name = os.path.basename(cmd)
+  pos = name.rfind('.')
+  if pos > 0:
+    name = name[:pos]
+  return os.path.join(os.path.dirname(cmd), name)
+
+def get_nick(name):
+  # same nick as xmppbot
+  host = socket.gethostname()
+  pos = host.find('.')
+  if pos != -1:
+    host = host[0:pos]
+  return name + "@" + host
+
+if __name__ == '__main__':
+  args = parse_args()
+  cmd = args.cmd
+  cmd_name = get_cmd_name(cmd[0])
+
+  # load config for nick
+  cfg_name = args.config_name
+  if cfg_name is None:
+    cfg_name = cmd_name
+  force_cfg_file = args.config_file
+  bot_cfg = bot.cfg.BotCfg(cfg_name, force_cfg_file=force_cfg_file)
+  bot_cfg.load()
+  cfg = bot_cfg.get_section("xmppbot", {'nick' : None})
+  if args.nick is not None:
+    cfg['nick'] = args.nick
+  if cfg['nick'] is None:
+    print("config error: No 'nick' given!",file=sys.stderr)
+    sys.exit(1)
+  nick = get_nick(cfg['nick'])
+
+  log = logging.ERROR
+  if args.verbose:
+    log = logging.INFO
+  logging.basicConfig(level=log, format='%(levelname)-8s %(message)s')
+
+  if not os.path.exists(cmd[0]):
+    print("command not found:",cmd[0],file=sys.stderr)
+    sys.exit(2)
+
+  pr = ProcRunner(cmd, args.framing)
+  link = BrokerLink(args.socket, nick)
+  link.set_output(pr)
+  pr.set_output(link)
+
+  # init must be the first line of the process
+  init = pr.get_init_args(cmd_name, cfg_name, force_cfg_file)
+  pr.put("%s;|%s" % (nick, " ".join(init)))
+
+  # reconnect to broker with jittered backoff
+  backoff = BotBackoff(initial=0.05, maximum=5.0, jitter=0.3, reset_after=10.0)
+  stats = BotReconnectStats()
+  retry_ts = 0
+  connect_ts = 0
+  try:
+    while True:
+      ts = time.time()
+      if not link.is_connected() and ts >= retry_ts:
+        if link.connect():
+          delta = stats.restored(time.time())
+          connect_ts = time.time()
+          if delta is not None:
+            stats.dropped = link.num_dropped
+            print("Reconnected after %.3fs:" % delta, stats.format(),
+                  file=sys.stderr)
+        else:
+          stats.lost(ts)
+          retry_ts = ts + backoff.next_delay()
+      timeout = 0.1
+      if not link.is_connected():
+        timeout = max(0, min(timeout, retry_ts - time.time()))
+      ret = pr.process(timeout)
+      if ret is not None:
+        print("Process ended with ret=",ret,file=sys.stderr)
+        break
+      if not link.is_connected() and not stats.is_down():
+        print("Broker closed connection",file=sys.stderr)
+        stats.lost(time.time())
+        retry_ts = time.time() + backoff.next_delay(time.time() - connect_ts)
+  except KeyboardInterrupt:
+    print("***Break***",file=sys.stderr)
+
+  link.close()
+  if pr.is_running():
+    pr.end()
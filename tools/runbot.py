@@ -3,10 +3,18 @@
 import bot
 import sys
 
-# add arguments as paths
+# add arguments as paths. '--async' selects the asyncio runtime
+use_async = False
 for arg in sys.argv[1:]:
-  sys.path.append(arg)
+  if arg == '--async':
+    use_async = True
+  else:
+    sys.path.append(arg)
 
 # launch bot
-b = bot.Bot(True)
+if use_async:
+  from bot.aio import AsyncBot
+  b = AsyncBot(True)
+else:
+  b = bot.Bot(True)
 b.run()
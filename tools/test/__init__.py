@@ -1,2 +1,3 @@
 from test.testmod import TestMod
 from test.echomod import EchoMod
+from test.loadmod import LoadMod
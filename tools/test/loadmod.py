@@ -0,0 +1,127 @@
+from __future__ import print_function
+
+import time
+
+from bot import Bot, BotCmd, BotMod
+from bot.event import *
+from bot.stats import BotHistogram
+
+class LoadMod(BotMod):
+  """monitor stand-in for load tests
+
+     counts the audio level events of all audio peers and pings them
+     every tick to measure the round trip time through the bot stack.
+     The time from seeing an audio peer until its full state is known
+     (time to live) is measured with a snapshot request or with single
+     queries as set in [load] query. Simulated level events carry their
+     send time: the one way event latency is measured with it.
+  """
+
+  # single queries sent instead of a snapshot
+  single_queries = ('query_state', 'query_active',
+                    'query_listen_url', 'query_location')
+  def __init__(self):
+    BotMod.__init__(self, "load")
+    self.cmds = [
+      BotCmd("query_stats",callee=self.cmd_query_stats),
+      BotCmd("reset_stats",callee=self.cmd_reset_stats)
+    ]
+    self.events = [
+      PeerModListEvent(self.on_peer_modlist),
+      PeerDisconnectEvent(self.on_peer_disconnect),
+      BotEvent("audio", "level", arg_types=(int,int,int,float), var_args=True, callee=self.event_audio_level),
+      BotEvent("audio", "pong", callee=self.event_audio_pong),
+      TickEvent(self.on_tick)
+    ]
+    # peer -> ping send time or None
+    self.audios = {}
+    # peer -> [time seen, missing replies] until live. only the replies
+    # to our requests count, not state events broadcast meanwhile
+    self.pending = {}
+    self.ttl = BotHistogram()
+    self._reset()
+
+  def setup(self, send, log, cfg, botopts):
+    BotMod.setup(self, send, log, cfg, botopts)
+    load_cfg = cfg.get_section("load", {'query' : 'snapshot'})
+    self.query = load_cfg['query']
+
+  def _reset(self):
+    self.num_levels = 0
+    self.num_lost = 0
+    self.rtt = BotHistogram()
+    self.lat = BotHistogram()
+    self.start_ts = time.time()
+
+  def get_commands(self):
+    return self.cmds
+
+  def get_events(self):
+    return self.events
+
+  def get_tick_interval(self):
+    return 1
+
+  def on_peer_modlist(self, sender, modlist):
+    if 'audio' in modlist:
+      self.audios[sender] = None
+      if self.query == 'snapshot':
+        queries = ['snapshot']
+      else:
+        queries = self.single_queries
+      self.pending[sender] = [time.time(), len(queries)]
+      for q in queries:
+        self.send_command(["audio", q], to=[sender], callback=self._got_reply)
+
+  def _got_reply(self, req):
+    p = self.pending.get(req.peer)
+    if p is None:
+      return
+    # failed request: peer never becomes live
+    if req.get_replies() is None:
+      del self.pending[req.peer]
+      return
+    p[1] -= 1
+    if p[1] == 0:
+      self.ttl.add((time.time() - p[0]) * 1000.0)
+      del self.pending[req.peer]
+
+  def on_peer_disconnect(self, peer):
+    if peer in self.audios:
+      del self.audios[peer]
+    self.pending.pop(peer, None)
+
+  def event_audio_level(self, sender, args):
+    self.num_levels += 1
+    if len(args) > 3:
+      self.lat.add((time.time() - args[3]) * 1000.0)
+
+  def event_audio_pong(self, sender):
+    ts = self.audios.get(sender)
+    if ts is not None:
+      self.rtt.add((time.time() - ts) * 1000.0)
+      self.audios[sender] = None
+
+  def on_tick(self, ts, delta):
+    for peer in self.audios:
+      if self.audios[peer] is not None:
+        self.num_lost += 1
+      self.audios[peer] = time.time()
+      self.send_command(["audio", "ping"], to=[peer])
+
+  def cmd_query_stats(self, sender):
+    period = time.time() - self.start_ts
+    rate = self.num_levels / period
+    self.send_event(["stats", len(self.audios), self.num_levels,
+                     "%.1f" % rate, self.rtt.count, self.num_lost,
+                     "%.3f" % self.rtt.get_avg(),
+                     "%.3f" % self.rtt.get_percentile(90),
+                     "%.3f" % self.rtt.max, self.ttl.count,
+                     "%.3f" % self.ttl.get_avg(),
+                     "%.3f" % self.ttl.max,
+                     "%.3f" % self.lat.get_avg(),
+                     "%.3f" % self.lat.get_percentile(90),
+                     "%.3f" % self.lat.max], to=[sender])
+
+  def cmd_reset_stats(self, sender):
+    self._reset()
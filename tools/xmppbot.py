@@ -22,77 +22,75 @@ try:
   import queue
 except ImportError:
   import Queue as queue
-import subprocess
-import select
 import socket
 import traceback
 
 import bot.cfg
+from bot.proc import ProcRunner
+from bot.shaper import BotShaper
+from bot.broker import BrokerLink, BotRoster, get_receivers
+from bot.backoff import BotBackoff, BotReconnectStats
 
-# ----- ProcRunner -----
+# ----- XMPP Bot -----
 
-class ProcRunner:
-  def __init__(self, cmd):
-    self.cmd = cmd
-    self.in_queue = queue.Queue()
-    self.stop_flag = False
-    self.proc = subprocess.Popen(cmd,stdout=subprocess.PIPE,stdin=subprocess.PIPE,bufsize=0)
-    self.output = None
-    self.old_data = ""
+class MucRoster:
+  """nicks in the room. kept across sessions to report peers that left
+     while we were away"""
+  def __init__(self):
+    self.nicks = set()
+    self.lock = threading.Lock()
 
-  def set_output(self, output):
-    self.output = output
+  def add(self, nick):
+    with self.lock:
+      self.nicks.add(nick)
 
-  def put(self, line):
-    self.in_queue.put(line)
-
-  def process(self, timeout=0.1):
-    stdout = self.proc.stdout
-    stdin  = self.proc.stdin
-    # update return code
-    self.proc.poll()
-    ret = self.proc.returncode
-    if ret is not None:
-      return ret
-    # check for input/output
-    (r,w,x) = select.select([stdout],[],[],timeout)
-    if stdout in r:
-      # read data
-      data = stdout.readline()
-      line = data.decode()
-      self.output.put(line)
-    # something to write to stdout?
-    try:
-      line = self.in_queue.get(False)
-      line += '\n'
-      data = line.encode()
-      stdin.write(data)
-      stdin.flush()
-    except queue.Empty:
-      pass
+  def discard(self, nick):
+    with self.lock:
+      self.nicks.discard(nick)
 
-  def is_running(self):
-    self.proc.poll()
-    return self.proc.returncode is None
+  def get(self):
+    with self.lock:
+      return sorted(self.nicks)
 
-  def end(self):
-    self.proc.terminate()
+  def keep_only(self, nicks):
+    """remove and return the nicks not given"""
+    with self.lock:
+      gone = self.nicks - set(nicks)
+      self.nicks -= gone
+    return sorted(gone)
 
-# ----- XMPP Bot -----
 
 class ProcBot(sleekxmpp.ClientXMPP):
-  def __init__(self, jid, password, room, nick, filter_nick=True):
+  def __init__(self, jid, password, room, nick, filter_nick=True, shaper=None,
+               out_queue=None, stats=None, roster=None):
     sleekxmpp.ClientXMPP.__init__(self, jid, password)
 
     self.in_room = False
     self.room = room
     self.nick = nick
     self.filter_nick = filter_nick
-    self.queue = queue.Queue()
+    # lines put while not in room. may be bounded and kept across sessions
+    if out_queue is None:
+      out_queue = queue.Queue()
+    self.queue = out_queue
+    # BotReconnectStats updated when room is (re)joined
+    self.stats = stats
     self.is_stopped = False
+    # reconnects are done by main loop
+    self.auto_reconnect = False
+    # optional BotShaper for outgoing lines. guarded by lock
+    self.shaper = shaper
+    self.shaper_lock = threading.Lock()
+    # nicks in room. replayed to a restarted process
+    if roster is None:
+      roster = MucRoster()
+    self.roster = roster
+    # nicks seen online in this session
+    self.online = set()
 
     self.add_event_handler("session_start", self.start)
-    self.add_event_handler("session_stop", self.stop)
+    self.add_event_handler("session_end", self.stopped)
+    self.add_event_handler("disconnected", self.stopped)
     self.add_event_handler("groupchat_message", self.muc_message)
     self.add_event_handler("muc::%s::got_online" % self.room,
                            self.muc_online)
@@ -114,40 +112,60 @@ class ProcBot(sleekxmpp.ClientXMPP):
                                     # password=the_room_password,
                                     wait=True)
 
-  def stop(self, event):
+  def stopped(self, event):
+    # a dropped connection reports no muc_offline for us: queue lines
+    # until the room is joined again
+    with self.shaper_lock:
+      self.in_room = False
     self.is_stopped = True
 
   def muc_message(self, msg):
     got_nick = msg['mucnick']
-    body = msg['body']
     if got_nick != self.nick:
-      logging.info("bot: got nick=%s,line='%s'" % (got_nick, body))
-      # receiver[,receiver]|text
-      valid = not self.filter_nick
-      pos = body.find('|')
-      if pos != -1:
-        addrs = body[0:pos].split(',')
-        for addr in addrs:
-          # check addr
-          if addr == self.nick:
-            valid = True
-      else:
-        # no receiver
-        body = "|" + body
-        valid = True
-      # post message to stdout
-      if valid:
-        # prefix line with sender
-        body = got_nick + ';' + body
-        self.output.put(body)
+      # a shaped stanza may carry several lines
+      for body in msg['body'].split("\n"):
+        if body != "":
+          self.muc_line(got_nick, body)
+
+  def muc_line(self, got_nick, body):
+    logging.info("bot: got nick=%s,line='%s'" % (got_nick, body))
+    # receiver[,receiver]|text
+    valid = not self.filter_nick
+    pos = body.find('|')
+    if pos != -1:
+      addrs = body[0:pos].split(',')
+      for addr in addrs:
+        # check addr
+        if addr == self.nick:
+          valid = True
+    else:
+      # no receiver
+      body = "|" + body
+      valid = True
+    # post message to stdout
+    if valid:
+      # prefix line with sender
+      body = got_nick + ';' + body
+      self.output.put(body)
 
   def muc_online(self, presence):
     nick = presence['muc']['nick']
+    self.roster.add(nick)
+    self.online.add(nick)
     # write a 'connected' message to output
     self.send_internal("connected " + nick)
     if nick == self.nick:
       self.in_room = True
       logging.info("bot: enter room")
+      # our presence comes last: peers of the last session not seen now
+      # have left meanwhile
+      for gone in self.roster.keep_only(self.online):
+        self.send_internal("disconnected " + gone)
+      if self.stats is not None:
+        delta = self.stats.restored(time.time())
+        if delta is not None:
+          print("xmppbot: rejoined room after %.3fs:" % delta,
+                self.stats.format(), file=sys.stderr)
       # empty queue
       try:
         while True:
@@ -161,21 +179,140 @@ class ProcBot(sleekxmpp.ClientXMPP):
     if nick == self.nick:
       self.in_room = False
       logging.info("bot: left room")
+    self.roster.discard(nick)
+    self.online.discard(nick)
     # write a 'disconnected' message to output
     self.send_internal("disconnected " + nick)
 
   def put(self, msg):
     if self.in_room:
+      if self.shaper is not None:
+        with self.shaper_lock:
+          self.shaper.put(msg, time.time())
+        return
       logging.info("bot: put msg='%s'" % msg)
       self.send_message(mto=self.room, mbody=msg, mtype='groupchat')
     else:
       logging.info("bot: queue msg='%s'" % msg)
-      self.queue.put(msg)
+      self._queue_put(msg)
+
+  def _queue_put(self, msg):
+    # drop oldest line if queue is full
+    while True:
+      try:
+        self.queue.put(msg, False)
+        return
+      except queue.Full:
+        try:
+          self.queue.get(False)
+          if self.stats is not None:
+            self.stats.dropped += 1
+        except queue.Empty:
+          pass
+
+  def flush_shaper(self):
+    """send stanzas of the shaper that are due and return seconds until
+       the next one or None"""
+    if self.shaper is None:
+      return None
+    ts = time.time()
+    with self.shaper_lock:
+      # keep stanzas until the room is joined again
+      if not self.in_room:
+        return None
+      bodies = self.shaper.pop_stanzas(ts)
+      timeout = self.shaper.get_timeout(ts)
+    for body in bodies:
+      logging.info("bot: put msg='%s'" % body)
+      self.send_message(mto=self.room, mbody=body, mtype='groupchat')
+    return timeout
 
   def send_internal(self, msg):
     logging.info("bot: put internal msg='%s'" % msg)
     self.output.put("%s;|%s" % (self.nick, msg))
 
+  def get_roster(self):
+    return self.roster.get()
+
+# ----- Broker Bridge -----
+
+class BridgeSide:
+  """output of a transport feeding the bridge"""
+  def __init__(self, bridge, source):
+    self.bridge = bridge
+    self.source = source
+
+  def put(self, line):
+    self.bridge.put_input(line, self.source)
+
+class BrokerBridge:
+  """attach the process to a local broker and the MUC
+
+     local peers are reached via the broker only. Lines go to the MUC
+     only if they address a remote peer or a remote peer may see a line
+     without receivers. Lines of local senders received via MUC are
+     dropped and the rosters of both transports are merged.
+  """
+  def __init__(self, pr, link, nick):
+    self.pr = pr
+    self.link = link
+    self.nick = nick
+    self.bot = None
+    self.roster = BotRoster()
+    self.lock = threading.Lock()
+    self.local = BridgeSide(self, 'local')
+    self.remote = BridgeSide(self, 'remote')
+    link.set_output(self.local)
+
+  def set_bot(self, bot):
+    self.bot = bot
+
+  def get_roster(self):
+    with self.lock:
+      return sorted(self.roster.nicks)
+
+  def put(self, line):
+    """output line of process"""
+    self.link.put(line)
+    if self.bot is not None and self._needs_remote(line):
+      self.bot.put(line)
+
+  def _needs_remote(self, line):
+    with self.lock:
+      remote = self.roster.get_only('remote', self.nick)
+    if len(remote) == 0:
+      return False
+    receivers = get_receivers(line)
+    if receivers is None:
+      return True
+    for r in receivers:
+      if r in remote:
+        return True
+    return False
+
+  def put_input(self, line, source):
+    """input line for process received via broker or MUC"""
+    pos = line.find(';')
+    sender = line[0:pos]
+    # internal message: update roster
+    if sender == self.nick:
+      args = line[pos+2:].split(' ')
+      if len(args) == 2 and args[0] in ('connected', 'disconnected'):
+        with self.lock:
+          if args[0] == 'connected':
+            changed = self.roster.add(args[1], source)
+          else:
+            changed = self.roster.remove(args[1], source)
+        if not changed:
+          return
+    elif source == 'remote':
+      # already received via broker?
+      with self.lock:
+        is_local = self.roster.has(sender, 'local')
+      if is_local:
+        return
+    self.pr.put(line)
+
 # ----- main -----
 
 def parse_args():
@@ -186,6 +323,10 @@ def parse_args():
   parser.add_argument('-c', '--config-file', action='store', default=None, help="name of config file")
   parser.add_argument('-C', '--config-name', action='store', default=None, help="name of program used for configuration")
   parser.add_argument('-f', '--no-filter', action='store_false', default=True, help="disable nick name filter")
+  parser.add_argument('-F', '--framing', action='store_true', default=False, help="offer length prefixed framing to process")
+  parser.add_argument('-B', '--broker', default=None, help="attach to local broker socket and use XMPP for remote peers only")
+  parser.add_argument('-R', '--no-restart', action='store_true', default=False, help="end if process ends instead of restarting it")
+  parser.add_argument('-q', '--queue-size', type=int, default=1000, help="max lines kept while not in room. oldest are dropped")
   # overwrite config options
   parser.add_argument('-n', '--nick', default=None, help="set nick name")
   parser.add_argument('-p', '--password', default=None, help="set password")
@@ -195,6 +336,49 @@ def parse_args():
   args = parser.parse_args()
   return args
 
+def serve(pr, bot, roster, init_args, backoff, no_restart, end_ts=None):
+  """serve process and shaper until the XMPP session ends or until end_ts.
+     an ended process is restarted after a backoff delay. A restart still
+     waiting at end_ts is done by the next call.
+     return False if the process ended for good"""
+  while True:
+    ts = time.time()
+    if end_ts is None:
+      if bot.is_stopped:
+        return True
+    elif ts >= end_ts:
+      return True
+    timeout = bot.flush_shaper()
+    if timeout is None or timeout > 0.1:
+      timeout = 0.1
+    if end_ts is not None:
+      timeout = max(0, min(timeout, end_ts - ts))
+    # ended process waiting for its restart
+    if pr.restart_ts is not None:
+      if ts < pr.restart_ts:
+        time.sleep(min(timeout, pr.restart_ts - ts))
+        continue
+      restart_proc(pr, bot, roster, init_args)
+    ret = pr.process(timeout)
+    if ret is not None:
+      print("Process ended with ret=",ret,file=sys.stderr)
+      if no_restart:
+        return False
+      delay = backoff.next_delay(pr.get_run_time())
+      print("Restarting process in %.3fs" % delay,file=sys.stderr)
+      pr.restart_ts = time.time() + delay
+
+def restart_proc(pr, bot, roster, init_args):
+  """restart the ended process and bring it back in sync"""
+  # init and roster must reach the process before any room line
+  lines = ["%s;|%s" % (bot.nick, " ".join(init_args))]
+  # replay roster: own nick first
+  lines.append("%s;|connected %s" % (bot.nick, bot.nick))
+  for nick in roster.get_roster():
+    if nick != bot.nick:
+      lines.append("%s;|connected %s" % (bot.nick, nick))
+  pr.restart(lines)
+
 def get_cmd_name(cmd):
   name = os.path.basename(cmd)
   pos = name.rfind('.')
@@ -211,6 +395,28 @@ def_cfg = {
   'address' : None
 }
 
+# default 'shaper' config section: shaping of outgoing stanzas is opt-in
+def_shaper_cfg = {
+  'enable' : False,
+  # comma separated line prefixes where only the latest line is sent
+  'coalesce' : 'audio.event level',
+  'window' : 0.5,
+  'batch' : True,
+  'max_batch' : 16,
+  # stanzas per second. 0 is unlimited
+  'rate' : 0.0,
+  'burst' : 10
+}
+
+def create_shaper(cfg):
+  if not cfg['enable']:
+    return None
+  coalesce = []
+  if cfg['coalesce'] is not None:
+    coalesce = [x.strip() for x in cfg['coalesce'].split(',') if x.strip() != '']
+  return BotShaper(coalesce, cfg['window'], cfg['batch'], cfg['max_batch'],
+                   cfg['rate'], cfg['burst'])
+
 def overlay_cfg_args(cfg, args):
   for field in ('nick', 'password', 'jid', 'room', 'address'):
     val = getattr(args, field)
@@ -244,6 +450,7 @@ if __name__ == '__main__':
 
   # extract bot config
   cfg = bot_cfg.get_section("xmppbot", def_cfg)
+  shaper_cfg = bot_cfg.get_section("shaper", def_shaper_cfg)
 
   # overwrite config with arguments
   overlay_cfg_args(cfg, args)
@@ -272,7 +479,7 @@ if __name__ == '__main__':
   print("xmppbot config: ",cfg,file=sys.stderr)
 
   # setup proc bot
-  pr = ProcRunner(cmd)
+  pr = ProcRunner(cmd, args.framing)
 
   # setup nick
   host = socket.gethostname()
@@ -290,54 +497,93 @@ if __name__ == '__main__':
     addr = (addr, 5222)
   no_filter = args.no_filter
 
-  # main loop
-  stay = True
-  while stay:
-    try:
-      bot = ProcBot(jid, pw, room, nick, no_filter)
+  # local broker
+  bridge = None
+  if args.broker is not None:
+    bridge = BrokerBridge(pr, BrokerLink(args.broker, nick), nick)
+
+  # state kept across reconnects
+  proc_backoff = BotBackoff()
+  xmpp_backoff = BotBackoff(initial=1.0, maximum=60.0, jitter=0.3)
+  out_queue = queue.Queue(args.queue_size)
+  shaper = create_shaper(shaper_cfg)
+  xmpp_stats = BotReconnectStats()
+  muc_roster = MucRoster()
+
+  def make_bot():
+    """a new XMPP client for each session wired to the process"""
+    bot = ProcBot(jid, pw, room, nick, no_filter, shaper, out_queue, xmpp_stats,
+                  muc_roster)
+    if bridge is not None:
+      bot.set_output(bridge.remote)
+      bridge.set_bot(bot)
+      pr.set_output(bridge)
+    else:
       bot.set_output(pr)
       pr.set_output(bot)
+    return bot
 
-      # send init
-      bot.send_internal("init " + cmd_name + " " + cfg_name + " " + str(force_cfg_file))
-      pr.process()
+  # send init once. process stays across reconnects
+  bot = make_bot()
+  init_args = pr.get_init_args(cmd_name, cfg_name, force_cfg_file)
+  bot.send_internal(" ".join(init_args))
+  pr.process()
 
+  # attach to broker after init
+  if bridge is not None and not bridge.link.connect():
+    print("Unable to connect to broker:",args.broker,file=sys.stderr)
+
+  # main loop
+  stay = True
+  while stay:
+    if bridge is not None:
+      roster = bridge
+    else:
+      roster = bot
+    connect_ts = time.time()
+    connected = False
+    try:
       # connect bot
       logging.info("bot: connecting...")
       if bot.connect(address=addr):
+        connected = True
         bot.send_internal("connected "+nick)
         logging.info("bot: connected")
-        try:
-          bot.process(block=False)
-          # main loop
-          while stay:
-            ret = pr.process()
-            if ret is not None:
-              print("Process ended with ret=",ret,file=sys.stderr)
-              stay = False
-              break
-        # user wants to abort
-        except KeyboardInterrupt:
-          print("***Break***",file=sys.stderr)
-          stay = False
-        except Exception as e:
-          print("ERROR: ",e,file=sys.stderr)
-          # report to process
-          bot.send_internal("disconnected "+nick)
-          # retry...
+        bot.process(block=False)
+        stay = serve(pr, bot, roster, init_args, proc_backoff, args.no_restart)
       else:
         print("Unable to connect!",file=sys.stderr)
-        break
     except KeyboardInterrupt:
       print("***Break",file=sys.stderr)
-      break
+      stay = False
     except Exception as e:
       print("ERROR:",e,file=sys.stderr)
       traceback.print_exc(file=sys.stderr)
-      break
     finally:
       logging.info("bot: disconnect")
       bot.disconnect()
+      bot.stopped(None)
+    if not stay:
+      break
+    # wait before reconnect but keep serving the process
+    xmpp_stats.lost(time.time())
+    if connected:
+      bot.send_internal("disconnected "+nick)
+    delay = xmpp_backoff.next_delay(time.time() - connect_ts)
+    print("Reconnecting in %.1fs" % delay,file=sys.stderr)
+    try:
+      stay = serve(pr, bot, roster, init_args, proc_backoff, args.no_restart,
+                   time.time() + delay)
+    except KeyboardInterrupt:
+      print("***Break",file=sys.stderr)
+      stay = False
+    if stay:
+      bot = make_bot()
+
+  print("xmppbot:", xmpp_stats.format(), file=sys.stderr)
+
+  if bridge is not None:
+    bridge.link.close()
 
   # shutdown proc?
   if pr.is_running():
@@ -0,0 +1,120 @@
+# unittests for the xmppbot session handling. runs offline: no server
+# is contacted and sent stanzas are recorded
+
+import unittest
+import sys
+import time
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+try:
+  import sleekxmpp
+except ImportError:
+  raise unittest.SkipTest("sleekxmpp not installed")
+
+from xmppbot import ProcBot, MucRoster, serve
+from bot.proc import ProcRunner
+from bot.shaper import BotShaper
+from bot.backoff import BotBackoff
+
+
+class RecordBot(ProcBot):
+  def __init__(self, out_queue, shaper=None, roster=None):
+    ProcBot.__init__(self, "bot@localhost", "pw", "room@conf.localhost",
+                     "bot@host", shaper=shaper, out_queue=out_queue,
+                     roster=roster)
+    self.sent = []
+
+  def send_message(self, mto, mbody, mtype):
+    self.sent.extend(mbody.split("\n"))
+
+
+class NullOutput:
+  def put(self, line):
+    pass
+
+
+class ListOutput:
+  def __init__(self):
+    self.lines = []
+
+  def put(self, line):
+    self.lines.append(line)
+
+
+def presence(nick):
+  return {'muc' : {'nick' : nick}}
+
+
+# process printing some lines and then waiting for its input to end
+emit_cmd = [sys.executable, "-c",
+            "import sys\n"
+            "for i in range(5): print('line %d' % i)\n"
+            "sys.stdout.flush()\n"
+            "sys.stdin.read()\n"]
+
+
+class XmppBotTest(unittest.TestCase):
+  def _backoff_lines(self, shaper):
+    out_queue = queue.Queue()
+    old = RecordBot(out_queue, shaper)
+    old.set_output(NullOutput())
+    old.muc_online(presence(old.nick))
+    self.assertTrue(old.in_room)
+    old.put("first")
+    # connection dropped: no muc_offline for our nick
+    old.stopped(None)
+    # process output during the reconnect backoff goes to the old bot
+    pr = ProcRunner(emit_cmd)
+    pr.set_output(old)
+    try:
+      serve(pr, old, old, [], BotBackoff(), True, time.time() + 0.5)
+    finally:
+      pr.end()
+    # shaped lines wait for the rejoin, too
+    if shaper is None:
+      self.assertEqual(old.sent, ["first"])
+      first = []
+    else:
+      self.assertEqual(old.sent, [])
+      first = ["first"]
+    # rejoin with a new session
+    new = RecordBot(out_queue, shaper)
+    new.set_output(NullOutput())
+    new.muc_online(presence(new.nick))
+    end = time.time() + 2.0
+    lines = first + ["line %d" % i for i in range(5)]
+    while len(new.sent) < len(lines) and time.time() < end:
+      new.flush_shaper()
+      time.sleep(0.01)
+    self.assertEqual(new.sent, lines)
+
+  def test_backoff_queue(self):
+    self._backoff_lines(None)
+
+  def test_backoff_shaper(self):
+    self._backoff_lines(BotShaper(window=0.01, rate=0))
+
+  def test_rejoin_roster(self):
+    roster = MucRoster()
+    old = RecordBot(queue.Queue(), roster=roster)
+    old.set_output(NullOutput())
+    for nick in ("a@x", "b@y", old.nick):
+      old.muc_online(presence(nick))
+    old.stopped(None)
+    # b left while we were away
+    new = RecordBot(queue.Queue(), roster=roster)
+    out = ListOutput()
+    new.set_output(out)
+    for nick in ("a@x", "c@z", new.nick):
+      new.muc_online(presence(nick))
+    self.assertIn("bot@host;|disconnected b@y", out.lines)
+    self.assertNotIn("bot@host;|disconnected a@x", out.lines)
+    self.assertEqual(new.get_roster(), ["a@x", "bot@host", "c@z"])
+
+
+if __name__ == '__main__':
+  unittest.main()